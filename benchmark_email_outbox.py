@@ -0,0 +1,144 @@
+"""
+Benchmark bulk onboarding emails through the outbox against a local stub SMTP server.
+The stub accepts plain SMTP on localhost and waits a configurable time when a
+connection opens, standing in for the TLS handshake and login of a real server.
+Compares one connection per email (the old synchronous send) with the outbox,
+which returns immediately to the page and sends the batch over one connection.
+A second run refuses the first connection to exercise retry with backoff.
+
+Usage: python benchmark_email_outbox.py [emails] [connect_delay_seconds]
+"""
+
+import sys
+import time
+import smtplib
+import tempfile
+import threading
+import socketserver
+from email.mime.text import MIMEText
+
+from utils import email_outbox as outbox_module
+from utils.email_outbox import EmailOutbox
+
+class StubSMTPHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP server: accepts every message and records its recipients"""
+    
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+    
+    def handle(self):
+        server = self.server
+        if server.refuse_connections > 0:
+            server.refuse_connections -= 1
+            self.reply("421 Service not available")
+            return
+        server.connections += 1
+        time.sleep(server.connect_delay)
+        self.reply("220 stub ESMTP")
+        recipients = []
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in ("EHLO", "HELO"):
+                self.reply("250 stub")
+            elif command == "MAIL":
+                recipients = []
+                self.reply("250 OK")
+            elif command == "RCPT":
+                recipients.append(line.split(":", 1)[1].strip(" <>"))
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                server.delivered.extend(recipients)
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+class StubSMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    
+    def __init__(self, connect_delay):
+        super().__init__(("127.0.0.1", 0), StubSMTPHandler)
+        self.connect_delay = connect_delay
+        self.refuse_connections = 0
+        self.connections = 0
+        self.delivered = []
+
+def stub_config(server):
+    return {
+        "sender_email": "cpms@example.com",
+        "sender_password": "",
+        "smtp_server": "127.0.0.1",
+        "smtp_port": server.server_address[1],
+        "use_tls": False
+    }
+
+def send_synchronously(config, recipients):
+    """One SMTP connection per email, as the admin page used to do"""
+    for recipient in recipients:
+        msg = MIMEText("Your CPMS account has been created.", 'plain')
+        msg['Subject'] = "CPMS Account Created - Login Credentials"
+        server = smtplib.SMTP(config["smtp_server"], config["smtp_port"])
+        server.sendmail(config["sender_email"], [recipient], msg.as_string())
+        server.quit()
+
+def wait_until_sent(outbox, count, timeout=60):
+    deadline = time.time() + timeout
+    while outbox.status_counts()["sent"] < count and time.time() < deadline:
+        time.sleep(0.01)
+
+def main():
+    emails = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    connect_delay = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    recipients = [f"encoder{number}@example.com" for number in range(emails)]
+    
+    server = StubSMTPServer(connect_delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config = stub_config(server)
+    print(f"{emails} account emails, {connect_delay}s per SMTP connection")
+    
+    started = time.perf_counter()
+    send_synchronously(config, recipients)
+    print(f"  synchronous: {time.perf_counter() - started:.2f}s blocking the page, {server.connections} connections")
+    
+    with tempfile.TemporaryDirectory() as data_dir:
+        server.connections = 0
+        server.delivered.clear()
+        outbox = EmailOutbox(f"{data_dir}/email_outbox.json", config)
+        started = time.perf_counter()
+        for recipient in recipients:
+            outbox.enqueue(recipient, "CPMS Account Created - Login Credentials", "Your CPMS account has been created.")
+        queued = time.perf_counter() - started
+        wait_until_sent(outbox, emails)
+        print(f"  outbox:      {queued:.2f}s blocking the page, all sent after {time.perf_counter() - started:.2f}s, "
+              f"{server.connections} connections, {len(set(server.delivered))} delivered")
+    
+    with tempfile.TemporaryDirectory() as data_dir:
+        server.connections = 0
+        server.delivered.clear()
+        server.refuse_connections = 1
+        outbox_module.RETRY_BACKOFF = 0.5
+        outbox = EmailOutbox(f"{data_dir}/email_outbox.json", config)
+        started = time.perf_counter()
+        for recipient in recipients[:5]:
+            outbox.enqueue(recipient, "CPMS Account Created - Login Credentials", "Your CPMS account has been created.")
+        # The sender sleeps until its next check once a batch fails
+        time.sleep(1)
+        outbox.process_outbox()
+        counts = outbox.status_counts()
+        attempts = max(message["attempts"] for message in outbox.list_messages())
+        print(f"  retry:       first connection refused, {counts['sent']} of 5 sent after "
+              f"{time.perf_counter() - started:.2f}s ({attempts} failed attempt per email)")
+    
+    server.shutdown()
+
+if __name__ == "__main__":
+    main()
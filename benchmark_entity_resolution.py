@@ -0,0 +1,139 @@
+"""
+Benchmark cross-encoder entity resolution on synthetic data.
+Generates encoders whose Client and Business sheets share a pool of real clients
+and businesses (with typos, missing middle names and reformatted numbers in the
+copies), runs the resolution job and reports its speed and pairwise precision/recall.
+
+Usage: python benchmark_entity_resolution.py [encoders] [clients_per_encoder] [workers]
+"""
+
+import sys
+import random
+import tempfile
+from itertools import combinations
+
+from utils.data_manager import JSONStorageBackend
+from utils.entity_resolution import resolve_entities
+
+FIRST_NAMES = ["Juan", "Maria", "Jose", "Ana", "Pedro", "Rosa", "Carlos", "Elena", "Miguel", "Liza",
+               "Ramon", "Grace", "Antonio", "Joy", "Roberto", "Cristina", "Mark", "Jenny", "Paolo", "Aileen"]
+LAST_NAMES = ["Dela Cruz", "Santos", "Reyes", "Garcia", "Mendoza", "Bautista", "Villanueva", "Ramos",
+              "Castillo", "Flores", "Aquino", "Navarro", "Torres", "Gonzales", "Lopez", "Rivera",
+              "Fernandez", "Pascual", "Domingo", "Salazar", "Mercado", "Soriano", "Tolentino", "Manalo"]
+BUSINESS_WORDS = ["Sari-Sari", "Bakery", "Trading", "Enterprises", "Crafts", "Food Products", "Farm",
+                  "Kakanin", "Furniture", "Tailoring", "Water Refilling", "Printing", "Eatery", "Weaving"]
+
+CLIENT_COLUMNS = ["No", "Client ID", "First Name", "Middle Name", "Last Name", "Birthdate (MM/DD/YYYY)",
+                  "Birth Year", "Mobile Number", "Email Address"]
+PROFILE_COLUMNS = ["No", "Year Established", "Form of Organization", "Remarks"]
+REGISTRATION_COLUMNS = ["No", "Name of Business", "BIR (TIN) No."]
+CONTACT_COLUMNS = ["No", "Business Company Name", "Mobile Number", "Email Address"]
+
+def typo(text, rng):
+    """Drop, swap or double one letter"""
+    if len(text) < 4:
+        return text
+    i = rng.randrange(1, len(text) - 1)
+    change = rng.randrange(3)
+    if change == 0:
+        return text[:i] + text[i + 1:]
+    if change == 1:
+        return text[:i] + text[i + 1] + text[i] + text[i + 2:]
+    return text[:i] + text[i] + text[i:]
+
+def make_people(count, rng):
+    people = []
+    for person in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        year = rng.randrange(1950, 2004)
+        people.append({
+            "first": first, "middle": rng.choice(LAST_NAMES), "last": last,
+            "birthdate": f"{rng.randrange(1, 13):02d}/{rng.randrange(1, 29):02d}/{year}", "year": str(year),
+            "mobile": f"09{rng.randrange(10**9):09d}",
+            "email": f"{first}.{last}{person}@example.com".lower().replace(" ", ""),
+            "business": f"{last} {rng.choice(BUSINESS_WORDS)} {person}",
+            "tin": f"{rng.randrange(10**9):09d}000"
+        })
+    return people
+
+def client_row(no, person, rng, copy):
+    first, middle, last, mobile = person["first"], person["middle"], person["last"], person["mobile"]
+    if copy:
+        # Copies encoded by another encoder differ a little from the original
+        if rng.random() < 0.3:
+            first = typo(first, rng)
+        if rng.random() < 0.3:
+            middle = ""
+        if rng.random() < 0.3:
+            mobile = "+63 " + mobile[1:4] + " " + mobile[4:7] + " " + mobile[7:]
+    return [str(no), f"C{no:06d}", first, middle, last, person["birthdate"], person["year"], mobile,
+            person["email"] if rng.random() < 0.7 else ""]
+
+def generate(data_dir, encoders, clients_per_encoder, rng):
+    """Write synthetic sheets and return {(kind, encoder, row): entity id}"""
+    people = make_people(encoders * clients_per_encoder, rng)
+    backend = JSONStorageBackend(data_dir)
+    truth = {}
+    for encoder in range(encoders):
+        username = f"encoder{encoder:03d}"
+        clients, profiles, registrations, contacts = [], [], [], []
+        for no in range(1, clients_per_encoder + 1):
+            # About one in five records is a client another encoder also has
+            copy = rng.random() < 0.2
+            person_id = rng.randrange(len(people)) if copy else encoder * clients_per_encoder + no - 1
+            person = people[person_id]
+            clients.append(client_row(no, person, rng, copy))
+            truth[("client", username, no)] = person_id
+            
+            business = typo(person["business"], rng) if copy and rng.random() < 0.3 else person["business"]
+            profiles.append([str(no), str(rng.randrange(1990, 2024)), "Sole Proprietorship", ""])
+            registrations.append([str(no), business, person["tin"] if rng.random() < 0.8 else ""])
+            contacts.append([str(no), business, person["mobile"], ""])
+            truth[("business", username, no)] = person_id
+        
+        backend.save_sheet(username, "Client", clients, CLIENT_COLUMNS, "")
+        backend.save_sheet(username, "Business Profile", profiles, PROFILE_COLUMNS, "")
+        backend.save_sheet(username, "Business Registrations", registrations, REGISTRATION_COLUMNS, "")
+        backend.save_sheet(username, "Business Contact Information", contacts, CONTACT_COLUMNS, "")
+    return truth
+
+def pairs_of(groups):
+    pairs = set()
+    for members in groups:
+        pairs.update(combinations(sorted(members), 2))
+    return pairs
+
+def main():
+    encoders = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    clients_per_encoder = int(sys.argv[2]) if len(sys.argv) > 2 else 2500
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    rng = random.Random(42)
+    
+    with tempfile.TemporaryDirectory() as data_dir:
+        truth = generate(data_dir, encoders, clients_per_encoder, rng)
+        result = resolve_entities(data_dir, backend_name="json", workers=workers)
+    
+    stats = result["stats"]
+    print(f"{encoders} encoders x {clients_per_encoder} clients: {stats['records']} records")
+    print(f"  {stats['blocks']} blocks, {stats['candidate_pairs']} candidate pairs, {stats['skipped_blocks']} oversized blocks skipped")
+    print(f"  load {stats['load_seconds']}s, score {stats['score_seconds']}s, total {stats['total_seconds']}s")
+    
+    for kind in ("client", "business"):
+        found = pairs_of(
+            [(member["encoder"], member["row"]) for member in cluster["members"]]
+            for cluster in result["clusters"] if cluster["kind"] == kind
+        )
+        entities = {}
+        for (record_kind, username, row), entity in truth.items():
+            if record_kind == kind:
+                entities.setdefault(entity, []).append((username, row))
+        # Only pairs across encoders count; the job does not compare an encoder with itself
+        expected = {pair for pair in pairs_of(entities.values()) if pair[0][0] != pair[1][0]}
+        found = {pair for pair in found if pair[0][0] != pair[1][0]}
+        correct = len(found & expected)
+        precision = correct / len(found) if found else 1.0
+        recall = correct / len(expected) if expected else 1.0
+        print(f"  {kind:<8} {len(expected)} true pairs, precision {precision:.3f}, recall {recall:.3f}")
+
+if __name__ == "__main__":
+    main()
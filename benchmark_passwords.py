@@ -0,0 +1,43 @@
+"""
+Benchmark password verification throughput at several bcrypt cost factors.
+Simulates a burst of logins arriving on many Streamlit script threads at once and
+reports logins per second through the bounded hashing pool, next to the legacy
+SHA-256 check, to help pick CPMS_BCRYPT_ROUNDS for the deployment's CPUs.
+
+Usage: python benchmark_passwords.py [logins] [concurrent_sessions] [rounds ...]
+"""
+
+import sys
+import time
+import hashlib
+import concurrent.futures
+
+from utils import credentials
+
+def logins_per_second(stored_hash, logins, sessions):
+    """Verify the password `logins` times from `sessions` threads and return logins per second"""
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=sessions) as pool:
+        results = list(pool.map(lambda _: credentials.verify_password("benchmark-password", stored_hash), range(logins)))
+    elapsed = time.perf_counter() - started
+    assert all(results)
+    return logins / elapsed, elapsed
+
+def main():
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    sessions = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    rounds_list = [int(rounds) for rounds in sys.argv[3:]] or [10, 11, 12, 13]
+    
+    print(f"{logins} logins from {sessions} concurrent sessions, {credentials.HASH_WORKERS} hashing threads")
+    
+    legacy_hash = hashlib.sha256(b"benchmark-password").hexdigest()
+    rate, elapsed = logins_per_second(legacy_hash, logins, sessions)
+    print(f"  legacy sha256   {rate:10.1f} logins/s  ({elapsed * 1000:.1f} ms total)")
+    
+    for rounds in rounds_list:
+        stored_hash = credentials.hash_password("benchmark-password", rounds)
+        rate, elapsed = logins_per_second(stored_hash, logins, sessions)
+        print(f"  bcrypt cost {rounds:<3} {rate:10.1f} logins/s  ({elapsed * 1000 / logins:.1f} ms per login)")
+
+if __name__ == "__main__":
+    main()
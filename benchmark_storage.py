@@ -0,0 +1,76 @@
+"""
+Benchmark concurrent writers against the CPMS storage backends.
+Starts N writer processes that each append rows to the same user's sheet, then checks
+that every row made it to disk and reports throughput.
+
+Usage: python benchmark_storage.py [writers] [rows_per_writer]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+
+from utils.data_manager import JSONStorageBackend, JournaledStorageBackend, SQLiteStorageBackend
+from utils.file_storage import read_json
+from utils.user_directory import UserDirectory
+
+COLUMNS = ["No", "Client ID", "First Name", "Last Name", "Remarks"]
+
+def create_backend(backend_name, data_dir):
+    if backend_name == "sqlite":
+        return SQLiteStorageBackend(os.path.join(data_dir, "bench.db"))
+    if backend_name == "journal":
+        return JournaledStorageBackend(data_dir)
+    return JSONStorageBackend(data_dir)
+
+def write_rows(backend_name, data_dir, writer, rows):
+    """Append rows one save at a time, the way form submits do"""
+    backend = create_backend(backend_name, data_dir)
+    for i in range(rows):
+        row = [f"{writer}-{i}", f"C{writer:03d}{i:05d}", "Juan", "Dela Cruz", "x" * 40]
+        backend.save_rows("bench", "Client", COLUMNS, {}, [row], [], time.strftime("%Y-%m-%dT%H:%M:%S"))
+
+def count_users(users_file, writer, rows):
+    """Read-modify-write a shared users file through the user directory, as the pages do"""
+    directory = UserDirectory(users_file)
+    for i in range(rows):
+        with directory.locked_users() as users:
+            users[f"user{writer}_{i}"] = {"role": "encoder"}
+
+def run(target, args_for_writer, writers):
+    processes = [multiprocessing.Process(target=target, args=args_for_writer(writer)) for writer in range(writers)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    return time.perf_counter() - start
+
+def main():
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    rows = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    expected = writers * rows
+    print(f"{writers} writer processes x {rows} saves each")
+    
+    for backend_name in ("json", "journal", "sqlite"):
+        with tempfile.TemporaryDirectory() as data_dir:
+            create_backend(backend_name, data_dir)
+            elapsed = run(write_rows, lambda writer: (backend_name, data_dir, writer, rows), writers)
+            data, _ = create_backend(backend_name, data_dir).load_sheet("bench", "Client")
+            status = "ok" if sorted(row[0] for row in data) == sorted(
+                f"{writer}-{i}" for writer in range(writers) for i in range(rows)
+            ) else f"LOST {expected - len(data)} ROWS"
+            print(f"  {backend_name:<8} {expected / elapsed:8.0f} saves/s  {elapsed:6.2f}s  {status}")
+    
+    with tempfile.TemporaryDirectory() as data_dir:
+        users_file = os.path.join(data_dir, "users.json")
+        elapsed = run(count_users, lambda writer: (users_file, writer, rows), writers)
+        # The directory also creates the default admin
+        stored = sum(1 for user_data in read_json(users_file, {}).values() if user_data.get("role") == "encoder")
+        status = "ok" if stored == expected else f"LOST {expected - stored} UPDATES"
+        print(f"  {'users':<8} {expected / elapsed:8.0f} saves/s  {elapsed:6.2f}s  {status}")
+
+if __name__ == "__main__":
+    main()
@@ -25,6 +25,11 @@ pip install --no-cache-dir --force-reinstall -r requirements-render.txt
 echo "Verifying Streamlit installation..."
 python -c "import streamlit; print(f'Streamlit version: {streamlit.__version__}')"
 
+# Compile reference data so workers skip CSV/Excel parsing on start-up
+echo "Building reference data indexes..."
+python -m utils.philippine_locations || echo "Location snapshot build failed, workers will parse CSVs"
+python -m utils.psic_handler || echo "PSIC index build failed, workers will parse the workbook"
+
 # Start the application with error handling
 echo "Starting Streamlit application..."
 streamlit run main.py \
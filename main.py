@@ -4,6 +4,7 @@ import time
 import json
 import os
 from utils.secure_session import session_manager
+from utils.email_outbox import email_outbox
 
 # Render compatibility
 if os.getenv('RENDER'):
@@ -53,12 +54,18 @@ def main():
     if not os.path.exists(data_dir):
         os.makedirs(data_dir)
     
-    # Clean up expired sessions on startup
+    # Expired sessions are cleaned up by a background janitor, started once per process
     try:
-        session_manager.cleanup_expired_sessions()
+        session_manager.start_janitor()
     except Exception as e:
         print(f"Session cleanup error: {e}")
     
+    # Emails queued before a restart are delivered by the background sender
+    try:
+        email_outbox.start_sender()
+    except Exception as e:
+        print(f"Email outbox error: {e}")
+    
     # Initialize session state for authentication
     if "authenticated" not in st.session_state:
         st.session_state["authenticated"] = False
@@ -9,8 +9,13 @@ import unicodedata
 from datetime import datetime
 from utils.philippine_locations import create_location_widgets
 from utils.psic_handler import create_psic_widgets
-from utils.data_manager import data_manager
+from utils.data_manager import data_manager, apply_row_changes
 from utils.secure_session import session_manager
+from utils.user_directory import user_directory
+from utils.credentials import hash_password, verify_password
+from utils.file_storage import atomic_write_json
+from utils.excel_export import write_workbook, write_csv_zip
+from utils.duplicates import DUPLICATE_CHECK_FIELDS, find_duplicates
 
 st.markdown("""
 <style>
@@ -136,6 +141,10 @@ try:
 except ImportError:
     XLSXWRITER_AVAILABLE = False
 
+# Smart search keeps only the best matches and shows them a page at a time
+SEARCH_RESULT_LIMIT = 200
+SEARCH_PAGE_SIZE = 20
+
 def save_targets_to_file(targets):
     """Save targets to a persistent file"""
     data_dir = "data"
@@ -144,8 +153,7 @@ def save_targets_to_file(targets):
     
     targets_file = os.path.join(data_dir, "dashboard_targets.json")
     try:
-        with open(targets_file, 'w') as f:
-            json.dump(targets, f, indent=2)
+        atomic_write_json(targets_file, targets, indent=2)
     except Exception as e:
         st.error(f"Error saving targets: {e}")
 
@@ -239,6 +247,21 @@ def load_all_data_from_file():
         st.error(f"Error loading data: {str(e)}")
         return {}
 
+@st.cache_data(max_entries=32, show_spinner=False)
+def find_user_duplicates(username, data_version):
+    """Find duplicates in all of a user's sheets; cached per data_version"""
+    duplicate_results = {}
+    for sheet_name, fields_to_check in DUPLICATE_CHECK_FIELDS.items():
+        # Load data for this sheet
+        data, columns = data_manager.load_user_data(username, sheet_name)
+        if not data or not columns:
+            continue
+        
+        sheet_duplicates = find_duplicates(data, columns, fields_to_check)
+        if sheet_duplicates:
+            duplicate_results[sheet_name] = sheet_duplicates
+    return duplicate_results
+
 def search_for_duplicates():
     """Search for duplicates across all sheets"""
     try:
@@ -246,101 +269,12 @@ def search_for_duplicates():
         auth_cookie = st.session_state.get("auth_cookie", {})
         username = auth_cookie.get("username", "anonymous")
         
-        duplicate_results = {}
-        
-        # Define fields to check for duplicates in each sheet
-        duplicate_check_fields = {
-            "Client": ["First Name", "Last Name", "Full Name", "Business Name", "Email", "Contact Number"],
-            "Business Owner": ["First Name", "Last Name", "Full Name", "Business Name", "Email", "Contact Number"],
-            "Business Profile": ["Business Name", "Business Registration Number", "TIN", "Email"],
-            "Business Registration": ["Business Name", "Registration Number", "TIN"],
-            "Business Contact Information": ["Business Name", "Email", "Contact Number"],
-            "Business Financial Structure": ["Business Name", "TIN"],
-            "Market Domestic": ["Business Name", "Product/Service"],
-            "Market Export": ["Business Name", "Product/Service", "Destination Country"],
-            "Market Import": ["Business Name", "Product/Service", "Source Country"],
-            "Product Service Lines": ["Business Name", "Product/Service Name"],
-            "Employment Statistics": ["Business Name", "Employee Name"],
-            "Assistance": ["Business Name", "Beneficiary Name"],
-            "Jobs Generated": ["Business Name", "Job Title"]
-        }
-        
-        for sheet_name, fields_to_check in duplicate_check_fields.items():
-            try:
-                # Load data for this sheet
-                data, columns = data_manager.load_user_data(username, sheet_name)
-                if not data or not columns:
-                    continue
-                
-                df = pd.DataFrame(data, columns=columns)
-                if df.empty:
-                    continue
-                
-                sheet_duplicates = {}
-                
-                # Check each field for duplicates
-                for field in fields_to_check:
-                    if field in df.columns:
-                        # Find duplicates (non-empty values only)
-                        field_data = df[field].dropna()
-                        field_data = field_data[field_data.astype(str).str.strip() != '']
-                        
-                        if len(field_data) > 1:
-                            value_counts = field_data.value_counts()
-                            duplicates = value_counts[value_counts > 1]
-                            
-                            if not duplicates.empty:
-                                duplicate_list = []
-                                for value, count in duplicates.items():
-                                    # Get row numbers (1-based indexing for user display)
-                                    matching_rows = df[df[field] == value].index + 1
-                                    duplicate_list.append({
-                                        'value': str(value),
-                                        'count': int(count),
-                                        'rows': matching_rows.tolist()
-                                    })
-                                
-                                sheet_duplicates[field] = duplicate_list
-                
-                if sheet_duplicates:
-                    duplicate_results[sheet_name] = sheet_duplicates
-                    
-            except Exception as e:
-                continue
-        
-        return duplicate_results
+        return find_user_duplicates(username, data_manager.get_user_data_version(username))
         
     except Exception as e:
         st.error(f"Error searching for duplicates: {str(e)}")
         return {}
 
-def load_users():
-    """Load users from JSON file"""
-    users_file = "data/users.json"
-    if os.path.exists(users_file):
-        try:
-            with open(users_file, 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            st.error(f"Error loading users: {e}")
-            return {}
-    return {}
-
-def save_users(users):
-    """Save users to JSON file"""
-    data_dir = "data"
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-    
-    users_file = os.path.join(data_dir, "users.json")
-    try:
-        with open(users_file, 'w') as f:
-            json.dump(users, f, indent=2)
-        return True
-    except Exception as e:
-        st.error(f"Error saving users: {e}")
-        return False
-
 def clean_input(text):
     """Clean input text to match login cleaning logic"""
     if not text:
@@ -401,44 +335,18 @@ def validate_password(password):
 
 def rename_user_data_folder(old_username, new_username):
     """Rename user's data folder when username changes"""
-    old_folder = f"data/user_{old_username}"
-    new_folder = f"data/user_{new_username}"
-    
-    try:
-        if os.path.exists(old_folder):
-            # Create new folder if it doesn't exist
-            if not os.path.exists(new_folder):
-                os.makedirs(new_folder)
-            
-            # Move all files from old folder to new folder
-            import shutil
-            for filename in os.listdir(old_folder):
-                old_file = os.path.join(old_folder, filename)
-                new_file = os.path.join(new_folder, filename)
-                shutil.move(old_file, new_file)
-            
-            # Remove old folder
-            os.rmdir(old_folder)
-            return True
-    except Exception as e:
-        st.error(f"Error renaming user data folder: {e}")
-        return False
-    
-    return True
+    return data_manager.rename_user(old_username, new_username)
 
 def verify_current_password(username, password):
     """Verify if the provided password matches the user's current password"""
     try:
-        users = load_users()
+        user_data = user_directory.get_user(username)
         
-        if username not in users:
+        if user_data is None:
             return False
         
-        # Hash the provided password
-        hashed_password = hashlib.sha256(password.encode()).hexdigest()
-        
-        # Compare with stored password
-        return users[username].get("password") == hashed_password
+        # Compare with the stored bcrypt or legacy hash
+        return verify_password(password, user_data.get("password"))
         
     except Exception as e:
         st.error(f"Error verifying password: {e}")
@@ -447,15 +355,6 @@ def verify_current_password(username, password):
 def update_user_credentials(current_username, new_username, new_password):
     """Update user credentials in the system"""
     try:
-        # Load current users
-        users = load_users()
-        
-        if current_username not in users:
-            return False, "Current user not found"
-        
-        # Get current user data
-        user_data = users[current_username].copy()
-        
         # Clean inputs
         new_username = clean_input(new_username)
         new_password = clean_input(new_password)
@@ -465,42 +364,84 @@ def update_user_credentials(current_username, new_username, new_password):
         if not is_valid_username:
             return False, username_msg
         
-        # Check if new username already exists (and it's different from current)
-        if new_username != current_username and new_username in users:
-            return False, "Username already exists"
-        
         # Validate new password
         is_valid_password, password_msg = validate_password(new_password)
         if not is_valid_password:
             return False, password_msg
         
-        # Hash the new password
-        hashed_password = hashlib.sha256(new_password.encode()).hexdigest()
-        
-        # Update user data
-        user_data["password"] = hashed_password
+        # Hash the new password before taking the users.json lock
+        hashed_password = hash_password(new_password)
         
-        # If username changed, update the users dict and rename data folder
-        if new_username != current_username:
-            # Remove old username entry
-            del users[current_username]
+        # Re-read, change and save users.json under its lock so concurrent updates are kept
+        with user_directory.locked_users() as users:
+            if current_username not in users:
+                return False, "Current user not found"
             
-            # Rename user data folder
-            if not rename_user_data_folder(current_username, new_username):
+            # Check if new username already exists (and it's different from current)
+            if new_username != current_username and new_username in users:
+                return False, "Username already exists"
+            
+            # If username changed, rename the data folder first
+            if new_username != current_username and not rename_user_data_folder(current_username, new_username):
                 return False, "Failed to update user data folder"
-        
-        # Add user with new username (or update existing)
-        users[new_username] = user_data
-        
-        # Save users
-        if not save_users(users):
-            return False, "Failed to save user data"
+            
+            # Update user data under the new username (or the existing one)
+            user_data = users.pop(current_username)
+            user_data["password"] = hashed_password
+            users[new_username] = user_data
         
         return True, "Account updated successfully"
         
     except Exception as e:
         return False, f"Error updating credentials: {str(e)}"
 
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_user_export(username, user_full_name, data_version):
+    """
+    Build the export file for a user's data as (file data, has data, format).
+    Cached per data_version, so the workbook is only re-serialized after a save.
+    Rows are streamed from storage into the writer without building DataFrames.
+    """
+    # Create Excel file in memory
+    import io
+    output = io.BytesIO()
+    
+    sheet_names = [
+        "Business Owner", "Business Profile", "Client", "Business Registration",
+        "Business Financial Structure", "Market Import", "Product Service Lines", 
+        "Employment Statistics", "Assistance", "Market Export", "Jobs Generated"
+    ]
+    # Each sheet is read from storage only when the writer gets to it
+    sheets = (
+        (sheet_name, *data_manager.iter_user_rows(username, sheet_name))
+        for sheet_name in sheet_names
+    )
+    export_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    
+    # Check if Excel engines are available
+    if not OPENPYXL_AVAILABLE and not XLSXWRITER_AVAILABLE:
+        # Fallback: Create CSV zip file instead
+        summary_rows = [
+            ['Export Date', 'Username', 'Full Name', 'Total Sheets', 'Format'],
+            [export_date, username, user_full_name or 'Not provided', len(sheet_names), 'CSV (Excel packages unavailable)']
+        ]
+        has_data = write_csv_zip(output, sheets, summary_rows)
+        return output.getvalue(), has_data, 'zip'
+    
+    # Create a summary sheet instead if no data exists
+    summary_rows = [
+        ['Info', 'Details'],
+        ['User', user_full_name or username],
+        ['Export Date', export_date],
+        ['Status', 'No data records found']
+    ]
+    has_data = write_workbook(output, sheets, summary_rows)
+    return output.getvalue(), has_data, 'excel'
+
+def request_excel_export(data_version):
+    """Mark the export for this data version as requested"""
+    st.session_state.excel_export_version = data_version
+
 def create_user_excel_download():
     """Create Excel file for current user's data"""
     try:
@@ -509,96 +450,8 @@ def create_user_excel_download():
         username = auth_cookie.get("username", "anonymous")
         user_full_name = f"{auth_cookie.get('first_name', '')} {auth_cookie.get('last_name', '')}".strip()
         
-        # Create Excel file in memory
-        import io
-        output = io.BytesIO()
-        
-        sheet_names = [
-            "Business Owner", "Business Profile", "Client", "Business Registration",
-            "Business Financial Structure", "Market Import", "Product Service Lines", 
-            "Employment Statistics", "Assistance", "Market Export", "Jobs Generated"
-        ]
-        # Check if Excel engines are available
-        if not OPENPYXL_AVAILABLE and not XLSXWRITER_AVAILABLE:
-            # Fallback: Create CSV zip file instead
-            import zipfile
-            zip_buffer = io.BytesIO()
-            
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                has_data = False
-                
-                for sheet_name in sheet_names:
-                    data, columns = data_manager.load_user_data(username, sheet_name)
-                    
-                    if data and columns:
-                        has_data = True
-                        # Create DataFrame and convert to CSV
-                        df = pd.DataFrame(data, columns=columns)
-                        csv_buffer = io.StringIO()
-                        df.to_csv(csv_buffer, index=False)
-                        
-                        # Add CSV to zip
-                        zip_file.writestr(f"{sheet_name}.csv", csv_buffer.getvalue())
-                    else:
-                        # Create empty CSV with headers if available
-                        if columns:
-                            empty_df = pd.DataFrame(columns=columns)
-                            csv_buffer = io.StringIO()
-                            empty_df.to_csv(csv_buffer, index=False)
-                            zip_file.writestr(f"{sheet_name}.csv", csv_buffer.getvalue())
-                
-                # Add summary file
-                summary_data = {
-                    'Export Date': [datetime.now().strftime('%Y-%m-%d %H:%M:%S')],
-                    'Username': [username],
-                    'Full Name': [user_full_name or 'Not provided'],
-                    'Total Sheets': [len(sheet_names)],
-                    'Format': ['CSV (Excel packages unavailable)']
-                }
-                summary_df = pd.DataFrame(summary_data)
-                csv_buffer = io.StringIO()
-                summary_df.to_csv(csv_buffer, index=False)
-                zip_file.writestr("Export_Summary.csv", csv_buffer.getvalue())
-            
-            zip_buffer.seek(0)
-            return zip_buffer.getvalue(), has_data, 'zip'
-        
-        # Use available engine
-        engine = 'openpyxl' if OPENPYXL_AVAILABLE else 'xlsxwriter'
-        with pd.ExcelWriter(output, engine=engine) as writer:
-            has_data = False
-            
-            for sheet_name in sheet_names:
-                data, columns = data_manager.load_user_data(username, sheet_name)
-                if data and columns:
-                    df = pd.DataFrame(data, columns=columns)
-                    # Force 'Date Created' to be exported as text, not Excel date
-                    if 'Date Created' in df.columns:
-                        df['Date Created'] = df['Date Created'].astype(str)
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
-                    worksheet = writer.sheets[sheet_name]
-                    if 'Date Created' in df.columns:
-                        col_idx = df.columns.get_loc('Date Created')
-                        # Set column width for both openpyxl and xlsxwriter
-                        try:
-                            worksheet.set_column(col_idx, col_idx, 24)
-                        except Exception:
-                            # openpyxl: set width by column letter
-                            from openpyxl.utils import get_column_letter
-                            col_letter = get_column_letter(col_idx + 1)
-                            worksheet.column_dimensions[col_letter].width = 24
-                    has_data = True
-            
-            if not has_data:
-                # Create a summary sheet if no data exists
-                summary_df = pd.DataFrame({
-                    'Info': ['User', 'Export Date', 'Status'],
-                    'Details': [user_full_name or username, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'No data records found']
-                })
-                summary_df.to_excel(writer, sheet_name='Summary', index=False)
-        
-        output.seek(0)
-        return output.getvalue(), has_data, 'excel'
+        data_version = data_manager.get_user_data_version(username)
+        return build_user_export(username, user_full_name, data_version)
         
     except Exception as e:
         st.error(f"Error creating Excel file: {str(e)}")
@@ -611,6 +464,87 @@ def save_current_data(selected):
         if table_key in st.session_state and col_key in st.session_state:
             save_data_to_file(selected, st.session_state[table_key], st.session_state[col_key])
 
+def save_new_row(selected, row):
+        """Save a row just appended to the selected sheet without rewriting the sheet"""
+        col_key = f"table_cols_{selected}"
+        if col_key not in st.session_state:
+            return
+        
+        auth_cookie = st.session_state.get("auth_cookie", {})
+        username = auth_cookie.get("username", "anonymous")
+        if data_manager.save_user_rows(username, selected, st.session_state[col_key], added_rows=[row]):
+            st.success(f"Data saved to your personal {selected} records!")
+
+def show_duplicate_warning(form_key):
+        """Show the pending duplicate warning of a form above its Submit button"""
+        warning = st.session_state.get(f"{form_key}_duplicate_warning")
+        if warning:
+            st.warning(warning)
+            st.checkbox("This is a different person, save anyway", key=f"{form_key}_save_duplicate")
+
+def check_new_row_duplicates(selected, row, form_key):
+        """
+        Check a new row against the sheet's duplicate index before it is appended.
+        Returns True if the row can be saved: nothing matched, or the encoder chose to
+        save anyway. Otherwise a warning is kept for show_duplicate_warning.
+        """
+        col_key = f"table_cols_{selected}"
+        warning_key = f"{form_key}_duplicate_warning"
+        if col_key not in st.session_state:
+            return True
+        
+        auth_cookie = st.session_state.get("auth_cookie", {})
+        username = auth_cookie.get("username", "anonymous")
+        matches = data_manager.find_row_duplicates(username, selected, st.session_state[col_key], row)
+        if matches and not st.session_state.get(f"{form_key}_save_duplicate"):
+            details = []
+            for fields, rows in matches:
+                row_list = ", ".join(str(row_number) for row_number in rows[:5])
+                if len(rows) > 5:
+                    row_list += f" and {len(rows) - 5} more"
+                details.append(f"same {' and '.join(fields)} as row {row_list}")
+            st.session_state[warning_key] = f"Possible duplicate {selected} record: " + "; ".join(details) + "."
+            return False
+        
+        st.session_state.pop(warning_key, None)
+        return True
+
+def save_editor_changes(selected, editor_key):
+        """Save only the rows changed in the data editor for the selected sheet"""
+        table_key = f"table_data_{selected}"
+        col_key = f"table_cols_{selected}"
+        changes = st.session_state.get(editor_key) or {}
+        if table_key not in st.session_state or col_key not in st.session_state:
+            return
+        
+        data = st.session_state[table_key]
+        columns = st.session_state[col_key]
+        
+        # Edited cells are reported per row position and column name
+        updated_rows = {}
+        for row_index, row_changes in changes.get("edited_rows", {}).items():
+            row_index = int(row_index)
+            if not 0 <= row_index < len(data):
+                continue
+            row = list(data[row_index])
+            for col_name, value in row_changes.items():
+                if col_name in columns and col_name != "No":
+                    row[columns.index(col_name)] = value
+            if row != list(data[row_index]):
+                updated_rows[row_index] = row
+        
+        added_rows = [[row.get(col, "") for col in columns] for row in changes.get("added_rows", [])]
+        deleted_rows = [int(row_index) for row_index in changes.get("deleted_rows", []) if 0 <= int(row_index) < len(data)]
+        
+        if not (updated_rows or added_rows or deleted_rows):
+            return
+        
+        st.session_state[table_key] = apply_row_changes(data, updated_rows, added_rows, deleted_rows)
+        
+        auth_cookie = st.session_state.get("auth_cookie", {})
+        username = auth_cookie.get("username", "anonymous")
+        data_manager.save_user_rows(username, selected, columns, updated_rows, added_rows, deleted_rows)
+
 def delete_data_file(sheet_name):
         """Delete a specific sheet from the Excel file"""
         data_dir = "data"
@@ -645,9 +579,14 @@ def get_excel_sheets():
                 return []
         return []
 
-def perform_global_search(search_term):
-        """Search across all sheets for the given term in current user's data"""
+def perform_global_search(search_term, limit=SEARCH_RESULT_LIMIT):
+        """
+        Search across all sheets for the given term in current user's data, best matches first.
+        Returns (top results, total number of matches). Each result carries its record as
+        read at search time and a record id that stays stable when rows are inserted or deleted.
+        """
         results = []
+        total_matches = 0
         
         # Get current user from session
         auth_cookie = st.session_state.get("auth_cookie", {})
@@ -663,90 +602,74 @@ def perform_global_search(search_term):
         ]
         
         try:
-            # Search through each sheet
-            for sheet_name in searchable_sheets:
-                # Load user-specific data for this sheet
-                data, columns = data_manager.load_user_data(username, sheet_name)
-                
-                if not data or not columns:
+            # Ranked hits from the user's search index; full rows are read only for sheets with hits
+            exact_hits, fuzzy_hits = data_manager.search_user_data(username, search_term, sheets=searchable_sheets)
+            hits = [hit + (False,) for hit in exact_hits]
+            
+            # Near matches on names, emails and numbers follow the exact ones
+            found = {(sheet_name, row_index) for sheet_name, row_index, *_ in hits}
+            hits += [hit + (True,) for hit in fuzzy_hits if (hit[0], hit[1]) not in found]
+            
+            total_matches = len(hits)
+            
+            sheet_data = {}
+            record_ids = set()
+            for sheet_name, row_index, score, col_indices, fuzzy in hits[:limit]:
+                if sheet_name not in sheet_data:
+                    sheet_data[sheet_name] = data_manager.load_user_data(username, sheet_name)
+                data, columns = sheet_data[sheet_name]
+                if row_index >= len(data):
                     continue
                 
-                # Convert to DataFrame for easier searching
-                df = pd.DataFrame(data, columns=columns)
-                if df.empty:
-                    continue
+                original_row = data[row_index]
+                matches = [columns[col_idx] for col_idx in col_indices if col_idx < len(columns)]
+                match_values = [str(original_row[col_idx]) for col_idx in col_indices if col_idx < len(columns)]
                 
-                # Convert DataFrame to string for searching
-                df_search = df.astype(str)
+                # Create a better match description
+                match_preview = []
+                for i, (col, val) in enumerate(zip(matches[:3], match_values[:3])):
+                    preview = val[:50] + '...' if len(val) > 50 else val
+                    match_preview.append(f"{col}: '{preview}'")
                 
-                # Search each row
-                for index, row in df_search.iterrows():
-                    # Check if search term appears in any column of this row
-                    matches = []
-                    match_values = []
-                    
-                    for col_name, cell_value in row.items():
-                        if search_term.lower() in str(cell_value).lower():
-                            matches.append(col_name)
-                            match_values.append(str(cell_value))
-                    
-                    if matches:
-                        # Get the original row data
-                        original_row = df.iloc[index]
-                        
-                        # Create a better match description
-                        match_preview = []
-                        for i, (col, val) in enumerate(zip(matches[:3], match_values[:3])):
-                            preview = val[:50] + '...' if len(val) > 50 else val
-                            match_preview.append(f"{col}: '{preview}'")
-                        
-                        match_info = "Matches in " + ", ".join(match_preview)
-                        if len(matches) > 3:
-                            match_info += f" (+{len(matches)-3} more)"
-                        
-                        # Create result entry with original data
-                        result = {
-                            'sheet': sheet_name,
-                            'data': dict(original_row),
-                            'match_info': match_info,
-                            'match_count': len(matches)
-                        }
-                        results.append(result)
+                match_info = ("Similar to " if fuzzy else "Matches in ") + ", ".join(match_preview)
+                if len(matches) > 3:
+                    match_info += f" (+{len(matches)-3} more)"
+                
+                # Identify the record by its content, not its row position
+                record_id = hashlib.sha1(json.dumps([sheet_name, original_row], default=str).encode()).hexdigest()[:16]
+                while record_id in record_ids:
+                    record_id += "+"
+                record_ids.add(record_id)
+                
+                # Create result entry with the record itself, read once per search
+                result = {
+                    'sheet': sheet_name,
+                    'record_id': record_id,
+                    'record': dict(zip(columns, original_row)),
+                    'match_info': match_info,
+                    'match_count': len(matches),
+                    'score': score,
+                    'fuzzy': fuzzy
+                }
+                results.append(result)
         
         except Exception as e:
             st.error(f"Error during search: {str(e)}")
         
-        # Sort results by relevance (number of matches, then by sheet name)
-        results.sort(key=lambda x: (-x['match_count'], x['sheet']))
-        
-        return results
+        return results, total_matches
+
+def set_search_page(page):
+        """Switch the smart search results to another page"""
+        st.session_state.smart_search_page = page
 
 def get_client_data_by_number(client_number, username):
     """
-    Fetch client data from Client sheet based on client number (No field)
+    Fetch client data from Client sheet based on client number (No field) or Client ID
     Returns a dictionary with column names as keys and values from that client row
     """
     try:
-        # Load Client sheet data for the current user
-        data, columns = data_manager.load_user_data(username, "Client")
-        
-        if not data or not columns:
-            return {}
-        
-        # Convert to DataFrame for easier searching
-        df = pd.DataFrame(data, columns=columns)
-        
-        # Find the row where "No" matches the client_number
-        if "No" in df.columns:
-            # Convert both to string for comparison to handle different data types
-            matching_rows = df[df["No"].astype(str) == str(client_number)]
-            
-            if not matching_rows.empty:
-                # Get the first matching row as a dictionary
-                client_data = matching_rows.iloc[0].to_dict()
-                return client_data
-        
-        return {}
+        # Served from the user's cached client index, kept up to date on save
+        return data_manager.find_client(username, client_number)
     
     except Exception as e:
         st.error(f"Error fetching client data: {str(e)}")
@@ -1715,44 +1638,55 @@ def show():
             
             st.info(f"Exporting personal data for: **{user_full_name or username}**")
             
-            # Create user-specific Excel file
-            result = create_user_excel_download()
+            # Build the export only when asked for, and again only after the data changes
+            data_version = data_manager.get_user_data_version(username)
+            if st.session_state.get("excel_export_version") != data_version:
+                if "excel_export_version" in st.session_state:
+                    st.caption("Your data has changed since the last export.")
+                st.button(
+                    "Prepare My Data Export", key="prepare_export_btn", type="primary", use_container_width=True,
+                    on_click=request_excel_export, args=(data_version,)
+                )
             
-            if result[0]:  # If data was created
-                file_data, has_data, file_format = result
+            if st.session_state.get("excel_export_version") == data_version:
+                # Create user-specific Excel file
+                result = create_user_excel_download()
                 
-                # Get current date for filename
-                current_date = datetime.now().strftime("%Y%m%d_%H%M%S")
+                if result[0]:  # If data was created
+                    file_data, has_data, file_format = result
                 
-                if file_format == 'zip':
-                    download_filename = f"CPMS_Data_{username}_{current_date}.zip"
-                    mime_type = "application/zip"
-                    file_type_label = "Download My CPMS Data (CSV Format)"
-                    format_note = "Excel packages unavailable - exported as CSV files in ZIP"
-                else:
-                    download_filename = f"CPMS_Data_{username}_{current_date}.xlsx"
-                    mime_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    file_type_label = "Download My CPMS Data"
-                    format_note = "Excel format"
-                
-                st.download_button(
-                    label=file_type_label,
-                    data=file_data,
-                    file_name=download_filename,
-                    mime=mime_type,
-                    use_container_width=True,
-                    type="primary"
-                )
-                
-                # Show data status
-                if has_data:
-                    st.success("Your data is ready for download!")
-                    st.caption(f"File includes all your personal CPMS records ({format_note})")
+                    # Get current date for filename
+                    current_date = datetime.now().strftime("%Y%m%d_%H%M%S")
+                    
+                    if file_format == 'zip':
+                        download_filename = f"CPMS_Data_{username}_{current_date}.zip"
+                        mime_type = "application/zip"
+                        file_type_label = "Download My CPMS Data (CSV Format)"
+                        format_note = "Excel packages unavailable - exported as CSV files in ZIP"
+                    else:
+                        download_filename = f"CPMS_Data_{username}_{current_date}.xlsx"
+                        mime_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                        file_type_label = "Download My CPMS Data"
+                        format_note = "Excel format"
+                    
+                    st.download_button(
+                        label=file_type_label,
+                        data=file_data,
+                        file_name=download_filename,
+                        mime=mime_type,
+                        use_container_width=True,
+                        type="primary"
+                    )
+                    
+                    # Show data status
+                    if has_data:
+                        st.success("Your data is ready for download!")
+                        st.caption(f"File includes all your personal CPMS records ({format_note})")
+                    else:
+                        st.info("No data records found. File includes summary information.")
+                        st.caption(f"Add some data first to include records in the export ({format_note})")
                 else:
-                    st.info("No data records found. File includes summary information.")
-                    st.caption(f"Add some data first to include records in the export ({format_note})")
-            else:
-                st.error("Unable to create data file")
+                    st.error("Unable to create data file")
             
             # Actions section - moved to bottom
             st.divider()
@@ -1869,6 +1803,8 @@ def show():
                 st.session_state.smart_search_query = ""
             if 'smart_search_results' not in st.session_state:
                 st.session_state.smart_search_results = None
+            if 'smart_search_page' not in st.session_state:
+                st.session_state.smart_search_page = 0
             
             # Search input with professional styling
             search_col1, search_col2 = st.columns([4, 1])
@@ -1886,7 +1822,10 @@ def show():
             # Perform search when button is clicked or Enter is pressed
             if search_button and search_query.strip():
                 st.session_state.smart_search_query = search_query
-                st.session_state.smart_search_results = perform_global_search(search_query.strip())
+                results, total_matches = perform_global_search(search_query.strip())
+                st.session_state.smart_search_results = results
+                st.session_state.smart_search_total = total_matches
+                st.session_state.smart_search_page = 0
             elif not search_query.strip() and st.session_state.smart_search_query:
                 # Clear search results if search box is cleared
                 st.session_state.smart_search_query = ""
@@ -1899,39 +1838,49 @@ def show():
             results = st.session_state.smart_search_results
             
             if len(results) > 0:
+                total_matches = st.session_state.get("smart_search_total", len(results))
                 st.markdown(f"""
                     <div style="background: linear-gradient(135deg, #10b981 0%, #059669 100%); 
                                 padding: 20px 30px; border-radius: 10px; margin: 20px 0;
                                 box-shadow: 0 4px 15px rgba(16, 185, 129, 0.2);">
                         <h3 style="color: white; margin: 0; font-weight: 600;">
-                            Search Results: {len(results)} record(s) found for "{st.session_state.smart_search_query}"
+                            Search Results: {total_matches} record(s) found for "{st.session_state.smart_search_query}"
                         </h3>
                     </div>
                 """, unsafe_allow_html=True)
+                if total_matches > len(results):
+                    st.caption(f"Showing the {len(results)} best matches. Refine your search to narrow down the results.")
+                
+                # Only the current page of results is rendered
+                page_count = (len(results) + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+                page = min(st.session_state.smart_search_page, page_count - 1)
+                page_start = page * SEARCH_PAGE_SIZE
+                page_results = results[page_start:page_start + SEARCH_PAGE_SIZE]
                 
                 # Display results in a clean, organized manner
-                for idx, result in enumerate(results, 1):
+                for idx, result in enumerate(page_results, page_start + 1):
                     with st.expander(f"Result {idx}: {result['sheet']} - {result['match_info']}", expanded=False):
                         st.markdown(f"**Sheet:** {result['sheet']}")
                         st.markdown(f"**Match Details:** {result['match_info']}")
                         
-                        # Display the matching record data
-                        st.markdown("**Record Data:**")
-                        
-                        # Create a clean display of the data
-                        data_items = []
-                        for key, value in result['data'].items():
-                            if pd.notna(value) and str(value).strip() != '':
-                                data_items.append(f"**{key}:** {value}")
-                        
-                        # Display in columns for better readability
-                        if data_items:
-                            cols_per_row = 2
-                            for i in range(0, len(data_items), cols_per_row):
-                                cols = st.columns(cols_per_row)
-                                for j, col in enumerate(cols):
-                                    if i + j < len(data_items):
-                                        col.markdown(data_items[i + j])
+                        # The matching record is only rendered when asked for
+                        if st.toggle("Show Record Data", key=f"show_record_{result['record_id']}"):
+                            st.markdown("**Record Data:**")
+                            
+                            # Create a clean display of the data
+                            data_items = []
+                            for key, value in result['record'].items():
+                                if pd.notna(value) and str(value).strip() != '':
+                                    data_items.append(f"**{key}:** {value}")
+                            
+                            # Display in columns for better readability
+                            if data_items:
+                                cols_per_row = 2
+                                for i in range(0, len(data_items), cols_per_row):
+                                    cols = st.columns(cols_per_row)
+                                    for j, col in enumerate(cols):
+                                        if i + j < len(data_items):
+                                            col.markdown(data_items[i + j])
                         
                         # Add navigation button to go to the specific sheet
                         if st.button(f"Go to {result['sheet']}", key=f"goto_sheet_{idx}_{result['sheet']}", type="secondary"):
@@ -1941,6 +1890,26 @@ def show():
                             st.session_state.smart_search_query = ""
                             st.rerun()
                 
+                # Page navigation
+                if page_count > 1:
+                    prev_col, info_col, next_col = st.columns([1, 2, 1])
+                    with prev_col:
+                        st.button(
+                            "Previous", key="smart_search_prev", disabled=page == 0, use_container_width=True,
+                            on_click=set_search_page, args=(page - 1,)
+                        )
+                    with info_col:
+                        st.markdown(
+                            f"<div style='text-align: center;'>Page {page + 1} of {page_count} "
+                            f"(results {page_start + 1}-{page_start + len(page_results)})</div>",
+                            unsafe_allow_html=True
+                        )
+                    with next_col:
+                        st.button(
+                            "Next", key="smart_search_next", disabled=page >= page_count - 1, use_container_width=True,
+                            on_click=set_search_page, args=(page + 1,)
+                        )
+                
                 # Clear results button
                 if st.button("Clear Search Results", key="clear_smart_search", type="secondary"):
                     st.session_state.smart_search_results = None
@@ -3174,6 +3143,7 @@ def show():
                             validation_errors.append(field)
                     
                     # Submit button
+                    show_duplicate_warning("bo_form")
                     submitted = st.button("Submit")
                     
                     if submitted:
@@ -3194,9 +3164,11 @@ def show():
                             row = [str(next_no)]
                             for col in columns[1:]:
                                 row.append(new_entry.get(col, ""))
+                            if not check_new_row_duplicates(selected, row, "bo_form"):
+                                st.rerun()
                             data.append(row)
                             st.session_state[table_key] = data
-                            save_current_data(selected)
+                            save_new_row(selected, row)
                             
                             if auto_fill_client_number:
                                 st.success(f"Business Owner saved successfully as No. {next_no} (linked to Client #{auto_fill_client_number})!")
@@ -3451,7 +3423,7 @@ def show():
                                 row.append(new_entry.get(col, ""))
                             data.append(row)
                             st.session_state[table_key] = data
-                            save_current_data(selected)
+                            save_new_row(selected, row)
                             
                             st.success("Business Profile saved successfully!")
                             
@@ -3927,6 +3899,7 @@ def show():
                             validation_errors.append(field)
                     
                     # Submit button
+                    show_duplicate_warning("client_form")
                     submitted = st.button("Submit")
                     
                     if submitted:
@@ -3941,9 +3914,11 @@ def show():
                             row = [str(next_no)]
                             for col in columns[1:]:
                                 row.append(new_entry.get(col, ""))
+                            if not check_new_row_duplicates(selected, row, "client_form"):
+                                st.rerun()
                             data.append(row)
                             st.session_state[table_key] = data
-                            save_current_data(selected)
+                            save_new_row(selected, row)
                             
                             st.success("Client information saved successfully!")
                             
@@ -4213,7 +4188,7 @@ def show():
                                 row.append(new_entry.get(col, ""))
                             data.append(row)
                             st.session_state[table_key] = data
-                            save_current_data(selected)
+                            save_new_row(selected, row)
                             
                             if auto_fill_client_number:
                                 st.success(f"Business Contact Information saved successfully as No. {next_no} (linked to Client #{auto_fill_client_number})!")
@@ -4395,7 +4370,7 @@ def show():
                                 row.append(new_entry.get(col, ""))
                             data.append(row)
                             st.session_state[table_key] = data
-                            save_current_data(selected)
+                            save_new_row(selected, row)
                             
                             st.success("Business Registration saved successfully!")
                             
@@ -4541,7 +4516,7 @@ def show():
                                 row.append(new_entry.get(col, ""))
                             data.append(row)
                             st.session_state[table_key] = data
-                            save_current_data(selected)
+                            save_new_row(selected, row)
                             
                             st.success("Business Financial Structure saved successfully!")
                             
@@ -4658,7 +4633,7 @@ def show():
                                 row.append(new_entry.get(col, ""))
                             data.append(row)
                             st.session_state[table_key] = data
-                            save_current_data(selected)
+                            save_new_row(selected, row)
                             
                             if auto_fill_client_number:
                                 st.success(f"Market Domestic saved successfully as No. {next_no} (linked to Client #{auto_fill_client_number})!")
@@ -4730,7 +4705,7 @@ def show():
                             row.append(new_entry.get(col, ""))
                         data.append(row)
                         st.session_state[table_key] = data
-                        save_current_data(selected)
+                        save_new_row(selected, row)
                         
                         st.success("Market Export saved successfully!")
                         
@@ -4789,7 +4764,7 @@ def show():
                             row.append(new_entry.get(col, ""))
                         data.append(row)
                         st.session_state[table_key] = data
-                        save_current_data(selected)
+                        save_new_row(selected, row)
                         
                         st.success("Market Import saved successfully!")
                         
@@ -4905,7 +4880,7 @@ def show():
                                 row.append(new_entry.get(col, ""))
                             data.append(row)
                             st.session_state[table_key] = data
-                            save_current_data(selected)
+                            save_new_row(selected, row)
                             
                             st.success("Product Service Lines saved successfully!")
                             
@@ -5006,7 +4981,7 @@ def show():
                                 row.append("Yes" if new_entry.get(col, False) else "No")
                             data.append(row)
                             st.session_state[table_key] = data
-                            save_current_data(selected)
+                            save_new_row(selected, row)
                             
                             st.success("Employment Statistics saved successfully!")
                             
@@ -5371,7 +5346,7 @@ def show():
                                 row.append(new_entry.get(col, ""))
                             data.append(row)
                             st.session_state[table_key] = data
-                            save_current_data(selected)
+                            save_new_row(selected, row)
                             
                             st.success("Assistance saved successfully!")
                             
@@ -5463,7 +5438,7 @@ def show():
                             row.append(new_entry.get(col, ""))
                         data.append(row)
                         st.session_state[table_key] = data
-                        save_current_data(selected)
+                        save_new_row(selected, row)
                         
                         st.success("Jobs Generated saved successfully!")
                         
@@ -5556,20 +5531,19 @@ def show():
             # Display the data table
             st.markdown("#### Current Data")
             
-            # Show the data editor for the selected sheet
-            edited_df = st.data_editor(
+            # Show the data editor for the selected sheet; changed rows are saved as they are edited
+            editor_key = f"data_editor_{selected}"
+            st.data_editor(
                 df,
                 use_container_width=True,
                 column_config=column_config,
                 hide_index=True,
                 width='stretch',
-                height=400
+                height=400,
+                key=editor_key,
+                on_change=save_editor_changes,
+                args=(selected, editor_key)
             )
-            
-            # Save data whenever it changes
-            if not edited_df.equals(df):
-                st.session_state[table_key] = edited_df.values.tolist()
-                save_current_data(selected)
 
             # Delete functionality buttons
             st.markdown("### Data Management")
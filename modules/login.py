@@ -2,47 +2,9 @@ import streamlit as st
 from PIL import Image
 import numpy as np
 import time
-import json
-import os
-import hashlib
-from utils.admin_config import get_default_admin_user, create_admin_if_not_exists
 from utils.secure_session import session_manager
-
-def load_users():
-    """Load users from JSON file"""
-    users_file = "data/users.json"
-    if os.path.exists(users_file):
-        try:
-            with open(users_file, 'r') as f:
-                users = json.load(f)
-                print(f"Loaded {len(users)} users: {list(users.keys())}")  # Debug print
-                
-                # Ensure admin user exists
-                created, message = create_admin_if_not_exists(users)
-                if created:
-                    print(f"Admin check: {message}")
-                    save_users(users)  # Save if admin was created
-                
-                return users
-        except Exception as e:
-            print(f"Error loading users: {e}")  # Debug print
-            return get_default_admin_user()
-    else:
-        print(f"Users file not found at: {users_file}")  # Debug print
-        # Initialize with admin user
-        admin_user = get_default_admin_user()
-        save_users(admin_user)
-        return admin_user
-
-def save_users(users):
-    """Save users to JSON file"""
-    data_dir = "data"
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-    
-    users_file = os.path.join(data_dir, "users.json")
-    with open(users_file, 'w') as f:
-        json.dump(users, f, indent=2)
+from utils.user_directory import user_directory
+from utils.credentials import verify_password
 
 def show():
     # Robust CSS with specific targeting for login page only
@@ -250,14 +212,14 @@ def show():
             username = ''.join(char for char in username if ord(char) >= 32 and ord(char) <= 126)
             password = ''.join(char for char in password if ord(char) >= 32 and ord(char) <= 126)
             
-            # Load users and check credentials
-            users = load_users()
+            # Look up the user and check credentials
+            user_data = user_directory.get_user(username)
             
-            if username in users:
-                user_data = users[username]
-                hashed_password = hashlib.sha256(password.encode()).hexdigest()
-                
-                if user_data["password"] == hashed_password:
+            if user_data is not None:
+                if verify_password(password, user_data["password"]):
+                    # Legacy SHA-256 and outdated-cost hashes are upgraded to bcrypt in the background
+                    user_directory.upgrade_password_hash(username, password, user_data["password"])
+                    
                     if user_data.get("approved", False):
                         st.session_state["authenticated"] = True
                         # Set authentication cookie with timestamp
@@ -2,19 +2,16 @@ import streamlit as st
 import time
 import json
 import os
-import hashlib
-import smtplib
 import secrets
 import string
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime
-from utils.admin_config import get_default_admin_user, create_admin_if_not_exists, get_admin_credentials_display
+from utils.admin_config import get_admin_credentials_display
+from utils.credentials import hash_password, verify_password
 from utils.secure_session import session_manager
-
-def hash_password(password):
-    """Hash password for security"""
-    return hashlib.sha256(password.encode()).hexdigest()
+from utils.email_outbox import email_outbox
+from utils.file_storage import locked_json
+from utils.user_directory import user_directory, load_users
+from utils.entity_resolution import start_entity_resolution, entity_resolution_status, load_entity_clusters
 
 def generate_secure_password(length=6):
     """Generate a secure random password"""
@@ -23,29 +20,19 @@ def generate_secure_password(length=6):
     password = ''.join(secrets.choice(characters) for _ in range(length))
     return password
 
-def send_account_creation_email(user_data, password):
-    """Send email with account credentials to new encoder"""
+def queue_account_creation_email(user_data, password):
+    """Queue an email with account credentials to a new encoder; it is sent in the background"""
     try:
-        # Email configuration - using Streamlit secrets (support both formats)
-        email_config = st.secrets.get("email", {})
-        sender_email = email_config.get("sender_email") or email_config.get("username") or email_config.get("from", "")
-        sender_password = email_config.get("sender_password") or email_config.get("password", "")
         receiver_email = user_data.get('email', '')
         
         if not receiver_email:
             st.warning("No email address provided for the user.")
             return False
             
-        if not sender_email or not sender_password:
+        if not email_outbox.is_configured():
             st.warning("Email credentials not configured in Streamlit secrets. Please configure email settings to send credentials automatically.")
             return False
         
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = receiver_email
-        msg['Subject'] = "CPMS Account Created - Login Credentials"
-        
         # Email body
         body = f"""Dear {user_data.get('first_name', '')} {user_data.get('last_name', '')},
 
@@ -72,85 +59,27 @@ You can now log in to the CPMS system using the provided credentials.
 Best regards,
 CPMS Administration Team"""
         
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Create SMTP session and send email
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        
-        # Send email
-        text = msg.as_string()
-        server.sendmail(sender_email, receiver_email, text)
-        server.quit()
-        
+        email_outbox.enqueue(receiver_email, "CPMS Account Created - Login Credentials", body)
         return True
         
-    except smtplib.SMTPAuthenticationError as e:
-        st.warning("Email authentication failed. Please check your Gmail credentials and app password settings.")
-        st.info("To fix this: Go to Google Account settings → Security → App passwords → Generate new app password")
-        return False
-    except (ConnectionRefusedError, OSError) as e:
-        st.warning("Network connection failed. Please check your internet connection and firewall settings.")
-        st.info("This error often occurs when SMTP ports (587/465) are blocked by corporate firewalls.")
-        return False
     except Exception as e:
-        st.warning(f"Email delivery failed: {str(e)}")
+        st.warning(f"Could not queue the credentials email: {str(e)}")
         return False
 
-def load_users():
-    """Load users from JSON file"""
-    users_file = "data/users.json"
-    if os.path.exists(users_file):
-        try:
-            with open(users_file, 'r') as f:
-                users = json.load(f)
-                # Ensure admin user exists
-                created, message = create_admin_if_not_exists(users)
-                if created:
-                    save_users(users)
-                return users
-        except:
-            return get_default_admin_user()
-    else:
-        # Initialize with admin user
-        admin_user = get_default_admin_user()
-        save_users(admin_user)
-        return admin_user
-
-def save_users(users):
-    """Save users to JSON file"""
-    data_dir = "data"
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-    
-    users_file = os.path.join(data_dir, "users.json")
-    with open(users_file, 'w') as f:
-        json.dump(users, f, indent=2)
-
 def backup_deleted_user(username, user_data):
     """Backup deleted user data"""
     try:
         data_dir = "data"
         backup_file = os.path.join(data_dir, "deleted_users_backup.json")
         
-        # Load existing backup or create new one
-        if os.path.exists(backup_file):
-            with open(backup_file, 'r') as f:
-                backup_data = json.load(f)
-        else:
-            backup_data = {}
-        
-        # Add deleted user to backup with deletion timestamp
-        backup_data[username] = {
-            **user_data,
-            "deleted_at": time.time(),
-            "deleted_by": "admin"
-        }
-        
-        # Save backup
-        with open(backup_file, 'w') as f:
-            json.dump(backup_data, f, indent=2)
+        # Load existing backup or create new one, and save it back under the file lock
+        with locked_json(backup_file, {}, indent=2) as backup_data:
+            # Add deleted user to backup with deletion timestamp
+            backup_data[username] = {
+                **user_data,
+                "deleted_at": time.time(),
+                "deleted_by": "admin"
+            }
         
         return True
     except Exception as e:
@@ -173,8 +102,6 @@ def load_deleted_users_backup():
 def restore_user_from_backup(username, backup_data):
     """Restore user from backup"""
     try:
-        users = load_users()
-        
         # Get user data from backup
         user_data = backup_data[username].copy()
         
@@ -183,8 +110,8 @@ def restore_user_from_backup(username, backup_data):
         user_data.pop("deleted_by", None)
         
         # Add back to active users
-        users[username] = user_data
-        save_users(users)
+        with user_directory.locked_users() as users:
+            users[username] = user_data
         
         return True
     except Exception as e:
@@ -199,56 +126,37 @@ def get_active_users():
     """Get list of currently active/online users"""
     try:
         active_users = []
-        sessions_dir = "data/sessions"
         current_time = time.time()
         
-        if not os.path.exists(sessions_dir):
-            return []
-        
-        # Load all users to get user details
-        users = load_users()
-        
-        for filename in os.listdir(sessions_dir):
-            if filename.startswith('session_') and filename.endswith('.json'):
-                filepath = os.path.join(sessions_dir, filename)
-                try:
-                    with open(filepath, 'r') as f:
-                        session_data = json.load(f)
-                    
-                    # Check if session is active (within last 30 minutes for online status)
-                    time_diff = current_time - session_data.get('timestamp', 0)
-                    
-                    if time_diff <= 1800:  # 30 minutes
-                        username = session_data.get('username')
-                        if username and username in users:
-                            user_info = users[username]
-                            
-                            # Determine status based on last activity
-                            if time_diff <= 300:  # 5 minutes - Online
-                                status = 'online'
-                                status_text = 'Online'
-                            elif time_diff <= 900:  # 15 minutes - Away
-                                status = 'away' 
-                                status_text = 'Away'
-                            else:  # Up to 30 minutes - Idle
-                                status = 'idle'
-                                status_text = 'Idle'
-                            
-                            active_users.append({
-                                'username': username,
-                                'full_name': f"{user_info.get('first_name', '')} {user_info.get('last_name', '')}".strip(),
-                                'role': user_info.get('role', 'encoder'),
-                                'status': status,
-                                'status_text': status_text,
-                                'last_activity': session_data.get('timestamp', 0),
-                                'browser_id': session_data.get('browser_id', 'unknown'),
-                                'session_start': session_data.get('created_at', 'unknown')
-                            })
-                except:
-                    continue
+        # Sessions active within the last 30 minutes, most recent first
+        for browser_id, session in session_manager.recent_sessions(current_time - 1800):
+            username = session.get('username')
+            user_info = user_directory.get_user(username) if username else None
+            if user_info is not None:
+                time_diff = current_time - session['timestamp']
+                
+                # Determine status based on last activity
+                if time_diff <= 300:  # 5 minutes - Online
+                    status = 'online'
+                    status_text = 'Online'
+                elif time_diff <= 900:  # 15 minutes - Away
+                    status = 'away' 
+                    status_text = 'Away'
+                else:  # Up to 30 minutes - Idle
+                    status = 'idle'
+                    status_text = 'Idle'
+                
+                active_users.append({
+                    'username': username,
+                    'full_name': f"{user_info.get('first_name', '')} {user_info.get('last_name', '')}".strip(),
+                    'role': user_info.get('role', 'encoder'),
+                    'status': status,
+                    'status_text': status_text,
+                    'last_activity': session['timestamp'],
+                    'browser_id': session.get('browser_id') or browser_id,
+                    'session_start': session.get('created_at') or 'unknown'
+                })
         
-        # Sort by last activity (most recent first)
-        active_users.sort(key=lambda x: x['last_activity'], reverse=True)
         return active_users
         
     except Exception as e:
@@ -594,6 +502,8 @@ with st.sidebar:
         ("Create Encoder Account", ""),
         ("Manage Encoder Accounts", ""),
         ("Active Sessions", ""),
+        ("Cross-Encoder Duplicates", ""),
+        ("Email Outbox", ""),
         ("System Settings", "")
     ]
     
@@ -607,9 +517,8 @@ with st.sidebar:
     st.divider()
     
     # Quick Stats
-    users = load_users()
     active_users = get_active_users()
-    total_encoders = len([u for u in users.values() if u.get("role") == "encoder"])
+    total_encoders = user_directory.count_by_role("encoder")
     online_count = len([u for u in active_users if u['status'] == 'online'])
     
     st.subheader("System Overview")
@@ -702,14 +611,11 @@ if selected_tab == "Create Encoder Account":
                 errors.append("Username must be at least 3 characters and contain only letters, numbers, and underscores")
             
             # Check for existing users
-            existing_users = load_users()
-            if username.strip().lower() in [k.lower() for k in existing_users.keys()]:
+            if user_directory.find_username(username) is not None:
                 errors.append("Username already exists - please choose a different username")
             
-            for user_data in existing_users.values():
-                if user_data.get("email", "").lower() == email.strip().lower():
-                    errors.append("Email address is already registered with another account")
-                    break
+            if email.strip() and user_directory.find_by_email(email) is not None:
+                errors.append("Email address is already registered with another account")
             
             # Display validation errors
             if errors:
@@ -754,9 +660,15 @@ if selected_tab == "Create Encoder Account":
                     "contact_number": contact_number.strip() if contact_number else ""
                 }
                 
-                # Save to database
-                existing_users[username.strip()] = new_encoder
-                save_users(existing_users)
+                # Save to database, checking the username again under the users.json lock
+                with user_directory.locked_users() as users:
+                    username_taken = username.strip() in users
+                    if not username_taken:
+                        users[username.strip()] = new_encoder
+                
+                if username_taken:
+                    st.error("Username already exists - please choose a different username")
+                    st.stop()
                 
                 # Success display with professional styling
                 st.success("**Account Created Successfully!**")
@@ -774,13 +686,12 @@ if selected_tab == "Create Encoder Account":
                 
                 # Email sending
                 if send_email:
-                    with st.spinner("Sending credentials via email..."):
-                        email_sent = send_account_creation_email(new_encoder, password)
+                    email_queued = queue_account_creation_email(new_encoder, password)
                     
-                    if email_sent:
-                        st.success("Login credentials have been sent to the encoder's email address!")
+                    if email_queued:
+                        st.success("Login credentials are being sent to the encoder's email address. Delivery status is shown in the 'Email Outbox' tab.")
                     else:
-                        st.warning("Account created successfully, but email delivery failed. Please share credentials manually.")
+                        st.warning("Account created successfully, but the credentials email could not be queued. Please share credentials manually.")
                         
                         # Show credentials when email fails
                         st.info("**Login Credentials (Share these manually):**")
@@ -895,8 +806,8 @@ elif selected_tab == "Manage Encoder Accounts":
                             if st.button("Yes, Delete", key=f"confirm_yes_{username}"):
                                 # Backup before deletion
                                 backup_deleted_user(username, user_data)
-                                del users[username]
-                                save_users(users)
+                                with user_directory.locked_users() as current_users:
+                                    current_users.pop(username, None)
                                 st.session_state[f"confirm_delete_{username}"] = False
                                 st.success(f"Account '{username}' deleted successfully!")
                                 st.rerun()
@@ -923,6 +834,14 @@ elif selected_tab == "Active Sessions":
         if st.button("Refresh Now"):
             st.rerun()
     
+    # Background cleanup of expired sessions in this server process
+    janitor = session_manager.janitor_metrics
+    if janitor['last_run_at']:
+        st.caption(
+            f"Expired session cleanup: {janitor['sessions_expired']} removed in {janitor['runs']} runs - "
+            f"last run {format_time_ago(janitor['last_run_at']).lower()}, took {janitor['last_duration_ms']:.1f} ms"
+        )
+    
     # Auto-refresh timer
     if auto_refresh:
         time.sleep(30)
@@ -981,6 +900,124 @@ elif selected_tab == "Active Sessions":
             else:
                 st.info("No users currently idle.")
 
+elif selected_tab == "Cross-Encoder Duplicates":
+    st.markdown("## Cross-Encoder Duplicates")
+    st.markdown("Find clients and businesses that were encoded by more than one encoder.")
+    
+    col1, col2 = st.columns([3, 1])
+    with col2:
+        # The check runs as a separate process; this page only shows its last stored result
+        resolution = entity_resolution_status()
+        if st.button("Run Now", type="primary", use_container_width=True, disabled=resolution['running']):
+            if start_entity_resolution():
+                resolution = entity_resolution_status()
+        if st.button("Refresh", use_container_width=True):
+            st.rerun()
+    
+    if resolution['running']:
+        st.info(f"Comparing records across all encoders (started {format_time_ago(resolution['started_at']).lower()}). Refresh to see the result when it finishes.")
+    elif resolution['error']:
+        st.error(f"Error running duplicate check: {resolution['error']}")
+    
+    result = load_entity_clusters()
+    with col1:
+        if result:
+            stats = result.get("stats", {})
+            st.caption(
+                f"Last run: {format_timestamp(datetime.fromisoformat(result['generated_at']).timestamp())} - "
+                f"{stats.get('records', 0)} records from {stats.get('encoders', 0)} encoders "
+                f"in {stats.get('total_seconds', 0)}s"
+            )
+        else:
+            st.caption("The duplicate check has not been run yet.")
+    
+    if result:
+        for kind, title in (("client", "Clients"), ("business", "Businesses")):
+            clusters = [cluster for cluster in result.get("clusters", []) if cluster["kind"] == kind]
+            st.markdown(f"### {title} ({len(clusters)})")
+            if not clusters:
+                st.info(f"No {title.lower()} were found encoded by more than one encoder.")
+                continue
+            st.dataframe(
+                [
+                    {
+                        "Group": group,
+                        "Score": cluster["score"],
+                        "Encoder": member["encoder"],
+                        "Sheet": member["sheet"],
+                        "Row": member["row"],
+                        "No": member["no"],
+                        "Name": member["label"]
+                    }
+                    for group, cluster in enumerate(clusters, 1)
+                    for member in cluster["members"]
+                ],
+                use_container_width=True,
+                hide_index=True
+            )
+
+elif selected_tab == "Email Outbox":
+    st.markdown("## Email Outbox")
+    st.markdown("Credentials emails are queued here and delivered in the background, with retries if sending fails.")
+    
+    counts = email_outbox.status_counts()
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Pending", counts["pending"] + counts["sending"])
+    with col2:
+        st.metric("Sent", counts["sent"])
+    with col3:
+        st.metric("Failed", counts["failed"])
+    with col4:
+        if st.button("Refresh Now", use_container_width=True):
+            st.rerun()
+    
+    # Background sender in this server process
+    sender = email_outbox.sender_metrics
+    if sender['last_batch_at']:
+        st.caption(
+            f"Email sender: {sender['sent']} sent in {sender['batches']} batches - "
+            f"last batch {format_time_ago(sender['last_batch_at']).lower()}, "
+            f"{sender['last_batch_size']} messages in {sender['last_batch_ms']:.0f} ms"
+        )
+    
+    if not email_outbox.is_configured():
+        st.warning("Email credentials not configured in Streamlit secrets. Queued emails will be retried until they are.")
+    
+    if counts["failed"]:
+        st.caption("Failed emails can be retried for a day; after that they are removed together with the credentials in them.")
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Retry Failed", type="primary", use_container_width=True):
+                email_outbox.retry_failed()
+                st.rerun()
+        with col2:
+            if st.button("Discard Failed", use_container_width=True):
+                email_outbox.discard_failed()
+                st.rerun()
+    
+    messages = email_outbox.list_messages()
+    if not messages:
+        st.info("No emails have been queued yet.")
+    else:
+        st.dataframe(
+            [
+                {
+                    "Queued": format_timestamp(message["created_at"]),
+                    "To": message["to"],
+                    "Subject": message["subject"],
+                    "Status": message["status"].title(),
+                    "Attempts": message["attempts"],
+                    "Next Attempt": format_timestamp(message["next_attempt_at"]) if message["status"] == "pending" else "",
+                    "Sent": format_timestamp(message["sent_at"]) if message["sent_at"] else "",
+                    "Last Error": message["last_error"] or ""
+                }
+                for message in messages
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
+
 elif selected_tab == "System Settings":
     st.markdown("## System Settings")
     st.markdown("Configure system settings and view administrative information.")
@@ -989,10 +1026,9 @@ elif selected_tab == "System Settings":
     
     with col1:
         st.markdown("### System Information")
-        users = load_users()
-        total_users = len(users)
-        encoder_count = len([u for u in users.values() if u.get("role") == "encoder"])
-        admin_count = len([u for u in users.values() if u.get("role") == "admin"])
+        total_users = user_directory.count_users()
+        encoder_count = user_directory.count_by_role("encoder")
+        admin_count = user_directory.count_by_role("admin")
         
         st.metric("Total Users", total_users)
         st.metric("Encoder Accounts", encoder_count)
@@ -1064,21 +1100,22 @@ elif selected_tab == "System Settings":
                         st.error(f"• {error}")
                 else:
                     # Verify current password
-                    users = load_users()
                     current_admin_username = auth_cookie.get("username")
+                    admin_data = user_directory.get_user(current_admin_username) if current_admin_username else None
                     
-                    if current_admin_username and current_admin_username in users:
-                        stored_password_hash = users[current_admin_username]["password"]
-                        current_password_hash = hash_password(current_password)
+                    if admin_data is not None:
+                        stored_password_hash = admin_data["password"]
                         
-                        if stored_password_hash == current_password_hash:
-                            # Update password
-                            users[current_admin_username]["password"] = hash_password(new_password)
-                            users[current_admin_username]["password_changed_at"] = time.time()
-                            users[current_admin_username]["password_changed_by"] = current_admin_username
+                        if verify_password(current_password, stored_password_hash):
+                            new_password_hash = hash_password(new_password)
+                            
+                            def set_new_password(user_data):
+                                user_data["password"] = new_password_hash
+                                user_data["password_changed_at"] = time.time()
+                                user_data["password_changed_by"] = current_admin_username
                             
-                            # Save changes
-                            save_users(users)
+                            # Save changes under the users.json lock
+                            user_directory.update_user(current_admin_username, set_new_password)
                             
                             st.success("Password changed successfully!")
                             st.info("Please use your new password for future logins.")
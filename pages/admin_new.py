@@ -2,19 +2,15 @@ import streamlit as st
 import time
 import json
 import os
-import hashlib
-import smtplib
 import secrets
 import string
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from datetime import datetime
-from utils.admin_config import get_default_admin_user, create_admin_if_not_exists, get_admin_credentials_display
+from utils.admin_config import create_admin_if_not_exists, get_admin_credentials_display
+from utils.credentials import hash_password
 from utils.secure_session import session_manager
-
-def hash_password(password):
-    """Hash password for security"""
-    return hashlib.sha256(password.encode()).hexdigest()
+from utils.email_outbox import email_outbox
+from utils.file_storage import locked_json
+from utils.user_directory import user_directory, load_users
 
 def generate_secure_password(length=12):
     """Generate a secure random password"""
@@ -22,23 +18,14 @@ def generate_secure_password(length=12):
     password = ''.join(secrets.choice(characters) for _ in range(length))
     return password
 
-def send_account_creation_email(user_data, password):
-    """Send email with account credentials to new encoder"""
+def queue_account_creation_email(user_data, password):
+    """Queue an email with account credentials to new encoder; it is sent in the background"""
     try:
-        # Email configuration - using Streamlit secrets
-        sender_email = st.secrets.get("email", {}).get("sender_email", "aaronmfbales@gmail.com")
-        sender_password = st.secrets.get("email", {}).get("sender_password", "")
         receiver_email = user_data.get('email', '')
         
-        if not receiver_email:
+        if not receiver_email or not email_outbox.is_configured():
             return False
         
-        # Create message
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = receiver_email
-        msg['Subject'] = "CPMS Account Created - Login Credentials"
-        
         # Email body
         body = f"""
         Dear {user_data.get('first_name', '')} {user_data.get('last_name', '')},
@@ -67,76 +54,26 @@ def send_account_creation_email(user_data, password):
         CPMS Administration Team
         """
         
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Create SMTP session
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        
-        # Send email
-        text = msg.as_string()
-        server.sendmail(sender_email, receiver_email, text)
-        server.quit()
-        
+        email_outbox.enqueue(receiver_email, "CPMS Account Created - Login Credentials", body)
         return True
     except Exception as e:
-        st.error(f"Failed to send account creation email: {str(e)}")
+        st.error(f"Failed to queue account creation email: {str(e)}")
         return False
 
-def load_users():
-    """Load users from JSON file"""
-    users_file = "data/users.json"
-    if os.path.exists(users_file):
-        try:
-            with open(users_file, 'r') as f:
-                users = json.load(f)
-                # Ensure admin user exists
-                created, message = create_admin_if_not_exists(users)
-                if created:
-                    save_users(users)
-                return users
-        except:
-            return get_default_admin_user()
-    else:
-        # Initialize with admin user
-        admin_user = get_default_admin_user()
-        save_users(admin_user)
-        return admin_user
-
-def save_users(users):
-    """Save users to JSON file"""
-    data_dir = "data"
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-    
-    users_file = os.path.join(data_dir, "users.json")
-    with open(users_file, 'w') as f:
-        json.dump(users, f, indent=2)
-
 def backup_deleted_user(username, user_data):
     """Backup deleted user data"""
     try:
         data_dir = "data"
         backup_file = os.path.join(data_dir, "deleted_users_backup.json")
         
-        # Load existing backup or create new one
-        if os.path.exists(backup_file):
-            with open(backup_file, 'r') as f:
-                backup_data = json.load(f)
-        else:
-            backup_data = {}
-        
-        # Add deleted user to backup with deletion timestamp
-        backup_data[username] = {
-            **user_data,
-            "deleted_at": time.time(),
-            "deleted_by": "admin"
-        }
-        
-        # Save backup
-        with open(backup_file, 'w') as f:
-            json.dump(backup_data, f, indent=2)
+        # Load existing backup or create new one, and save it back under the file lock
+        with locked_json(backup_file, {}, indent=2) as backup_data:
+            # Add deleted user to backup with deletion timestamp
+            backup_data[username] = {
+                **user_data,
+                "deleted_at": time.time(),
+                "deleted_by": "admin"
+            }
         
         return True
     except Exception as e:
@@ -159,8 +96,6 @@ def load_deleted_users_backup():
 def restore_user_from_backup(username, backup_data):
     """Restore user from backup"""
     try:
-        users = load_users()
-        
         # Get user data from backup
         user_data = backup_data[username].copy()
         
@@ -169,8 +104,8 @@ def restore_user_from_backup(username, backup_data):
         user_data.pop("deleted_by", None)
         
         # Add back to active users
-        users[username] = user_data
-        save_users(users)
+        with user_directory.locked_users() as users:
+            users[username] = user_data
         
         return True
     except Exception as e:
@@ -185,56 +120,37 @@ def get_active_users():
     """Get list of currently active/online users"""
     try:
         active_users = []
-        sessions_dir = "data/sessions"
         current_time = time.time()
         
-        if not os.path.exists(sessions_dir):
-            return []
-        
-        # Load all users to get user details
-        users = load_users()
+        # Sessions active within the last 30 minutes, most recent first
+        for browser_id, session in session_manager.recent_sessions(current_time - 1800):
+            username = session.get('username')
+            user_info = user_directory.get_user(username) if username else None
+            if user_info is not None:
+                time_diff = current_time - session['timestamp']
+                
+                # Determine status based on last activity
+                if time_diff <= 300:  # 5 minutes - Online
+                    status = 'online'
+                    status_text = 'Online'
+                elif time_diff <= 900:  # 15 minutes - Away
+                    status = 'away' 
+                    status_text = 'Away'
+                else:  # Up to 30 minutes - Idle
+                    status = 'idle'
+                    status_text = 'Idle'
+                
+                active_users.append({
+                    'username': username,
+                    'full_name': f"{user_info.get('first_name', '')} {user_info.get('last_name', '')}".strip(),
+                    'role': user_info.get('role', 'encoder'),
+                    'status': status,
+                    'status_text': status_text,
+                    'last_activity': session['timestamp'],
+                    'browser_id': session.get('browser_id') or browser_id,
+                    'session_start': session.get('created_at') or 'unknown'
+                })
         
-        for filename in os.listdir(sessions_dir):
-            if filename.startswith('session_') and filename.endswith('.json'):
-                filepath = os.path.join(sessions_dir, filename)
-                try:
-                    with open(filepath, 'r') as f:
-                        session_data = json.load(f)
-                    
-                    # Check if session is active (within last 30 minutes for online status)
-                    time_diff = current_time - session_data.get('timestamp', 0)
-                    
-                    if time_diff <= 1800:  # 30 minutes
-                        username = session_data.get('username')
-                        if username and username in users:
-                            user_info = users[username]
-                            
-                            # Determine status based on last activity
-                            if time_diff <= 300:  # 5 minutes - Online
-                                status = 'online'
-                                status_text = 'Online'
-                            elif time_diff <= 900:  # 15 minutes - Away
-                                status = 'away' 
-                                status_text = 'Away'
-                            else:  # Up to 30 minutes - Idle
-                                status = 'idle'
-                                status_text = 'Idle'
-                            
-                            active_users.append({
-                                'username': username,
-                                'full_name': f"{user_info.get('first_name', '')} {user_info.get('last_name', '')}".strip(),
-                                'role': user_info.get('role', 'encoder'),
-                                'status': status,
-                                'status_text': status_text,
-                                'last_activity': session_data.get('timestamp', 0),
-                                'browser_id': session_data.get('browser_id', 'unknown'),
-                                'session_start': session_data.get('created_at', 'unknown')
-                            })
-                except:
-                    continue
-        
-        # Sort by last activity (most recent first)
-        active_users.sort(key=lambda x: x['last_activity'], reverse=True)
         return active_users
         
     except Exception as e:
@@ -338,9 +254,8 @@ with st.sidebar:
     st.divider()
     
     # Quick Stats
-    users = load_users()
     active_users = get_active_users()
-    total_encoders = len([u for u in users.values() if u.get("role") == "encoder"])
+    total_encoders = user_directory.count_by_role("encoder")
     online_count = len([u for u in active_users if u['status'] == 'online'])
     
     st.markdown("## 📈 Quick Stats")
@@ -422,14 +337,11 @@ if selected_tab == "Create Encoder Account":
                     errors.append("❌ Passwords do not match")
             
             # Check if username or email already exists
-            existing_users = load_users()
-            if username in existing_users:
+            if user_directory.get_user(username) is not None:
                 errors.append("❌ Username already exists")
             
-            for user_data in existing_users.values():
-                if user_data.get("email") == email:
-                    errors.append("❌ Email already registered")
-                    break
+            if email and user_directory.find_by_email(email) is not None:
+                errors.append("❌ Email already registered")
             
             if errors:
                 for error in errors:
@@ -456,9 +368,15 @@ if selected_tab == "Create Encoder Account":
                     "contact_number": contact_number
                 }
                 
-                # Save to users database
-                existing_users[username] = new_encoder
-                save_users(existing_users)
+                # Save to users database, checking the username again under the users.json lock
+                with user_directory.locked_users() as users:
+                    username_taken = username in users
+                    if not username_taken:
+                        users[username] = new_encoder
+                
+                if username_taken:
+                    st.error("❌ Username already exists")
+                    st.stop()
                 
                 # Success message
                 st.success(f"✅ Encoder account '{username}' created successfully!")
@@ -468,13 +386,12 @@ if selected_tab == "Create Encoder Account":
                 
                 # Send email if requested
                 if send_email:
-                    with st.spinner("Sending credentials via email..."):
-                        email_sent = send_account_creation_email(new_encoder, password)
+                    email_queued = queue_account_creation_email(new_encoder, password)
                     
-                    if email_sent:
-                        st.success("📧 Credentials sent via email successfully!")
+                    if email_queued:
+                        st.success("📧 Credentials email queued for delivery!")
                     else:
-                        st.error("❌ Failed to send email. Please share credentials manually.")
+                        st.error("❌ Failed to queue email. Please share credentials manually.")
                 
                 st.markdown("---")
                 st.markdown("**Next Steps:**")
@@ -541,19 +458,19 @@ elif selected_tab == "Manage Encoder Accounts":
                     # Reset Password
                     if st.button("🔒 Reset Password", key=f"reset_pwd_{username}"):
                         new_password = generate_secure_password()
-                        users[username]["password"] = hash_password(new_password)
-                        save_users(users)
+                        new_password_hash = hash_password(new_password)
+                        user_directory.update_user(username, lambda user_data: user_data.update(password=new_password_hash))
                         
                         st.success(f"Password reset successfully!")
                         st.info(f"New password: `{new_password}`")
                         
                         # Optionally send email
                         if st.button("📧 Email New Password", key=f"email_pwd_{username}"):
-                            email_sent = send_account_creation_email(user_data, new_password)
-                            if email_sent:
-                                st.success("Password sent via email!")
+                            email_queued = queue_account_creation_email(user_data, new_password)
+                            if email_queued:
+                                st.success("Password email queued for delivery!")
                             else:
-                                st.error("Failed to send email")
+                                st.error("Failed to queue email")
                     
                     # Delete Account (with confirmation)
                     if st.button("🗑️ Delete Account", key=f"delete_{username}", type="secondary"):
@@ -568,8 +485,8 @@ elif selected_tab == "Manage Encoder Accounts":
                             if st.button("✅ Yes, Delete", key=f"confirm_yes_{username}"):
                                 # Backup before deletion
                                 backup_deleted_user(username, user_data)
-                                del users[username]
-                                save_users(users)
+                                with user_directory.locked_users() as current_users:
+                                    current_users.pop(username, None)
                                 st.session_state[f"confirm_delete_{username}"] = False
                                 st.success(f"Account '{username}' deleted successfully!")
                                 st.rerun()
@@ -662,10 +579,9 @@ elif selected_tab == "System Settings":
     
     with col1:
         st.markdown("### 📊 System Information")
-        users = load_users()
-        total_users = len(users)
-        encoder_count = len([u for u in users.values() if u.get("role") == "encoder"])
-        admin_count = len([u for u in users.values() if u.get("role") == "admin"])
+        total_users = user_directory.count_users()
+        encoder_count = user_directory.count_by_role("encoder")
+        admin_count = user_directory.count_by_role("admin")
         
         st.metric("Total Users", total_users)
         st.metric("Encoder Accounts", encoder_count)
@@ -685,15 +601,15 @@ elif selected_tab == "System Settings":
         if st.button("🔄 Reset Admin Account", help="Recreate admin account with current settings"):
             try:
                 # Remove existing admin and recreate
-                users = load_users()
-                admin_keys_to_remove = [k for k, v in users.items() if v.get("role") == "admin"]
-                for key in admin_keys_to_remove:
-                    del users[key]
-                
-                # Add new admin
-                created, message = create_admin_if_not_exists(users)
+                with user_directory.locked_users() as users:
+                    admin_keys_to_remove = [k for k, v in users.items() if v.get("role") == "admin"]
+                    admin_backup = {key: users.pop(key) for key in admin_keys_to_remove}
+                    
+                    # Add new admin
+                    created, message = create_admin_if_not_exists(users)
+                    if not created:
+                        users.update(admin_backup)
                 if created:
-                    save_users(users)
                     st.success("✅ Admin account reset successfully!")
                     st.rerun()
                 else:
@@ -4,12 +4,8 @@ Centralized admin account management with secure defaults
 """
 
 import streamlit as st
-import hashlib
 import time
-
-def hash_password(password):
-    """Hash password for security"""
-    return hashlib.sha256(password.encode()).hexdigest()
+from utils.credentials import hash_password
 
 def get_admin_config():
     """Get admin configuration from secrets or use secure defaults"""
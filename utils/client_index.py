@@ -0,0 +1,59 @@
+"""
+Lookup index over a user's Client sheet for auto-filling linked sheets.
+Maps a client number ("No") and a Client ID to the client's row, so forms that
+take a client number can fetch the client without loading and scanning the sheet.
+"""
+
+class ClientLookupIndex:
+    """Client number and Client ID -> Client row, for one user"""
+    
+    # Only the Client sheet needs to be loaded to build the index
+    SHEETS = ("Client",)
+    
+    def __init__(self):
+        self.version = None     # storage data version the index reflects
+        self.columns = []
+        self.rows = []
+        self.by_number = {}     # str(No) -> row position
+        self.by_client_id = {}  # Client ID -> row position
+    
+    def _index_row(self, row):
+        position = len(self.rows)
+        self.rows.append(list(row))
+        record = dict(zip(self.columns, row))
+        # The first row with a number wins, as with a top-down scan of the sheet
+        number = record.get("No")
+        if number is not None and str(number).strip():
+            self.by_number.setdefault(str(number).strip(), position)
+        client_id = record.get("Client ID")
+        if client_id is not None and str(client_id).strip():
+            self.by_client_id.setdefault(str(client_id).strip(), position)
+    
+    def index_sheet(self, sheet_name, data, columns):
+        """Index (or re-index) the Client sheet; other sheets are ignored"""
+        if sheet_name != "Client":
+            return
+        self.columns = list(columns)
+        self.rows = []
+        self.by_number = {}
+        self.by_client_id = {}
+        for row in data:
+            self._index_row(row)
+    
+    def add_rows(self, sheet_name, rows, columns):
+        """Index rows appended to the end of the Client sheet"""
+        if sheet_name != "Client":
+            return
+        self.columns = list(columns)
+        for row in rows:
+            self._index_row(row)
+    
+    def find(self, client_key):
+        """Get the client with a client number or Client ID as {column: value}, or {}"""
+        key = str(client_key).strip()
+        position = self.by_number.get(key)
+        if position is None:
+            position = self.by_client_id.get(key)
+        if position is None:
+            return {}
+        return dict(zip(self.columns, self.rows[position]))
@@ -0,0 +1,99 @@
+"""
+Password hashing and verification for CPMS accounts.
+Passwords are hashed with bcrypt at a tunable cost. Accounts created before bcrypt
+store an unsalted SHA-256 hex digest; those still verify and are rehashed with
+bcrypt after the next successful login. bcrypt work runs on a small bounded thread
+pool (bcrypt releases the GIL), so a burst of logins queues there instead of
+running one bcrypt per Streamlit script thread at once.
+"""
+
+import os
+import hmac
+import hashlib
+import threading
+import concurrent.futures
+
+try:
+    import bcrypt
+    BCRYPT_AVAILABLE = True
+except ImportError:
+    BCRYPT_AVAILABLE = False
+
+# bcrypt cost factor: each step doubles the time per hash (12 is about 0.2s per core)
+BCRYPT_ROUNDS = int(os.getenv("CPMS_BCRYPT_ROUNDS", "12"))
+# Hashes computed at the same time, across all sessions in this process
+HASH_WORKERS = int(os.getenv("CPMS_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+# bcrypt only uses the first 72 bytes of a password
+BCRYPT_MAX_BYTES = 72
+
+HASH_THREAD_PREFIX = "password-hash"
+
+_executor = concurrent.futures.ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix=HASH_THREAD_PREFIX)
+
+def _run(function, *args):
+    """Run bcrypt work on the pool and wait for it; inline if already on a pool thread"""
+    if threading.current_thread().name.startswith(HASH_THREAD_PREFIX):
+        return function(*args)
+    return _executor.submit(function, *args).result()
+
+def is_legacy_hash(stored_hash):
+    """Check if a stored hash is an unsalted SHA-256 hex digest from before bcrypt"""
+    return len(stored_hash) == 64 and all(char in "0123456789abcdef" for char in stored_hash)
+
+def _legacy_hash(password):
+    return hashlib.sha256(password.encode()).hexdigest()
+
+def _password_bytes(password):
+    return password.encode()[:BCRYPT_MAX_BYTES]
+
+def _bcrypt_hash(password, rounds):
+    return bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt(rounds)).decode()
+
+def _bcrypt_check(password, stored_hash):
+    return bcrypt.checkpw(_password_bytes(password), stored_hash.encode())
+
+def hash_password(password, rounds=None):
+    """Hash a password for storage (bcrypt, or SHA-256 if bcrypt is not installed)"""
+    if not BCRYPT_AVAILABLE:
+        return _legacy_hash(password)
+    return _run(_bcrypt_hash, password, rounds or BCRYPT_ROUNDS)
+
+def verify_password(password, stored_hash):
+    """Check a password against a stored bcrypt or legacy SHA-256 hash"""
+    if not stored_hash:
+        return False
+    if is_legacy_hash(stored_hash):
+        return hmac.compare_digest(_legacy_hash(password), stored_hash)
+    if not BCRYPT_AVAILABLE:
+        return False
+    try:
+        return _run(_bcrypt_check, password, stored_hash)
+    except ValueError:
+        # Not a bcrypt hash
+        return False
+
+def needs_rehash(stored_hash, rounds=None):
+    """Check if a stored hash is legacy SHA-256 or bcrypt at a different cost"""
+    if not BCRYPT_AVAILABLE:
+        return False
+    if is_legacy_hash(stored_hash):
+        return True
+    try:
+        return int(stored_hash.split("$")[2]) != (rounds or BCRYPT_ROUNDS)
+    except (IndexError, ValueError):
+        return False
+
+def rehash_in_background(password, stored_hash, save_hash):
+    """
+    After a successful login, hash the password again on the pool if its stored
+    hash needs it, and pass the new hash to save_hash. Returns the future, or None.
+    """
+    if not needs_rehash(stored_hash):
+        return None
+    
+    def rehash():
+        try:
+            save_hash(_bcrypt_hash(password, BCRYPT_ROUNDS))
+        except Exception as e:
+            print(f"Password rehash failed: {e}")
+    return _executor.submit(rehash)
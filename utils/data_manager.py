@@ -1,40 +1,617 @@
 import streamlit as st
 import pandas as pd
 import os
+import sys
+import shutil
+import hashlib
+import sqlite3
+import threading
 from datetime import datetime
 import json
+from utils.file_storage import atomic_write_json, atomic_write_bytes, file_lock, read_json
+from utils.search_index import UserSearchIndex
+from utils.duplicates import DuplicateIndex
+from utils.client_index import ClientLookupIndex
+
+# Sheets a user can store data in
+SHEET_NAMES = [
+    "Business Owner", "Business Profile", "Client", "Business Registration",
+    "Business Financial Structure", "Market Import", "Product Service Lines",
+    "Employment Statistics", "Assistance", "Market Export", "Jobs Generated",
+    "Business Contact Information", "Market Domestic"
+]
+
+# Storage backend for user sheets: "json" (one file per user and sheet),
+# "journal" (JSON snapshots plus an append-only change log) or "sqlite"
+STORAGE_BACKEND = os.getenv("CPMS_STORAGE_BACKEND", "json")
+SQLITE_DB_FILE = "cpms.db"
+
+def apply_row_changes(data, updated_rows=None, added_rows=None, deleted_rows=None):
+    """
+    Apply row-level changes to a list of rows and return the new list.
+    updated_rows maps row index -> new row and deleted_rows lists row indices, both
+    relative to the rows before the change; added_rows are appended at the end.
+    """
+    rows = list(data)
+    for row_index, row in (updated_rows or {}).items():
+        rows[row_index] = row
+    for row_index in sorted(set(deleted_rows or []), reverse=True):
+        del rows[row_index]
+    rows.extend(added_rows or [])
+    return rows
+
+class JSONStorageBackend:
+    """Stores each user's sheet as a JSON file in data/user_<username>/"""
+    
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+    
+    def get_user_dir(self, username):
+        """Get user-specific data directory path"""
+        return os.path.join(self.data_dir, f"user_{username}")
+    
+    def get_user_data_file(self, username, sheet_name):
+        """Get user-specific data file path"""
+        user_dir = self.get_user_dir(username)
+        if not os.path.exists(user_dir):
+            os.makedirs(user_dir)
+        return os.path.join(user_dir, f"{sheet_name}.json")
+    
+    def save_sheet(self, username, sheet_name, data, columns, last_updated):
+        """Write a whole sheet"""
+        file_path = self.get_user_data_file(username, sheet_name)
+        user_data = {
+            "columns": columns,
+            "data": data,
+            "last_updated": last_updated,
+            "user": username
+        }
+        atomic_write_json(file_path, user_data, indent=2, ensure_ascii=False)
+    
+    def save_rows(self, username, sheet_name, columns, updated_rows, added_rows, deleted_rows, last_updated):
+        """Apply row-level changes; JSON files can only be rewritten whole"""
+        with file_lock(self.get_user_data_file(username, sheet_name)):
+            data, _ = self.load_sheet(username, sheet_name)
+            data = apply_row_changes(data, updated_rows, added_rows, deleted_rows)
+            self.save_sheet(username, sheet_name, data, columns, last_updated)
+    
+    def load_sheet(self, username, sheet_name):
+        """Read a whole sheet as (data, columns)"""
+        file_path = os.path.join(self.get_user_dir(username), f"{sheet_name}.json")
+        if not os.path.exists(file_path):
+            return [], []
+        
+        with open(file_path, 'r', encoding='utf-8') as f:
+            user_data = json.load(f)
+        return user_data.get("data", []), user_data.get("columns", [])
+    
+    def iter_sheet(self, username, sheet_name):
+        """Read a sheet as (columns, row iterator); JSON files are parsed whole"""
+        data, columns = self.load_sheet(username, sheet_name)
+        return columns, iter(data)
+    
+    def load_sheet_info(self, username, sheet_name):
+        """Read a sheet as (data, columns, last_updated)"""
+        file_path = os.path.join(self.get_user_dir(username), f"{sheet_name}.json")
+        with open(file_path, 'r', encoding='utf-8') as f:
+            user_data = json.load(f)
+        return user_data.get("data", []), user_data.get("columns", []), user_data.get("last_updated")
+    
+    def list_sheets(self, username):
+        """List the sheet names a user has stored"""
+        user_dir = self.get_user_dir(username)
+        if not os.path.isdir(user_dir):
+            return []
+        return [filename[:-len(".json")] for filename in os.listdir(user_dir) if filename.endswith(".json")]
+    
+    def list_users(self):
+        """List usernames that have a data directory"""
+        if not os.path.exists(self.data_dir):
+            return []
+        return [
+            entry[len("user_"):] for entry in os.listdir(self.data_dir)
+            if entry.startswith("user_") and os.path.isdir(os.path.join(self.data_dir, entry))
+        ]
+    
+    def has_rows(self, username, sheet_name):
+        """Check if a stored sheet has at least one row"""
+        try:
+            data, _ = self.load_sheet(username, sheet_name)
+            return len(data) > 0
+        except Exception:
+            return False
+    
+    def data_version(self, username):
+        """Get a token that changes whenever any of a user's sheets is saved"""
+        user_dir = self.get_user_dir(username)
+        if not os.path.isdir(user_dir):
+            return ""
+        
+        files = sorted(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in os.scandir(user_dir) if entry.name.endswith((".json", ".journal"))
+        )
+        return hashlib.sha1(repr(files).encode("utf-8")).hexdigest()
+    
+    def rename_user(self, old_username, new_username):
+        """Move a user's data directory to a new username"""
+        old_folder = self.get_user_dir(old_username)
+        new_folder = self.get_user_dir(new_username)
+        
+        if os.path.exists(old_folder):
+            # Create new folder if it doesn't exist
+            if not os.path.exists(new_folder):
+                os.makedirs(new_folder)
+            
+            # Move all files from old folder to new folder
+            for filename in os.listdir(old_folder):
+                shutil.move(os.path.join(old_folder, filename), os.path.join(new_folder, filename))
+            
+            # Remove old folder
+            os.rmdir(old_folder)
+
+class JournaledStorageBackend(JSONStorageBackend):
+    """
+    Stores each sheet as a JSON snapshot plus an append-only journal of row changes.
+    Saves append one small record to <Sheet>.journal; readers replay the journal on
+    top of <Sheet>.json, and the journal is folded into a fresh snapshot once it grows
+    past COMPACT_RECORDS records or COMPACT_BYTES bytes.
+    """
+    
+    COMPACT_RECORDS = 200
+    COMPACT_BYTES = 1024 * 1024
+    
+    def __init__(self, data_dir):
+        super().__init__(data_dir)
+        # journal path -> (file identity, last sequence number, records since last snapshot)
+        self._journal_state = {}
+    
+    def get_user_journal_file(self, username, sheet_name):
+        """Get user-specific journal file path"""
+        return os.path.join(self.get_user_dir(username), f"{sheet_name}.journal")
+    
+    @staticmethod
+    def encode_record(record):
+        """Serialize a journal record as one line"""
+        return (json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=str) + "\n").encode("utf-8")
+    
+    @staticmethod
+    def file_identity(path):
+        """Identify a file version by inode, size and modification time"""
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    
+    def read_journal(self, journal_path):
+        """Read the journal records in order, ignoring a partial last line"""
+        if not os.path.exists(journal_path):
+            return []
+        with open(journal_path, 'rb') as f:
+            content = f.read()
+        
+        records = []
+        for line in content[:content.rfind(b"\n") + 1].splitlines():
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+        return records
+    
+    def read_snapshot(self, username, sheet_name):
+        """Read the snapshot file as a dict, or None if the sheet has no snapshot"""
+        file_path = os.path.join(self.get_user_dir(username), f"{sheet_name}.json")
+        return read_json(file_path)
+    
+    def write_snapshot(self, username, sheet_name, data, columns, last_updated, journal_seq):
+        """Atomically replace the snapshot file"""
+        file_path = self.get_user_data_file(username, sheet_name)
+        user_data = {
+            "columns": columns,
+            "data": data,
+            "last_updated": last_updated,
+            "user": username,
+            "journal_seq": journal_seq
+        }
+        atomic_write_json(file_path, user_data, indent=2, ensure_ascii=False)
+    
+    def journal_state(self, username, sheet_name):
+        """
+        Get (file identity, last sequence number, records since last snapshot) for a
+        journal. Call with the journal lock held: a partial last line left by an
+        interrupted write is cut off here so the next append starts on a clean line.
+        """
+        journal_path = self.get_user_journal_file(username, sheet_name)
+        identity = self.file_identity(journal_path)
+        state = self._journal_state.get(journal_path)
+        if state is not None and state[0] == identity:
+            return state
+        
+        if identity is not None:
+            with open(journal_path, 'r+b') as f:
+                content = f.read()
+                complete = content.rfind(b"\n") + 1
+                if complete < len(content):
+                    f.truncate(complete)
+        
+        records = self.read_journal(journal_path)
+        if records:
+            last_seq = records[-1]["seq"]
+        else:
+            # No journal yet: continue from the snapshot, which may predate journaling
+            snapshot = self.read_snapshot(username, sheet_name) or {}
+            last_seq = snapshot.get("journal_seq", 0)
+        pending = sum(1 for record in records if record.get("op") == "rows")
+        state = (self.file_identity(journal_path), last_seq, pending)
+        self._journal_state[journal_path] = state
+        return state
+    
+    def append_record(self, username, sheet_name, record):
+        """Append a record to the journal and flush it to disk. Returns its sequence number."""
+        journal_path = self.get_user_journal_file(username, sheet_name)
+        self.get_user_data_file(username, sheet_name)  # makes sure the user directory exists
+        with file_lock(journal_path):
+            _, last_seq, pending = self.journal_state(username, sheet_name)
+            
+            record = dict(record, seq=last_seq + 1)
+            with open(journal_path, 'ab') as f:
+                f.write(self.encode_record(record))
+                f.flush()
+                os.fsync(f.fileno())
+            
+            if record.get("op") == "rows":
+                pending += 1
+            self._journal_state[journal_path] = (self.file_identity(journal_path), record["seq"], pending)
+        return record["seq"]
+    
+    def replay(self, username, sheet_name):
+        """Rebuild a sheet as (data, columns, last_updated) from its snapshot and journal"""
+        journal_path = self.get_user_journal_file(username, sheet_name)
+        with file_lock(journal_path, shared=True):
+            snapshot = self.read_snapshot(username, sheet_name)
+            records = self.read_journal(journal_path)
+        if snapshot is None and not records:
+            return [], [], None
+        
+        snapshot = snapshot or {}
+        data = snapshot.get("data", [])
+        columns = snapshot.get("columns", [])
+        last_updated = snapshot.get("last_updated")
+        snapshot_seq = snapshot.get("journal_seq", 0)
+        
+        for record in records:
+            # Records already folded into the snapshot are skipped, so a crash between
+            # writing a snapshot and resetting the journal never applies a change twice
+            if record.get("op") != "rows" or record["seq"] <= snapshot_seq:
+                continue
+            updated_rows = {int(row_index): row for row_index, row in record.get("updated", {}).items()}
+            data = apply_row_changes(data, updated_rows, record.get("added"), record.get("deleted"))
+            columns = record.get("columns", columns)
+            last_updated = record.get("last_updated", last_updated)
+        return data, columns, last_updated
+    
+    def write_compacted(self, username, sheet_name, data, columns, last_updated):
+        """Write a fresh snapshot and reset the journal to a marker record"""
+        journal_path = self.get_user_journal_file(username, sheet_name)
+        self.get_user_data_file(username, sheet_name)
+        with file_lock(journal_path):
+            _, last_seq, _ = self.journal_state(username, sheet_name)
+            
+            seq = last_seq + 1
+            self.write_snapshot(username, sheet_name, data, columns, last_updated, seq)
+            atomic_write_bytes(journal_path, self.encode_record({"op": "snapshot", "seq": seq}))
+            self._journal_state[journal_path] = (self.file_identity(journal_path), seq, 0)
+    
+    def compact(self, username, sheet_name):
+        """Fold a sheet's journal into a fresh snapshot"""
+        with file_lock(self.get_user_journal_file(username, sheet_name)):
+            data, columns, last_updated = self.replay(username, sheet_name)
+            self.write_compacted(username, sheet_name, data, columns, last_updated)
+    
+    def compact_all(self):
+        """Fold every journal with pending records into its snapshot. Returns the number of sheets compacted."""
+        compacted = 0
+        for username in self.list_users():
+            for sheet_name in self.list_sheets(username):
+                with file_lock(self.get_user_journal_file(username, sheet_name)):
+                    _, _, pending = self.journal_state(username, sheet_name)
+                    if pending:
+                        self.compact(username, sheet_name)
+                        compacted += 1
+        return compacted
+    
+    def save_sheet(self, username, sheet_name, data, columns, last_updated):
+        """Write a whole sheet as a new snapshot"""
+        self.write_compacted(username, sheet_name, data, columns, last_updated)
+    
+    def save_rows(self, username, sheet_name, columns, updated_rows, added_rows, deleted_rows, last_updated):
+        """Append row-level changes to the journal, compacting it once it grows too large"""
+        record = {
+            "op": "rows",
+            "columns": columns,
+            "updated": {str(row_index): row for row_index, row in updated_rows.items()},
+            "added": list(added_rows),
+            "deleted": sorted(set(deleted_rows)),
+            "last_updated": last_updated
+        }
+        with file_lock(self.get_user_journal_file(username, sheet_name)):
+            self.append_record(username, sheet_name, record)
+            identity, _, pending = self.journal_state(username, sheet_name)
+            if pending >= self.COMPACT_RECORDS or identity[1] >= self.COMPACT_BYTES:
+                self.compact(username, sheet_name)
+    
+    def load_sheet(self, username, sheet_name):
+        """Read a whole sheet as (data, columns)"""
+        data, columns, _ = self.replay(username, sheet_name)
+        return data, columns
+    
+    def load_sheet_info(self, username, sheet_name):
+        """Read a sheet as (data, columns, last_updated)"""
+        return self.replay(username, sheet_name)
+    
+    def list_sheets(self, username):
+        """List the sheet names a user has stored, including sheets not yet compacted"""
+        user_dir = self.get_user_dir(username)
+        if not os.path.isdir(user_dir):
+            return []
+        return sorted({
+            os.path.splitext(filename)[0] for filename in os.listdir(user_dir)
+            if filename.endswith((".json", ".journal"))
+        })
+    
+    def rename_user(self, old_username, new_username):
+        """Move a user's data directory, journals included, to a new username"""
+        super().rename_user(old_username, new_username)
+        self._journal_state.clear()
+
+class SQLiteStorageBackend:
+    """Stores user sheets as rows in a SQLite database running in WAL mode"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sheets (
+            username TEXT NOT NULL,
+            sheet_name TEXT NOT NULL,
+            columns TEXT NOT NULL,
+            last_updated TEXT,
+            PRIMARY KEY (username, sheet_name)
+        );
+        CREATE TABLE IF NOT EXISTS sheet_rows (
+            username TEXT NOT NULL,
+            sheet_name TEXT NOT NULL,
+            row_index INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (username, sheet_name, row_index)
+        ) WITHOUT ROWID;
+    """
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self.connect().executescript(self.SCHEMA)
+    
+    def connect(self):
+        """Get this thread's database connection"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+    
+    @staticmethod
+    def encode_row(row):
+        """Serialize a row for storage"""
+        return json.dumps(row, ensure_ascii=False, separators=(',', ':'), default=str)
+    
+    def save_sheet(self, username, sheet_name, data, columns, last_updated):
+        """Write a sheet, touching only rows that changed since the last save"""
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO sheets (username, sheet_name, columns, last_updated) VALUES (?, ?, ?, ?)",
+                (username, sheet_name, json.dumps(columns, ensure_ascii=False), last_updated)
+            )
+            stored = dict(connection.execute(
+                "SELECT row_index, data FROM sheet_rows WHERE username = ? AND sheet_name = ?",
+                (username, sheet_name)
+            ))
+            
+            changed = []
+            for row_index, row in enumerate(data):
+                encoded = self.encode_row(row)
+                if stored.get(row_index) != encoded:
+                    changed.append((username, sheet_name, row_index, encoded))
+            connection.executemany(
+                "INSERT OR REPLACE INTO sheet_rows (username, sheet_name, row_index, data) VALUES (?, ?, ?, ?)",
+                changed
+            )
+            if len(stored) > len(data):
+                connection.execute(
+                    "DELETE FROM sheet_rows WHERE username = ? AND sheet_name = ? AND row_index >= ?",
+                    (username, sheet_name, len(data))
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+    
+    def save_rows(self, username, sheet_name, columns, updated_rows, added_rows, deleted_rows, last_updated):
+        """Apply row-level changes, writing only the affected rows"""
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO sheets (username, sheet_name, columns, last_updated) VALUES (?, ?, ?, ?)",
+                (username, sheet_name, json.dumps(columns, ensure_ascii=False), last_updated)
+            )
+            connection.executemany(
+                "INSERT OR REPLACE INTO sheet_rows (username, sheet_name, row_index, data) VALUES (?, ?, ?, ?)",
+                [(username, sheet_name, row_index, self.encode_row(row)) for row_index, row in updated_rows.items()]
+            )
+            
+            deleted_rows = sorted(set(deleted_rows))
+            if deleted_rows:
+                connection.executemany(
+                    "DELETE FROM sheet_rows WHERE username = ? AND sheet_name = ? AND row_index = ?",
+                    [(username, sheet_name, row_index) for row_index in deleted_rows]
+                )
+                # Close the gaps left by deleted rows, moving rows down in ascending order
+                following = connection.execute(
+                    "SELECT row_index FROM sheet_rows WHERE username = ? AND sheet_name = ? AND row_index > ? "
+                    "ORDER BY row_index",
+                    (username, sheet_name, deleted_rows[0])
+                ).fetchall()
+                shift = 0
+                moves = []
+                for (row_index,) in following:
+                    while shift < len(deleted_rows) and deleted_rows[shift] < row_index:
+                        shift += 1
+                    moves.append((row_index - shift, username, sheet_name, row_index))
+                connection.executemany(
+                    "UPDATE sheet_rows SET row_index = ? WHERE username = ? AND sheet_name = ? AND row_index = ?",
+                    moves
+                )
+            
+            if added_rows:
+                (row_count,) = connection.execute(
+                    "SELECT COUNT(*) FROM sheet_rows WHERE username = ? AND sheet_name = ?",
+                    (username, sheet_name)
+                ).fetchone()
+                connection.executemany(
+                    "INSERT INTO sheet_rows (username, sheet_name, row_index, data) VALUES (?, ?, ?, ?)",
+                    [(username, sheet_name, row_count + offset, self.encode_row(row))
+                     for offset, row in enumerate(added_rows)]
+                )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+    
+    def load_sheet(self, username, sheet_name):
+        """Read a whole sheet as (data, columns)"""
+        connection = self.connect()
+        sheet = connection.execute(
+            "SELECT columns FROM sheets WHERE username = ? AND sheet_name = ?",
+            (username, sheet_name)
+        ).fetchone()
+        if sheet is None:
+            return [], []
+        
+        rows = connection.execute(
+            "SELECT data FROM sheet_rows WHERE username = ? AND sheet_name = ? ORDER BY row_index",
+            (username, sheet_name)
+        )
+        return [json.loads(data) for (data,) in rows], json.loads(sheet[0])
+    
+    def iter_sheet(self, username, sheet_name):
+        """Read a sheet as (columns, row iterator), decoding rows as they are consumed"""
+        connection = self.connect()
+        sheet = connection.execute(
+            "SELECT columns FROM sheets WHERE username = ? AND sheet_name = ?",
+            (username, sheet_name)
+        ).fetchone()
+        if sheet is None:
+            return [], iter(())
+        
+        rows = connection.execute(
+            "SELECT data FROM sheet_rows WHERE username = ? AND sheet_name = ? ORDER BY row_index",
+            (username, sheet_name)
+        )
+        return json.loads(sheet[0]), (json.loads(data) for (data,) in rows)
+    
+    def list_users(self):
+        """List usernames that have stored sheets"""
+        rows = self.connect().execute("SELECT DISTINCT username FROM sheets ORDER BY username")
+        return [username for (username,) in rows]
+    
+    def list_sheets(self, username):
+        """List the sheet names a user has stored"""
+        rows = self.connect().execute("SELECT sheet_name FROM sheets WHERE username = ? ORDER BY sheet_name", (username,))
+        return [sheet_name for (sheet_name,) in rows]
+    
+    def has_rows(self, username, sheet_name):
+        """Check if a stored sheet has at least one row"""
+        row = self.connect().execute(
+            "SELECT 1 FROM sheet_rows WHERE username = ? AND sheet_name = ? LIMIT 1",
+            (username, sheet_name)
+        ).fetchone()
+        return row is not None
+    
+    def data_version(self, username):
+        """Get a token that changes whenever any of a user's sheets is saved"""
+        rows = self.connect().execute(
+            "SELECT sheet_name, last_updated FROM sheets WHERE username = ? ORDER BY sheet_name",
+            (username,)
+        ).fetchall()
+        return hashlib.sha1(repr(rows).encode("utf-8")).hexdigest() if rows else ""
+    
+    def rename_user(self, old_username, new_username):
+        """Move all of a user's sheets to a new username"""
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            for table in ("sheets", "sheet_rows"):
+                connection.execute(f"DELETE FROM {table} WHERE username = ?", (new_username,))
+                connection.execute(f"UPDATE {table} SET username = ? WHERE username = ?", (new_username, old_username))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+def create_storage_backend(backend_name, data_dir):
+    """Create the storage backend configured by name"""
+    if backend_name == "sqlite":
+        return SQLiteStorageBackend(os.path.join(data_dir, SQLITE_DB_FILE))
+    if backend_name == "json":
+        return JSONStorageBackend(data_dir)
+    if backend_name == "journal":
+        return JournaledStorageBackend(data_dir)
+    raise ValueError(f"Unknown storage backend: {backend_name}")
+
+def migrate_json_to_sqlite(data_dir="data", db_path=None):
+    """Copy every data/user_*/<Sheet>.json file into the SQLite backend. Returns the number of sheets copied."""
+    # The journaled reader also handles plain JSON sheets and replays any pending journal
+    source = JournaledStorageBackend(data_dir)
+    target = SQLiteStorageBackend(db_path or os.path.join(data_dir, SQLITE_DB_FILE))
+    
+    migrated = 0
+    for username in source.list_users():
+        for sheet_name in source.list_sheets(username):
+            try:
+                data, columns, last_updated = source.load_sheet_info(username, sheet_name)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {username}/{sheet_name}: {e}")
+                continue
+            target.save_sheet(username, sheet_name, data, columns, last_updated or datetime.now().isoformat())
+            migrated += 1
+    return migrated
 
 class DataManager:
-    def __init__(self):
+    def __init__(self, backend=None):
         self.data_dir = "data"
         self.ensure_data_directory()
+        self.backend = backend or create_storage_backend(STORAGE_BACKEND, self.data_dir)
+        # Search and duplicate indexes of users loaded in this process, kept up to
+        # date on save: username -> {index class: index}. Each user's indexes are
+        # guarded by that user's own lock, so one user's build or save never waits
+        # for another's; _index_lock only guards these two dicts.
+        self._user_indexes = {}
+        self._user_index_locks = {}
+        self._index_lock = threading.Lock()
     
     def ensure_data_directory(self):
         """Ensure data directory exists"""
         if not os.path.exists(self.data_dir):
             os.makedirs(self.data_dir)
     
-    def get_user_data_file(self, username, sheet_name):
-        """Get user-specific data file path"""
-        user_dir = os.path.join(self.data_dir, f"user_{username}")
-        if not os.path.exists(user_dir):
-            os.makedirs(user_dir)
-        return os.path.join(user_dir, f"{sheet_name}.json")
-    
     def save_user_data(self, username, sheet_name, data, columns):
         """Save data for specific user and sheet"""
         try:
-            file_path = self.get_user_data_file(username, sheet_name)
-            user_data = {
-                "columns": columns,
-                "data": data,
-                "last_updated": datetime.now().isoformat(),
-                "user": username
-            }
-            
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(user_data, f, indent=2, ensure_ascii=False)
-            
+            version = self.backend.data_version(username)
+            self.backend.save_sheet(username, sheet_name, data, columns, datetime.now().isoformat())
+            self._update_user_indexes(username, version, lambda index: index.index_sheet(sheet_name, data, columns))
             return True
         except Exception as e:
             st.error(f"Error saving data: {str(e)}")
@@ -43,37 +620,159 @@ class DataManager:
     def load_user_data(self, username, sheet_name):
         """Load data for specific user and sheet"""
         try:
-            file_path = self.get_user_data_file(username, sheet_name)
-            
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    user_data = json.load(f)
-                return user_data.get("data", []), user_data.get("columns", [])
-            else:
-                return [], []
+            return self.backend.load_sheet(username, sheet_name)
         except Exception as e:
             st.error(f"Error loading data: {str(e)}")
             return [], []
     
+    def iter_user_rows(self, username, sheet_name):
+        """Get (columns, row iterator) for specific user and sheet, streaming rows where the backend can"""
+        try:
+            return self.backend.iter_sheet(username, sheet_name)
+        except Exception as e:
+            st.error(f"Error loading data: {str(e)}")
+            return [], iter(())
+    
+    def save_user_rows(self, username, sheet_name, columns, updated_rows=None, added_rows=None, deleted_rows=None):
+        """Save only the changed rows for specific user and sheet (see apply_row_changes)"""
+        try:
+            version = self.backend.data_version(username)
+            self.backend.save_rows(
+                username, sheet_name, columns,
+                updated_rows or {}, added_rows or [], deleted_rows or [],
+                datetime.now().isoformat()
+            )
+            if updated_rows or deleted_rows:
+                # Row positions may have shifted, so the sheet is indexed again
+                sheet = []
+                
+                def reindex(index):
+                    if not sheet:
+                        sheet.extend(self.backend.load_sheet(username, sheet_name))
+                    index.index_sheet(sheet_name, *sheet)
+                self._update_user_indexes(username, version, reindex)
+            else:
+                self._update_user_indexes(username, version, lambda index: index.add_rows(sheet_name, added_rows or [], columns))
+            return True
+        except Exception as e:
+            st.error(f"Error saving data: {str(e)}")
+            return False
+    
+    def get_user_data_version(self, username):
+        """Get a token identifying the current state of all of a user's sheets"""
+        return self.backend.data_version(username)
+    
+    def _user_index_lock(self, username):
+        with self._index_lock:
+            return self._user_index_locks.setdefault(username, threading.RLock())
+    
+    def _user_index_map(self, username):
+        with self._index_lock:
+            return self._user_indexes.setdefault(username, {})
+    
+    def _get_user_index(self, username, index_class):
+        """
+        Get one of the user's indexes, building it if it is missing or stale.
+        The build runs outside any lock and is only kept if no save happened while
+        it ran. Read the index through _read_user_index while saves may change it.
+        """
+        user_lock = self._user_index_lock(username)
+        with user_lock:
+            version = self.backend.data_version(username)
+            index = self._user_index_map(username).get(index_class)
+            if index is not None and index.version == version:
+                return index
+        
+        index = index_class()
+        sheet_names = getattr(index_class, "SHEETS", None) or self.backend.list_sheets(username)
+        for sheet_name in sheet_names:
+            data, columns = self.backend.load_sheet(username, sheet_name)
+            index.index_sheet(sheet_name, data, columns)
+        index.version = version
+        
+        with user_lock:
+            if self.backend.data_version(username) == version:
+                indexes = self._user_index_map(username)
+                current = indexes.get(index_class)
+                # Another session may have built it meanwhile
+                if current is not None and current.version == version:
+                    return current
+                indexes[index_class] = index
+        return index
+    
+    def _read_user_index(self, username, index_class, read):
+        """Call read(index) on one of the user's indexes while holding the user's index lock"""
+        index = self._get_user_index(username, index_class)
+        with self._user_index_lock(username):
+            return read(index)
+    
+    def get_search_index(self, username):
+        """Get the user's search index, building it if it is missing or stale"""
+        return self._get_user_index(username, UserSearchIndex)
+    
+    def get_duplicate_index(self, username):
+        """Get the user's duplicate index, building it if it is missing or stale"""
+        return self._get_user_index(username, DuplicateIndex)
+    
+    def get_client_index(self, username):
+        """Get the user's client number / Client ID lookup index, building it if it is missing or stale"""
+        return self._get_user_index(username, ClientLookupIndex)
+    
+    def search_user_data(self, username, query, sheets=None):
+        """Get (ranked hits, fuzzy hits) for a query from the user's search index"""
+        return self._read_user_index(
+            username, UserSearchIndex,
+            lambda index: (index.search(query, sheets=sheets), index.fuzzy_search(query, sheets=sheets))
+        )
+    
+    def find_client(self, username, client_key):
+        """Get the user's client row with a client number or Client ID as a dictionary, or {}"""
+        return self._read_user_index(username, ClientLookupIndex, lambda index: index.find(client_key))
+    
+    def find_row_duplicates(self, username, sheet_name, columns, row):
+        """
+        Get [(key fields, row numbers)] of the user's existing rows that look like
+        duplicates of a new row. Checking is best effort and never blocks a save.
+        """
+        try:
+            record = dict(zip(columns, row))
+            return self._read_user_index(username, DuplicateIndex, lambda index: index.find(sheet_name, record))
+        except Exception:
+            return []
+    
+    def _update_user_indexes(self, username, version_before_save, update):
+        """
+        Apply a just-saved change to the user's loaded indexes.
+        An index that already missed changes from another process is dropped instead.
+        """
+        with self._user_index_lock(username):
+            indexes = self._user_index_map(username)
+            version = None
+            for index_class, index in list(indexes.items()):
+                if index.version != version_before_save:
+                    del indexes[index_class]
+                    continue
+                update(index)
+                if version is None:
+                    version = self.backend.data_version(username)
+                index.version = version
+    
     def get_all_users_data(self, sheet_name):
         """Get consolidated data from all users for a specific sheet"""
         all_data = []
         columns = []
         
-        if os.path.exists(self.data_dir):
-            for user_dir in os.listdir(self.data_dir):
-                if user_dir.startswith("user_"):
-                    username = user_dir.replace("user_", "")
-                    user_data, user_columns = self.load_user_data(username, sheet_name)
-                    
-                    if user_data and user_columns:
-                        if not columns:
-                            columns = user_columns
-                        
-                        # Add user info to each row
-                        for row in user_data:
-                            row_with_user = [username] + row
-                            all_data.append(row_with_user)
+        for username in self.backend.list_users():
+            user_data, user_columns = self.load_user_data(username, sheet_name)
+            
+            if user_data and user_columns:
+                if not columns:
+                    columns = user_columns
+                
+                # Add user info to each row
+                for row in user_data:
+                    row_with_user = [username] + row
+                    all_data.append(row_with_user)
         
         if columns:
             columns = ["Encoder"] + columns
@@ -83,33 +782,31 @@ class DataManager:
     def user_has_data(self, username):
         """Check if a user has any data in any sheet"""
         try:
-            user_dir = os.path.join(self.data_dir, f"user_{username}")
-            if not os.path.exists(user_dir):
-                return False
-            
-            # Check all possible sheet files
-            sheet_names = [
-                "Business Owner", "Business Profile", "Client", "Business Registration",
-                "Business Financial Structure", "Market Import", "Product Service Lines",
-                "Employment Statistics", "Assistance", "Market Export", "Jobs Generated",
-                "Business Contact Information", "Market Domestic"
-            ]
-            
-            for sheet_name in sheet_names:
-                file_path = os.path.join(user_dir, f"{sheet_name}.json")
-                if os.path.exists(file_path):
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            user_data = json.load(f)
-                        data = user_data.get("data", [])
-                        if data and len(data) > 0:
-                            return True
-                    except:
-                        continue
-            
+            return any(self.backend.has_rows(username, sheet_name) for sheet_name in SHEET_NAMES)
+        except Exception as e:
             return False
+    
+    def rename_user(self, old_username, new_username):
+        """Move a user's stored sheets to a new username"""
+        try:
+            self.backend.rename_user(old_username, new_username)
+            with self._index_lock:
+                self._user_indexes.pop(old_username, None)
+                self._user_indexes.pop(new_username, None)
+            return True
         except Exception as e:
+            st.error(f"Error renaming user data folder: {e}")
             return False
 
 # Global data manager instance
 data_manager = DataManager()
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["migrate"]:
+        count = migrate_json_to_sqlite()
+        print(f"Migrated {count} sheet(s) to {os.path.join('data', SQLITE_DB_FILE)}")
+    elif sys.argv[1:] == ["compact"]:
+        count = JournaledStorageBackend("data").compact_all()
+        print(f"Compacted {count} sheet journal(s)")
+    else:
+        print("Usage: python -m utils.data_manager migrate|compact")
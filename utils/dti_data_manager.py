@@ -8,9 +8,8 @@ import json
 import pandas as pd
 import streamlit as st
 from datetime import datetime
-import fcntl  # For file locking on Unix systems
-import threading
 from pathlib import Path
+from utils.file_storage import atomic_write_json, file_lock
 
 class DTIDataManager:
     def __init__(self):
@@ -22,8 +21,6 @@ class DTIDataManager:
         # Create all necessary directories
         for directory in [self.data_dir, self.users_dir, self.consolidated_dir, self.backup_dir]:
             directory.mkdir(exist_ok=True)
-        
-        self.lock = threading.Lock()
     
     def get_user_file_path(self, username, sheet_name):
         """Get file path for user-specific data"""
@@ -34,8 +31,8 @@ class DTIDataManager:
     def save_user_data(self, username, sheet_name, data, columns):
         """Save data for a specific user and sheet with file locking"""
         try:
-            with self.lock:  # Thread-safe operation
-                file_path = self.get_user_file_path(username, sheet_name)
+            file_path = self.get_user_file_path(username, sheet_name)
+            with file_lock(file_path):  # Safe across threads and worker processes
                 
                 # Prepare data structure
                 user_data = {
@@ -49,8 +46,7 @@ class DTIDataManager:
                 }
                 
                 # Save to file
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(user_data, f, indent=2, ensure_ascii=False, default=str)
+                atomic_write_json(file_path, user_data, indent=2, ensure_ascii=False, default=str)
                 
                 # Also save to consolidated view
                 self.update_consolidated_data(sheet_name)
@@ -120,8 +116,7 @@ class DTIDataManager:
                 "contributing_encoders": list(set([row[0] for row in consolidated_data]))
             }
             
-            with open(consolidated_file, 'w', encoding='utf-8') as f:
-                json.dump(consolidated_info, f, indent=2, ensure_ascii=False, default=str)
+            atomic_write_json(consolidated_file, consolidated_info, indent=2, ensure_ascii=False, default=str)
             
             return True
             
@@ -162,8 +157,7 @@ class DTIDataManager:
                     "columns": columns
                 }
                 
-                with open(backup_file, 'w', encoding='utf-8') as f:
-                    json.dump(backup_info, f, indent=2, ensure_ascii=False, default=str)
+                atomic_write_json(backup_file, backup_info, indent=2, ensure_ascii=False, default=str)
             else:
                 # Backup all sheets
                 backup_file = self.backup_dir / f"full_backup_{timestamp}.json"
@@ -0,0 +1,161 @@
+"""
+Duplicate detection for CPMS sheets.
+Rows are grouped by normalized field values in a single pass over each sheet, so
+finding duplicates is linear in the number of rows for all checked fields at once.
+"""
+
+import re
+import unicodedata
+
+# Fields checked for duplicates in each sheet
+DUPLICATE_CHECK_FIELDS = {
+    "Client": ["First Name", "Last Name", "Full Name", "Business Name", "Email", "Contact Number"],
+    "Business Owner": ["First Name", "Last Name", "Full Name", "Business Name", "Email", "Contact Number"],
+    "Business Profile": ["Business Name", "Business Registration Number", "TIN", "Email"],
+    "Business Registration": ["Business Name", "Registration Number", "TIN"],
+    "Business Contact Information": ["Business Name", "Email", "Contact Number"],
+    "Business Financial Structure": ["Business Name", "TIN"],
+    "Market Domestic": ["Business Name", "Product/Service"],
+    "Market Export": ["Business Name", "Product/Service", "Destination Country"],
+    "Market Import": ["Business Name", "Product/Service", "Source Country"],
+    "Product Service Lines": ["Business Name", "Product/Service Name"],
+    "Employment Statistics": ["Business Name", "Employee Name"],
+    "Assistance": ["Business Name", "Beneficiary Name"],
+    "Jobs Generated": ["Business Name", "Job Title"]
+}
+
+# Fields compared on their digits only, so "0917-123-4567" matches "09171234567"
+NUMERIC_FIELD_KEYWORDS = ("number", "tin", "contact")
+
+def is_numeric_field(field):
+    """Check if a field holds an identifier or phone number compared by digits"""
+    words = re.findall(r"[a-z]+", field.lower())
+    return any(keyword in words for keyword in NUMERIC_FIELD_KEYWORDS)
+
+def _normalize_number(text):
+    digits = re.sub(r"\D", "", text)
+    return digits or text.lower()
+
+def _normalize_text(text):
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.casefold().split())
+
+def duplicate_key_function(field):
+    """
+    Get the function that normalizes a field's values into the keys rows are grouped
+    by: case, accents and spacing are ignored, and numbers compare on their digits.
+    The key of an empty value is "".
+    """
+    normalize = _normalize_number if is_numeric_field(field) else _normalize_text
+    
+    def duplicate_key(value):
+        if value is None:
+            return ""
+        text = str(value).strip()
+        if text.lower() in ("", "nan", "none"):
+            return ""
+        return normalize(text)
+    return duplicate_key
+
+def normalize_duplicate_value(field, value):
+    """Normalize a single value of a field into its duplicate key"""
+    return duplicate_key_function(field)(value)
+
+def find_duplicates(data, columns, fields):
+    """
+    Group rows with the same normalized value in any of the given fields.
+    Returns {field: [{'value', 'count', 'rows'}]} with 1-based row numbers,
+    largest groups first; fields without duplicates are left out.
+    """
+    field_indices = [(field, columns.index(field)) for field in fields if field in columns]
+    buckets = {field: {} for field, _ in field_indices}
+    
+    for field, col_index in field_indices:
+        field_buckets = buckets[field]
+        duplicate_key = duplicate_key_function(field)
+        # Repeated raw values are normalized once
+        keys = {}
+        for row_number, row in enumerate(data, 1):
+            if col_index >= len(row):
+                continue
+            value = row[col_index]
+            try:
+                key = keys[value]
+            except KeyError:
+                key = keys[value] = duplicate_key(value)
+            except TypeError:  # unhashable cell value
+                key = duplicate_key(value)
+            if key:
+                field_buckets.setdefault(key, [value, []])[1].append(row_number)
+    
+    duplicates = {}
+    for field, groups in buckets.items():
+        duplicate_list = [
+            {'value': str(value), 'count': len(rows), 'rows': rows}
+            for value, rows in groups.values() if len(rows) > 1
+        ]
+        if duplicate_list:
+            duplicate_list.sort(key=lambda group: (-group['count'], group['rows'][0]))
+            duplicates[field] = duplicate_list
+    return duplicates
+
+# Identifying values checked when a new row is entered, as tuples of fields that
+# must all match. Business Profile rows carry no name, TIN or contact fields.
+DUPLICATE_INSERT_KEYS = {
+    "Client": [("First Name", "Last Name"), ("Mobile Number",), ("Email Address",)],
+    "Business Owner": [("Given Name", "Last Name")]
+}
+
+class DuplicateIndex:
+    """Hash index from normalized identifying values to row numbers, for checking new rows in O(1)"""
+    
+    # Only these sheets are loaded when the index is built
+    SHEETS = tuple(DUPLICATE_INSERT_KEYS)
+    
+    def __init__(self):
+        self.version = None     # storage data version the index reflects
+        self.keys = {}          # sheet -> {key fields: {normalized key: [row numbers]}}
+        self.row_counts = {}    # sheet -> number of indexed rows
+        self._key_functions = {}
+    
+    def record_key(self, fields, record):
+        """Get the normalized key of a record for a tuple of fields, or None if any is empty"""
+        key = []
+        for field in fields:
+            if field not in self._key_functions:
+                self._key_functions[field] = duplicate_key_function(field)
+            value = self._key_functions[field](record.get(field))
+            if not value:
+                return None
+            key.append(value)
+        return tuple(key)
+    
+    def index_sheet(self, sheet_name, data, columns):
+        """Index (or re-index) a whole sheet"""
+        self.keys[sheet_name] = {fields: {} for fields in DUPLICATE_INSERT_KEYS.get(sheet_name, [])}
+        self.row_counts[sheet_name] = 0
+        self.add_rows(sheet_name, data, columns)
+    
+    def add_rows(self, sheet_name, rows, columns):
+        """Index rows appended to the end of a sheet"""
+        sheet_keys = self.keys.setdefault(sheet_name, {fields: {} for fields in DUPLICATE_INSERT_KEYS.get(sheet_name, [])})
+        for row in rows:
+            self.row_counts[sheet_name] = self.row_counts.get(sheet_name, 0) + 1
+            if not sheet_keys:
+                continue
+            record = dict(zip(columns, row))
+            for fields, keys in sheet_keys.items():
+                key = self.record_key(fields, record)
+                if key:
+                    keys.setdefault(key, []).append(self.row_counts[sheet_name])
+    
+    def find(self, sheet_name, record):
+        """Get [(key fields, row numbers)] of existing rows that share identifying values with a record"""
+        matches = []
+        for fields, keys in self.keys.get(sheet_name, {}).items():
+            key = self.record_key(fields, record)
+            if key and key in keys:
+                matches.append((fields, keys[key]))
+        return matches
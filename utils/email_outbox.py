@@ -0,0 +1,285 @@
+"""
+Persistent outbox for emails sent by CPMS.
+Pages queue a message in data/email_outbox.json and return at once; a background
+sender thread delivers queued messages in batches over a single SMTP connection
+and retries failures with exponential backoff. A message body (which may hold a
+password) is dropped from the outbox as soon as it has been sent, and a message
+that failed for good is removed after FAILED_RETENTION.
+"""
+
+import os
+import time
+import uuid
+import smtplib
+import threading
+import streamlit as st
+from email.mime.text import MIMEText
+from utils.file_storage import locked_json, read_json
+
+OUTBOX_FILE = os.path.join("data", "email_outbox.json")
+
+# The sender also checks the outbox this often for mail queued by other processes (seconds)
+SEND_INTERVAL = int(os.getenv("CPMS_EMAIL_SEND_INTERVAL", "30"))
+# Messages sent over one SMTP connection
+BATCH_SIZE = 50
+# A message is marked failed after this many attempts
+MAX_ATTEMPTS = 6
+# The first retry waits this long (seconds), doubling with each further attempt
+RETRY_BACKOFF = 60
+MAX_RETRY_DELAY = 3600
+SMTP_TIMEOUT = 20
+# A batch claimed by a sender that died is picked up again after this long (seconds)
+CLAIM_TIMEOUT = 300
+# Sent messages are listed in the admin page for this long (seconds)
+SENT_RETENTION = 7 * 86400
+# Failed messages can be retried from the admin page for this long, then they
+# are removed together with the credentials in them (seconds)
+FAILED_RETENTION = 86400
+
+def get_smtp_config():
+    """Get the SMTP settings from Streamlit secrets (supports both key formats)"""
+    try:
+        email_config = st.secrets.get("email", {})
+    except Exception:
+        email_config = {}
+    return {
+        "sender_email": email_config.get("sender_email") or email_config.get("username") or email_config.get("from", ""),
+        "sender_password": email_config.get("sender_password") or email_config.get("password", ""),
+        "smtp_server": email_config.get("smtp_server", "smtp.gmail.com"),
+        "smtp_port": int(email_config.get("smtp_port", 587)),
+        "use_tls": bool(email_config.get("use_tls", True))
+    }
+
+class EmailOutbox:
+    """Queue of outgoing emails with a background sender"""
+    
+    def __init__(self, outbox_file=OUTBOX_FILE, smtp_config=None):
+        self.outbox_file = outbox_file
+        # None: read from Streamlit secrets before each batch
+        self.smtp_config = smtp_config
+        self._wake = threading.Event()
+        self._sender = None
+        self._sender_lock = threading.Lock()
+        self.sender_metrics = {
+            'batches': 0,
+            'sent': 0,
+            'failed_attempts': 0,
+            'last_batch_at': None,
+            'last_batch_size': 0,
+            'last_batch_ms': 0.0,
+            'errors': 0
+        }
+    
+    def get_config(self):
+        """Get the SMTP settings used for the next batch"""
+        return self.smtp_config if self.smtp_config is not None else get_smtp_config()
+    
+    def is_configured(self):
+        """Check if sender credentials are configured"""
+        config = self.get_config()
+        return bool(config.get("sender_email") and (config.get("sender_password") or not config.get("use_tls", True)))
+    
+    def enqueue(self, to, subject, body):
+        """Queue an email and wake the sender; returns the message id"""
+        now = time.time()
+        message = {
+            "id": uuid.uuid4().hex,
+            "to": to,
+            "subject": subject,
+            "body": body,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now,
+            "sent_at": None,
+            "last_error": None
+        }
+        with locked_json(self.outbox_file, {}, indent=2) as outbox:
+            outbox[message["id"]] = message
+        self.start_sender()
+        self._wake.set()
+        return message["id"]
+    
+    def _claim_batch(self):
+        """Mark up to BATCH_SIZE due messages as sending and return them"""
+        now = time.time()
+        with locked_json(self.outbox_file, {}, indent=2) as outbox:
+            for message_id in [message_id for message_id, message in outbox.items() if self._expired(message, now)]:
+                del outbox[message_id]
+            
+            due = [
+                message for message in outbox.values()
+                if (message["status"] == "pending" and message["next_attempt_at"] <= now)
+                or (message["status"] == "sending" and message.get("claimed_until", 0) <= now)
+            ]
+            due.sort(key=lambda message: message["created_at"])
+            batch = due[:BATCH_SIZE]
+            for message in batch:
+                message["status"] = "sending"
+                message["claimed_until"] = now + CLAIM_TIMEOUT
+            return [dict(message) for message in batch]
+    
+    def _expired(self, message, now):
+        if message["status"] == "sent":
+            return message["sent_at"] < now - SENT_RETENTION
+        if message["status"] == "failed":
+            return message.get("failed_at", 0) < now - FAILED_RETENTION
+        return False
+    
+    def _connect(self, config):
+        server = smtplib.SMTP(config["smtp_server"], config["smtp_port"], timeout=SMTP_TIMEOUT)
+        try:
+            if config.get("use_tls", True):
+                server.starttls()
+            if config.get("sender_password"):
+                server.login(config["sender_email"], config["sender_password"])
+        except Exception:
+            server.close()
+            raise
+        return server
+    
+    def _send_batch(self, batch, config):
+        """Send a batch over one connection; returns {message id: error or None}"""
+        results = {}
+        if not config.get("sender_email"):
+            return {message["id"]: "Email credentials not configured in Streamlit secrets" for message in batch}
+        
+        try:
+            server = self._connect(config)
+        except Exception as e:
+            return {message["id"]: f"Connection failed: {e}" for message in batch}
+        
+        try:
+            for message in batch:
+                msg = MIMEText(message["body"], 'plain')
+                msg['From'] = config["sender_email"]
+                msg['To'] = message["to"]
+                msg['Subject'] = message["subject"]
+                try:
+                    server.sendmail(config["sender_email"], [message["to"]], msg.as_string())
+                    results[message["id"]] = None
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                    # Refused by the server: only this message fails
+                    results[message["id"]] = str(e)
+        except Exception as e:
+            # The connection broke: every message not sent yet is retried
+            for message in batch:
+                results.setdefault(message["id"], f"Connection lost: {e}")
+        finally:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+        return results
+    
+    def _record_results(self, results):
+        now = time.time()
+        with locked_json(self.outbox_file, {}, indent=2) as outbox:
+            for message_id, error in results.items():
+                message = outbox.get(message_id)
+                if message is None:
+                    continue
+                message.pop("claimed_until", None)
+                if error is None:
+                    message["status"] = "sent"
+                    message["sent_at"] = now
+                    message["body"] = None
+                    message["last_error"] = None
+                    continue
+                message["attempts"] += 1
+                message["last_error"] = error
+                if message["attempts"] >= MAX_ATTEMPTS:
+                    message["status"] = "failed"
+                    message["failed_at"] = now
+                else:
+                    message["status"] = "pending"
+                    message["next_attempt_at"] = now + min(RETRY_BACKOFF * 2 ** (message["attempts"] - 1), MAX_RETRY_DELAY)
+    
+    def process_outbox(self):
+        """Send every due message, a batch per connection; returns the number sent"""
+        sent = 0
+        while True:
+            batch = self._claim_batch()
+            if not batch:
+                return sent
+            
+            started = time.perf_counter()
+            results = self._send_batch(batch, self.get_config())
+            self._record_results(results)
+            
+            batch_sent = sum(1 for error in results.values() if error is None)
+            metrics = self.sender_metrics
+            metrics['batches'] += 1
+            metrics['sent'] += batch_sent
+            metrics['failed_attempts'] += len(results) - batch_sent
+            metrics['last_batch_at'] = time.time()
+            metrics['last_batch_size'] = len(batch)
+            metrics['last_batch_ms'] = (time.perf_counter() - started) * 1000
+            sent += batch_sent
+            
+            # Stop after a failing batch and wait for its backoff
+            if batch_sent < len(results) or len(batch) < BATCH_SIZE:
+                return sent
+    
+    def _run_sender(self):
+        while True:
+            self._wake.clear()
+            try:
+                self.process_outbox()
+            except Exception as e:
+                self.sender_metrics['errors'] += 1
+                print(f"Email outbox error: {e}")
+            self._wake.wait(SEND_INTERVAL)
+    
+    def start_sender(self):
+        """
+        Start the background thread that delivers queued emails. Only one sender
+        runs per process, so this is safe to call on every page load.
+        """
+        if self._sender is not None:
+            return
+        with self._sender_lock:
+            if self._sender is None:
+                self._sender = threading.Thread(target=self._run_sender, name="email-outbox", daemon=True)
+                self._sender.start()
+    
+    def list_messages(self, limit=100):
+        """Get the most recent messages, newest first, without their bodies"""
+        outbox = read_json(self.outbox_file, {})
+        messages = sorted(outbox.values(), key=lambda message: message["created_at"], reverse=True)
+        return [{key: value for key, value in message.items() if key != "body"} for message in messages[:limit]]
+    
+    def status_counts(self):
+        """Count messages by status"""
+        counts = {"pending": 0, "sending": 0, "sent": 0, "failed": 0}
+        for message in read_json(self.outbox_file, {}).values():
+            counts[message["status"]] = counts.get(message["status"], 0) + 1
+        return counts
+    
+    def retry_failed(self):
+        """Queue failed messages again; returns how many"""
+        now = time.time()
+        count = 0
+        with locked_json(self.outbox_file, {}, indent=2) as outbox:
+            for message in outbox.values():
+                if message["status"] == "failed":
+                    message["status"] = "pending"
+                    message["attempts"] = 0
+                    message["next_attempt_at"] = now
+                    message.pop("failed_at", None)
+                    count += 1
+        if count:
+            self.start_sender()
+            self._wake.set()
+        return count
+    
+    def discard_failed(self):
+        """Remove failed messages (and the credentials in them); returns how many"""
+        with locked_json(self.outbox_file, {}, indent=2) as outbox:
+            failed = [message_id for message_id, message in outbox.items() if message["status"] == "failed"]
+            for message_id in failed:
+                del outbox[message_id]
+        return len(failed)
+
+# Global email outbox instance
+email_outbox = EmailOutbox()
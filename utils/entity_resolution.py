@@ -0,0 +1,388 @@
+"""
+Cross-encoder entity resolution for CPMS.
+Each encoder's sheets are stored separately, so the same client or business can be
+encoded by several staff. Records from all encoders are grouped into blocks that
+share a cheap key (last name + birth year, mobile number, email, TIN, business name),
+pairs within a block are scored with a weighted string-similarity model, and
+matching pairs are merged into clusters. Loading and scoring run in a process pool
+started with "spawn". The admin page runs the job as a separate process and only
+shows the last stored result, so the Streamlit server itself never forks.
+
+Usage: python -m utils.entity_resolution [--data-dir DIR] [workers]
+"""
+
+import os
+import sys
+import time
+import threading
+import subprocess
+import multiprocessing
+import concurrent.futures
+from datetime import datetime
+
+from utils.data_manager import STORAGE_BACKEND, create_storage_backend
+from utils.duplicates import normalize_duplicate_value
+from utils.file_storage import atomic_write_json, read_json
+from utils.search_index import search_tokens, word_trigrams
+
+ENTITY_CLUSTERS_FILE = "entity_clusters.json"
+
+# Pairs scoring at least this are treated as the same client or business
+MATCH_THRESHOLD = 0.8
+# Blocks larger than this come from placeholder values (e.g. "N/A" mobile numbers)
+# and would add more false candidates than real ones, so they are skipped
+MAX_BLOCK_SIZE = 500
+# Candidate pairs scored per pool task
+PAIRS_PER_TASK = 200000
+# Pool processes used unless a worker count is given
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+# Field weights of the similarity model; only fields present in both records count
+CLIENT_WEIGHTS = {"name": 0.5, "birth_year": 0.2, "mobile": 0.2, "email": 0.1}
+BUSINESS_WEIGHTS = {"name": 0.5, "tin": 0.3, "mobile": 0.1, "email": 0.1}
+
+# Business sheets joined on "No" into one business record per Business Profile row
+BUSINESS_IDENTITY_SHEETS = ("Business Registrations", "Business Contact Information")
+
+def _normalize_mobile(value):
+    digits = normalize_duplicate_value("Mobile Number", value)
+    if not digits.isdigit() or len(digits) < 7:
+        return ""
+    # 09171234567 and +639171234567 are the same number
+    return digits[-10:]
+
+def _normalize_tin(value):
+    digits = normalize_duplicate_value("TIN", value)
+    return digits if digits.isdigit() and len(digits) >= 9 else ""
+
+def _birth_year(record):
+    year = str(record.get("Birth Year") or "").strip()
+    if not year:
+        year = str(record.get("Birthdate (MM/DD/YYYY)") or "").strip()[-4:]
+    return year if len(year) == 4 and year.isdigit() else ""
+
+def _name_key(*parts):
+    return " ".join(token for part in parts for token in search_tokens(part or ""))
+
+def _client_record(encoder, row_number, record):
+    first = record.get("First Name") or ""
+    last = record.get("Last Name") or ""
+    return {
+        "kind": "client",
+        "encoder": encoder,
+        "sheet": "Client",
+        "row": row_number,
+        "no": str(record.get("No") or ""),
+        "label": " ".join(str(part).strip() for part in (first, record.get("Middle Name"), last) if part and str(part).strip()),
+        "name": _name_key(first, last),
+        "last_name": _name_key(last),
+        "birth_year": _birth_year(record),
+        "mobile": _normalize_mobile(record.get("Mobile Number")),
+        "email": normalize_duplicate_value("Email Address", record.get("Email Address")),
+        "tin": ""
+    }
+
+def _business_record(encoder, row_number, record):
+    name = record.get("Name of Business") or record.get("Business Company Name") or record.get("Trade or Billboard Name") or ""
+    return {
+        "kind": "business",
+        "encoder": encoder,
+        "sheet": "Business Profile",
+        "row": row_number,
+        "no": str(record.get("No") or ""),
+        "label": str(name).strip(),
+        "name": _name_key(name),
+        "last_name": "",
+        "birth_year": "",
+        "mobile": _normalize_mobile(record.get("Mobile Number")),
+        "email": normalize_duplicate_value("Email Address", record.get("Email Address")),
+        "tin": _normalize_tin(record.get("BIR (TIN) No."))
+    }
+
+def load_encoder_records(data_dir, backend_name, username):
+    """
+    Load one encoder's Client rows and Business Profile rows as entity records.
+    Business Profile rows have no identifying columns of their own, so each takes
+    its name, TIN and contact details from the Business Registrations and Business
+    Contact Information rows with the same "No".
+    """
+    backend = create_storage_backend(backend_name, data_dir)
+    records = []
+    
+    data, columns = backend.load_sheet(username, "Client")
+    for row_number, row in enumerate(data, 1):
+        records.append(_client_record(username, row_number, dict(zip(columns, row))))
+    
+    linked = {}
+    for sheet_name in BUSINESS_IDENTITY_SHEETS:
+        data, columns = backend.load_sheet(username, sheet_name)
+        for row in data:
+            record = dict(zip(columns, row))
+            merged = linked.setdefault(str(record.get("No") or ""), {})
+            for column, value in record.items():
+                if value not in (None, "") and not merged.get(column):
+                    merged[column] = value
+    
+    data, columns = backend.load_sheet(username, "Business Profile")
+    for row_number, row in enumerate(data, 1):
+        record = dict(zip(columns, row))
+        record = {**linked.get(str(record.get("No") or ""), {}), **record}
+        business = _business_record(username, row_number, record)
+        if business["name"] or business["tin"] or business["mobile"] or business["email"]:
+            records.append(business)
+    return records
+
+def blocking_keys(record):
+    """Get the block keys of a record; records can only match if they share one"""
+    keys = []
+    kind = record["kind"]
+    if record["last_name"] and record["birth_year"]:
+        keys.append((kind, "name_year", record["last_name"], record["birth_year"]))
+    if record["mobile"]:
+        keys.append((kind, "mobile", record["mobile"]))
+    if record["email"]:
+        keys.append((kind, "email", record["email"]))
+    if record["tin"]:
+        keys.append((kind, "tin", record["tin"]))
+    if kind == "business" and record["name"]:
+        keys.append((kind, "name", record["name"]))
+    return keys
+
+def _name_trigrams(name):
+    grams = set()
+    for token in name.split():
+        grams |= word_trigrams(token)
+    return grams
+
+def _name_similarity(grams_a, grams_b):
+    if not grams_a or not grams_b:
+        return 0.0
+    shared = len(grams_a & grams_b)
+    return shared / (len(grams_a) + len(grams_b) - shared)
+
+def score_pair(a, b, grams_a=None, grams_b=None):
+    """
+    Score how likely two records are the same entity, from 0 to 1: a weighted
+    average of per-field similarities over the fields both records have.
+    Names compare by trigram similarity, everything else must match exactly.
+    """
+    weights = CLIENT_WEIGHTS if a["kind"] == "client" else BUSINESS_WEIGHTS
+    total = 0.0
+    weight_sum = 0.0
+    for field, weight in weights.items():
+        value_a, value_b = a[field], b[field]
+        if not value_a or not value_b:
+            continue
+        if field == "name":
+            similarity = _name_similarity(
+                grams_a if grams_a is not None else _name_trigrams(value_a),
+                grams_b if grams_b is not None else _name_trigrams(value_b)
+            )
+        else:
+            similarity = 1.0 if value_a == value_b else 0.0
+        total += weight * similarity
+        weight_sum += weight
+    # Without the name, a shared mobile number or email alone is not enough evidence
+    if weight_sum < 0.5:
+        return 0.0
+    return total / weight_sum
+
+# Records shared with pool workers through the initializer, so tasks only carry indices
+_worker_records = None
+_worker_grams = None
+
+def _init_worker(records):
+    global _worker_records, _worker_grams
+    _worker_records = records
+    _worker_grams = {}
+
+def _grams(index):
+    grams = _worker_grams.get(index)
+    if grams is None:
+        grams = _worker_grams[index] = _name_trigrams(_worker_records[index]["name"])
+    return grams
+
+def _score_blocks(blocks):
+    """Score the cross-encoder pairs of some blocks and return the matching ones"""
+    matches = {}
+    for block in blocks:
+        for position, i in enumerate(block):
+            a = _worker_records[i]
+            for j in block[position + 1:]:
+                b = _worker_records[j]
+                if a["encoder"] == b["encoder"] or (i, j) in matches:
+                    continue
+                score = score_pair(a, b, _grams(i), _grams(j))
+                if score >= MATCH_THRESHOLD:
+                    matches[(i, j)] = score
+    return matches
+
+def _chunk_blocks(blocks):
+    """Group blocks into pool tasks of roughly PAIRS_PER_TASK candidate pairs"""
+    task, pairs = [], 0
+    for block in blocks:
+        task.append(block)
+        pairs += len(block) * (len(block) - 1) // 2
+        if pairs >= PAIRS_PER_TASK:
+            yield task
+            task, pairs = [], 0
+    if task:
+        yield task
+
+def _cluster(matches):
+    """Merge matching pairs into clusters; returns {root record: (record indices, pair scores)}"""
+    parent = {}
+    
+    def find(i):
+        parent.setdefault(i, i)
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    for i, j in matches:
+        root_i, root_j = find(i), find(j)
+        if root_i != root_j:
+            parent[max(root_i, root_j)] = min(root_i, root_j)
+    
+    clusters = {}
+    for (i, j), score in matches.items():
+        members, scores = clusters.setdefault(find(i), (set(), []))
+        members.update((i, j))
+        scores.append(score)
+    return clusters
+
+def resolve_entities(data_dir="data", backend_name=None, workers=None, usernames=None):
+    """
+    Find clients and businesses encoded by more than one encoder.
+    Returns {'clusters': [...], 'stats': {...}}; each cluster lists its member
+    records (encoder, sheet, 1-based row, No, label) and its pair scores.
+    """
+    backend_name = backend_name or STORAGE_BACKEND
+    workers = workers or DEFAULT_WORKERS
+    mp_context = multiprocessing.get_context("spawn")
+    if usernames is None:
+        usernames = create_storage_backend(backend_name, data_dir).list_users()
+    started = time.perf_counter()
+    
+    records = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        count = len(usernames)
+        for encoder_records in pool.map(load_encoder_records, [data_dir] * count, [backend_name] * count, usernames):
+            records.extend(encoder_records)
+    loaded = time.perf_counter()
+    
+    blocks = {}
+    for index, record in enumerate(records):
+        for key in blocking_keys(record):
+            blocks.setdefault(key, []).append(index)
+    candidate_blocks = []
+    skipped_blocks = 0
+    for block in blocks.values():
+        if len(block) < 2:
+            continue
+        if len(block) > MAX_BLOCK_SIZE:
+            skipped_blocks += 1
+            continue
+        if len({records[index]["encoder"] for index in block}) > 1:
+            candidate_blocks.append(block)
+    candidate_pairs = sum(len(block) * (len(block) - 1) // 2 for block in candidate_blocks)
+    
+    matches = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=mp_context,
+                                                initializer=_init_worker, initargs=(records,)) as pool:
+        for task_matches in pool.map(_score_blocks, _chunk_blocks(candidate_blocks)):
+            matches.update(task_matches)
+    scored = time.perf_counter()
+    
+    clusters = []
+    for members, pair_scores in _cluster(matches).values():
+        members = sorted(members)
+        clusters.append({
+            "kind": records[members[0]]["kind"],
+            "encoders": sorted({records[i]["encoder"] for i in members}),
+            "score": round(min(pair_scores), 3),
+            "members": [
+                {key: records[i][key] for key in ("encoder", "sheet", "row", "no", "label")}
+                for i in members
+            ]
+        })
+    clusters.sort(key=lambda cluster: (cluster["kind"], -len(cluster["members"]), -cluster["score"]))
+    
+    return {
+        "clusters": clusters,
+        "stats": {
+            "encoders": len(usernames),
+            "records": len(records),
+            "blocks": len(candidate_blocks),
+            "skipped_blocks": skipped_blocks,
+            "candidate_pairs": candidate_pairs,
+            "matched_pairs": len(matches),
+            "load_seconds": round(loaded - started, 2),
+            "score_seconds": round(scored - loaded, 2),
+            "total_seconds": round(time.perf_counter() - started, 2)
+        }
+    }
+
+def run_entity_resolution(data_dir="data", workers=None):
+    """Resolve entities across all encoders and save the clusters for the admin page"""
+    result = resolve_entities(data_dir, workers=workers)
+    result["generated_at"] = datetime.now().isoformat()
+    atomic_write_json(os.path.join(data_dir, ENTITY_CLUSTERS_FILE), result, indent=2)
+    return result
+
+def load_entity_clusters(data_dir="data"):
+    """Load the result of the last entity resolution run, or None"""
+    return read_json(os.path.join(data_dir, ENTITY_CLUSTERS_FILE), None)
+
+# Output of the last run started from the admin page
+ENTITY_RESOLUTION_LOG = "entity_resolution.log"
+
+# Run started from the admin page in this server process
+_resolution_job = {'process': None, 'started_at': None}
+_resolution_job_lock = threading.Lock()
+
+def start_entity_resolution(data_dir="data"):
+    """
+    Start an entity resolution run as a separate `python -m utils.entity_resolution`
+    process, so its pool is never started from inside the Streamlit server.
+    Returns False if a run started from this process is still going.
+    """
+    with _resolution_job_lock:
+        process = _resolution_job['process']
+        if process is not None and process.poll() is None:
+            return False
+        with open(os.path.join(data_dir, ENTITY_RESOLUTION_LOG), "w") as log:
+            _resolution_job['process'] = subprocess.Popen(
+                [sys.executable, "-m", "utils.entity_resolution", "--data-dir", data_dir],
+                stdout=log, stderr=subprocess.STDOUT
+            )
+        _resolution_job['started_at'] = time.time()
+        return True
+
+def entity_resolution_status(data_dir="data"):
+    """Get {'running', 'started_at', 'error'} of the last run started from this process"""
+    process = _resolution_job['process']
+    status = {'running': False, 'started_at': _resolution_job['started_at'], 'error': None}
+    if process is None:
+        return status
+    returncode = process.poll()
+    status['running'] = returncode is None
+    if returncode:
+        try:
+            with open(os.path.join(data_dir, ENTITY_RESOLUTION_LOG), "r") as log:
+                lines = [line.strip() for line in log if line.strip()]
+            status['error'] = lines[-1] if lines else f"exit code {returncode}"
+        except OSError:
+            status['error'] = f"exit code {returncode}"
+    return status
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    data_dir = "data"
+    if args[:1] == ["--data-dir"]:
+        data_dir, args = args[1], args[2:]
+    result = run_entity_resolution(data_dir, workers=int(args[0]) if args else None)
+    stats = result["stats"]
+    print(f"{stats['records']} records from {stats['encoders']} encoders, {stats['candidate_pairs']} candidate pairs")
+    print(f"{len(result['clusters'])} clusters in {stats['total_seconds']}s")
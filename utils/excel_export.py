@@ -0,0 +1,158 @@
+"""
+Streaming export of CPMS sheet data to Excel.
+Rows are written one at a time from iterators into a constant-memory writer
+(xlsxwriter constant_memory, or openpyxl write-only mode), so an export never holds
+a DataFrame or a whole workbook object graph for the dataset.
+"""
+
+import io
+import csv
+import zipfile
+import itertools
+
+try:
+    import xlsxwriter
+    XLSXWRITER_AVAILABLE = True
+except ImportError:
+    XLSXWRITER_AVAILABLE = False
+
+try:
+    from openpyxl import Workbook
+    from openpyxl.utils import get_column_letter
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+# Columns exported as text rather than letting Excel turn them into dates
+TEXT_COLUMN_PREFIXES = ("Date Created",)
+TEXT_COLUMN_WIDTH = 24
+
+def is_text_column(column):
+    """Check if a column must be exported as text"""
+    return str(column).startswith(TEXT_COLUMN_PREFIXES)
+
+def peek_rows(rows):
+    """Get (first row, iterator over all rows), or (None, None) if there are no rows"""
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return None, None
+    return first, itertools.chain([first], rows)
+
+def excel_value(value, as_text=False):
+    """Convert a stored cell value to something the Excel writers accept"""
+    if value is None:
+        return ""
+    if as_text or not isinstance(value, (int, float, bool)):
+        return str(value)
+    if isinstance(value, float) and value != value:  # NaN
+        return ""
+    return value
+
+def _write_xlsxwriter(output, sheets, summary_rows):
+    workbook = xlsxwriter.Workbook(output, {
+        'constant_memory': True,
+        'strings_to_numbers': False,
+        'strings_to_formulas': False,
+        'strings_to_urls': False
+    })
+    text_format = workbook.add_format({'num_format': '@'})
+    has_data = False
+    
+    for sheet_name, columns, rows in sheets:
+        first, rows = peek_rows(rows) if columns else (None, None)
+        if first is None:
+            continue
+        has_data = True
+        
+        worksheet = workbook.add_worksheet(sheet_name)
+        text_columns = {col_idx for col_idx, column in enumerate(columns) if is_text_column(column)}
+        for col_idx in text_columns:
+            worksheet.set_column(col_idx, col_idx, TEXT_COLUMN_WIDTH, text_format)
+        
+        # constant_memory mode requires writing strictly row by row
+        worksheet.write_row(0, 0, [str(column) for column in columns])
+        for row_idx, row in enumerate(rows, start=1):
+            for col_idx, value in enumerate(row[:len(columns)]):
+                if col_idx in text_columns:
+                    worksheet.write_string(row_idx, col_idx, excel_value(value, as_text=True), text_format)
+                else:
+                    value = excel_value(value)
+                    if isinstance(value, str):
+                        worksheet.write_string(row_idx, col_idx, value)
+                    else:
+                        worksheet.write(row_idx, col_idx, value)
+    
+    if not has_data:
+        worksheet = workbook.add_worksheet('Summary')
+        for row_idx, row in enumerate(summary_rows):
+            worksheet.write_row(row_idx, 0, row)
+    
+    workbook.close()
+    return has_data
+
+def _write_openpyxl(output, sheets, summary_rows):
+    workbook = Workbook(write_only=True)
+    has_data = False
+    
+    for sheet_name, columns, rows in sheets:
+        first, rows = peek_rows(rows) if columns else (None, None)
+        if first is None:
+            continue
+        has_data = True
+        
+        worksheet = workbook.create_sheet(sheet_name)
+        text_columns = {col_idx for col_idx, column in enumerate(columns) if is_text_column(column)}
+        # Write-only sheets take column widths before any rows are appended
+        for col_idx in text_columns:
+            worksheet.column_dimensions[get_column_letter(col_idx + 1)].width = TEXT_COLUMN_WIDTH
+        
+        worksheet.append([str(column) for column in columns])
+        for row in rows:
+            worksheet.append([
+                excel_value(value, as_text=col_idx in text_columns)
+                for col_idx, value in enumerate(row[:len(columns)])
+            ])
+    
+    if not has_data:
+        worksheet = workbook.create_sheet('Summary')
+        for row in summary_rows:
+            worksheet.append(row)
+    
+    workbook.save(output)
+    return has_data
+
+def write_workbook(output, sheets, summary_rows):
+    """
+    Stream sheets into an .xlsx file and return whether any sheet had rows.
+    sheets is an iterable of (sheet_name, columns, row iterator); sheets without rows
+    are left out. If none has rows, a Summary sheet with summary_rows is written instead.
+    """
+    if XLSXWRITER_AVAILABLE:
+        return _write_xlsxwriter(output, sheets, summary_rows)
+    if OPENPYXL_AVAILABLE:
+        return _write_openpyxl(output, sheets, summary_rows)
+    raise RuntimeError("No Excel engine available (install xlsxwriter or openpyxl)")
+
+def write_csv_zip(output, sheets, summary_rows):
+    """
+    Stream sheets into a zip of CSV files, for when no Excel engine is installed.
+    Sheets without rows are written with just their header. Returns whether any sheet had rows.
+    """
+    has_data = False
+    with zipfile.ZipFile(output, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for sheet_name, columns, rows in sheets:
+            if not columns:
+                continue
+            with zip_file.open(f"{sheet_name}.csv", 'w') as raw_file:
+                with io.TextIOWrapper(raw_file, encoding='utf-8', newline='') as csv_file:
+                    writer = csv.writer(csv_file)
+                    writer.writerow(columns)
+                    for row in rows:
+                        writer.writerow(row)
+                        has_data = True
+        
+        with zip_file.open("Export_Summary.csv", 'w') as raw_file:
+            with io.TextIOWrapper(raw_file, encoding='utf-8', newline='') as csv_file:
+                csv.writer(csv_file).writerows(summary_rows)
+    return has_data
@@ -0,0 +1,134 @@
+"""
+Crash-safe file storage helpers shared by every JSON store in CPMS.
+Writes go to a temp file in the same directory, are fsynced and then renamed over
+the target, so readers see either the old or the new file and never a partial one.
+Advisory fcntl locks on a <file>.lock sidecar serialize writers across Streamlit
+worker processes.
+"""
+
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl  # For file locking on Unix systems
+    FCNTL_AVAILABLE = True
+except ImportError:
+    FCNTL_AVAILABLE = False
+
+# Locks held by the current thread: lock path -> [lock file, hold count]
+_held_locks = threading.local()
+
+# Without fcntl, fall back to serializing writers within this process only
+_process_locks = {}
+_process_locks_guard = threading.Lock()
+
+def _get_held_locks():
+    if not hasattr(_held_locks, "locks"):
+        _held_locks.locks = {}
+    return _held_locks.locks
+
+def _get_process_lock(lock_path):
+    with _process_locks_guard:
+        return _process_locks.setdefault(lock_path, threading.RLock())
+
+@contextmanager
+def file_lock(path, shared=False):
+    """
+    Hold an advisory lock for a file across processes.
+    The lock is taken on a <path>.lock sidecar because atomic writes replace the file
+    itself. Re-entering a lock the thread already holds is a no-op.
+    """
+    lock_path = os.path.abspath(f"{path}.lock")
+    held = _get_held_locks()
+    if lock_path in held:
+        held[lock_path][1] += 1
+        try:
+            yield
+        finally:
+            held[lock_path][1] -= 1
+        return
+    
+    directory = os.path.dirname(lock_path)
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    
+    if FCNTL_AVAILABLE:
+        lock_file = open(lock_path, 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        except Exception:
+            lock_file.close()
+            raise
+    else:
+        lock_file = _get_process_lock(lock_path)
+        lock_file.acquire()
+    
+    held[lock_path] = [lock_file, 1]
+    try:
+        yield
+    finally:
+        del held[lock_path]
+        if FCNTL_AVAILABLE:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            lock_file.close()
+        else:
+            lock_file.release()
+
+def _fsync_directory(directory):
+    """Flush a directory entry so a completed rename survives a crash"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write_bytes(path, content):
+    """Replace a file with new content via temp file + fsync + rename, under its file lock"""
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    
+    with file_lock(path):
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        _fsync_directory(directory)
+
+def atomic_write_json(path, data, **dump_options):
+    """Replace a JSON file atomically; dump_options are passed to json.dumps"""
+    atomic_write_bytes(path, json.dumps(data, **dump_options).encode('utf-8'))
+
+def read_json(path, default=None):
+    """Read a JSON file, returning default if it does not exist"""
+    if not os.path.exists(path):
+        return default
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+@contextmanager
+def locked_json(path, default=None, **dump_options):
+    """
+    Read-modify-write a JSON file while holding its lock:
+        
+        with locked_json(path, {}) as data:
+            data["key"] = "value"
+    
+    The file is rewritten atomically when the block exits without an exception.
+    """
+    with file_lock(path):
+        data = read_json(path, default)
+        yield data
+        atomic_write_json(path, data, **dump_options)
@@ -5,7 +5,415 @@ Contains hierarchical location data for the Philippines: Region → Province →
 
 import streamlit as st
 import pandas as pd
+import csv
 import os
+import mmap
+import array
+import struct
+import hashlib
+import bisect
+import threading
+import unicodedata
+from utils.file_storage import atomic_write_bytes
+
+# Pseudo-province offered under Region XI so encoders can pick Davao City directly
+DAVAO_CITY_PROVINCE = "CITY OF DAVAO"
+DAVAO_CITY_NAME = "DAVAO CITY"
+DAVAO_REGION = "REGION XI (DAVAO REGION)"
+
+# PSGC source files, in hierarchy order
+LOCATION_SOURCE_FILES = ("refregion.csv", "refprovince.csv", "refcitymun.csv", "refbrgy.csv")
+
+# Compiled binary snapshot of the source files (see LocationIndex.write_snapshot)
+SNAPSHOT_FILE = "psgc_snapshot.bin"
+SNAPSHOT_MAGIC = b"PSGC"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_BYTE_ORDER = 0x01020304
+# magic, version, byte order, source signature, SHA-256 of the body, six counts
+SNAPSHOT_HEADER = struct.Struct("=4sII32s32s6I")
+
+# Fixed widths of the numeric PSGC codes, used to restore leading zeros
+REGION_CODE_WIDTH = 2
+PROVINCE_CODE_WIDTH = 4
+CITY_CODE_WIDTH = 6
+
+# Length of the n-grams used by the location search index
+SEARCH_GRAM_SIZE = 3
+
+def normalize_location_name(text):
+    """Normalize a location name for searching: lowercase, no accents, single spaces"""
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+def _u32_array(values=()):
+    """Create an unsigned 32-bit array"""
+    return array.array('I', values)
+
+class LocationIndex:
+    """In-memory PSGC hierarchy keyed by code, built once per process"""
+    
+    def __init__(self, data_dir="data", use_snapshot=True):
+        self.data_dir = data_dir
+        self.snapshot_path = os.path.join(data_dir, SNAPSHOT_FILE)
+        
+        self.regions = ()               # Region names in PSGC order
+        self.region_codes = {}          # Region name -> regCode
+        self.province_codes = {}        # Province name -> provCode
+        self.city_codes = {}            # (provCode, city name) -> citymunCode
+        self.first_city_codes = {}      # City name -> first citymunCode in file order
+        self.provinces_by_region = {}   # regCode -> sorted tuple of province names
+        self.cities_by_province = {}    # provCode -> sorted tuple of city names
+        self.barangays_by_city = {}     # citymunCode -> sorted tuple of barangay names
+        
+        # Snapshot state for lazily decoding barangays
+        self._snapshot = None
+        self._strings = None
+        self._city_slots = {}           # citymunCode -> city position in the snapshot
+        
+        # Search index, built on first search
+        self._search_entries = None     # (normalized name, region, province, city, barangay or None)
+        self._search_grams = None       # n-gram -> list of entry ids
+        self._search_sorted = None      # sorted (normalized name, entry id) for short prefix queries
+        self._search_lock = threading.Lock()
+        
+        if use_snapshot and self.load_snapshot():
+            return
+        
+        self.build()
+        if use_snapshot:
+            try:
+                self.write_snapshot()
+            except OSError as e:
+                print(f"Error writing location snapshot: {e}")
+    
+    def _read_rows(self, filename):
+        """Yield rows of a PSGC CSV file as dictionaries"""
+        with open(os.path.join(self.data_dir, filename), 'r', encoding='utf-8', newline='') as f:
+            yield from csv.DictReader(f)
+    
+    def source_signature(self):
+        """Get a SHA-256 digest over the contents of the PSGC source files"""
+        digest = hashlib.sha256()
+        for filename in LOCATION_SOURCE_FILES:
+            digest.update(filename.encode())
+            with open(os.path.join(self.data_dir, filename), 'rb') as f:
+                digest.update(f.read())
+        return digest.digest()
+    
+    def build(self):
+        """Parse the PSGC CSV files and build the lookup tables"""
+        regions = []
+        for row in self._read_rows("refregion.csv"):
+            name = row['regDesc']
+            if name not in self.region_codes:
+                regions.append(name)
+                self.region_codes[name] = row['regCode']
+        
+        provinces = {}
+        for row in self._read_rows("refprovince.csv"):
+            self.province_codes.setdefault(row['provDesc'], row['provCode'])
+            provinces.setdefault(row['regCode'], set()).add(row['provDesc'])
+        
+        cities = {}
+        for row in self._read_rows("refcitymun.csv"):
+            name = row['citymunDesc']
+            self.city_codes.setdefault((row['provCode'], name), row['citymunCode'])
+            self.first_city_codes.setdefault(name, row['citymunCode'])
+            cities.setdefault(row['provCode'], set()).add(name)
+        
+        barangays = {}
+        for row in self._read_rows("refbrgy.csv"):
+            barangays.setdefault(row['citymunCode'], set()).add(row['brgyDesc'])
+        
+        self.regions = tuple(regions)
+        self.provinces_by_region = {code: tuple(sorted(names)) for code, names in provinces.items()}
+        self.cities_by_province = {code: tuple(sorted(names)) for code, names in cities.items()}
+        self.barangays_by_city = {code: tuple(sorted(names)) for code, names in barangays.items()}
+    
+    def write_snapshot(self, path=None):
+        """
+        Compile the lookup tables into a binary snapshot.
+        
+        Layout after the header: string offsets and the interned UTF-8 string blob,
+        then for each level its integer codes, name ids and (except barangays) the
+        offsets of its children in the next level. All arrays are native uint32.
+        """
+        path = path or self.snapshot_path
+        string_ids = {}
+        string_offsets = _u32_array([0])
+        blob = bytearray()
+        
+        def intern(name):
+            if name not in string_ids:
+                string_ids[name] = len(string_ids)
+                blob.extend(name.encode('utf-8'))
+                string_offsets.append(len(blob))
+            return string_ids[name]
+        
+        region_codes, region_names, region_children = _u32_array(), _u32_array(), _u32_array([0])
+        prov_codes, prov_names, prov_children = _u32_array(), _u32_array(), _u32_array([0])
+        city_codes, city_names, city_first, city_children = _u32_array(), _u32_array(), _u32_array(), _u32_array([0])
+        brgy_names = _u32_array()
+        
+        for region in self.regions:
+            region_code = self.region_codes[region]
+            region_codes.append(int(region_code))
+            region_names.append(intern(region))
+            for province in self.provinces_by_region.get(region_code, ()):
+                prov_code = self.province_codes[province]
+                prov_codes.append(int(prov_code))
+                prov_names.append(intern(province))
+                for city in self.cities_by_province.get(prov_code, ()):
+                    city_code = self.city_codes[(prov_code, city)]
+                    city_codes.append(int(city_code))
+                    city_names.append(intern(city))
+                    city_first.append(int(self.first_city_codes.get(city) == city_code))
+                    brgy_names.extend(intern(name) for name in self.barangays_by_city.get(city_code, ()))
+                    city_children.append(len(brgy_names))
+                prov_children.append(len(city_codes))
+            region_children.append(len(prov_codes))
+        
+        # Pad the blob so the arrays after it stay 4-byte aligned
+        blob.extend(b"\0" * (-len(blob) % 4))
+        
+        body = b"".join(values.tobytes() if isinstance(values, array.array) else bytes(values) for values in (
+            string_offsets, blob,
+            region_codes, region_names, region_children,
+            prov_codes, prov_names, prov_children,
+            city_codes, city_names, city_first, city_children,
+            brgy_names
+        ))
+        header = SNAPSHOT_HEADER.pack(
+            SNAPSHOT_MAGIC, SNAPSHOT_VERSION, SNAPSHOT_BYTE_ORDER, self.source_signature(), hashlib.sha256(body).digest(),
+            len(string_ids), len(blob), len(region_codes), len(prov_codes), len(city_codes), len(brgy_names)
+        )
+        
+        # A unique temp file per writer, so concurrent first loads never mix their output
+        atomic_write_bytes(path, header + body)
+        return path
+    
+    def load_snapshot(self, path=None):
+        """Load the lookup tables from a binary snapshot if it matches the source files"""
+        path = path or self.snapshot_path
+        try:
+            with open(path, 'rb') as f:
+                snapshot = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return False
+        
+        try:
+            magic, version, byte_order, signature, body_digest, \
+                n_strings, blob_len, n_regions, n_provinces, n_cities, n_barangays = SNAPSHOT_HEADER.unpack_from(snapshot, 0)
+            if (magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or
+                    byte_order != SNAPSHOT_BYTE_ORDER or signature != self.source_signature() or
+                    hashlib.sha256(snapshot[SNAPSHOT_HEADER.size:]).digest() != body_digest):
+                snapshot.close()
+                return False
+            
+            view = memoryview(snapshot)
+            position = SNAPSHOT_HEADER.size
+            
+            def take_u32(count):
+                nonlocal position
+                values = view[position:position + count * 4].cast('I')
+                position += count * 4
+                return values
+            
+            string_offsets = take_u32(n_strings + 1)
+            blob = view[position:position + blob_len]
+            position += blob_len
+            region_codes, region_names, region_children = take_u32(n_regions), take_u32(n_regions), take_u32(n_regions + 1)
+            prov_codes, prov_names, prov_children = take_u32(n_provinces), take_u32(n_provinces), take_u32(n_provinces + 1)
+            city_codes, city_names, city_first, city_children = \
+                take_u32(n_cities), take_u32(n_cities), take_u32(n_cities), take_u32(n_cities + 1)
+            brgy_names = take_u32(n_barangays)
+        except (struct.error, TypeError, ValueError):
+            snapshot.close()
+            return False
+        
+        self._snapshot = snapshot
+        self._strings = [None] * n_strings
+        self._string_offsets = string_offsets
+        self._string_blob = blob
+        self._city_children = city_children
+        self._brgy_names = brgy_names
+        
+        regions = []
+        for r in range(n_regions):
+            region = self._string(region_names[r])
+            region_code = str(region_codes[r]).zfill(REGION_CODE_WIDTH)
+            regions.append(region)
+            self.region_codes[region] = region_code
+            provinces = []
+            for p in range(region_children[r], region_children[r + 1]):
+                province = self._string(prov_names[p])
+                prov_code = str(prov_codes[p]).zfill(PROVINCE_CODE_WIDTH)
+                provinces.append(province)
+                self.province_codes[province] = prov_code
+                cities = []
+                for c in range(prov_children[p], prov_children[p + 1]):
+                    city = self._string(city_names[c])
+                    city_code = str(city_codes[c]).zfill(CITY_CODE_WIDTH)
+                    cities.append(city)
+                    self.city_codes[(prov_code, city)] = city_code
+                    if city_first[c]:
+                        self.first_city_codes[city] = city_code
+                    self._city_slots[city_code] = c
+                self.cities_by_province[prov_code] = tuple(cities)
+            self.provinces_by_region[region_code] = tuple(provinces)
+        self.regions = tuple(regions)
+        return True
+    
+    def _string(self, string_id):
+        """Decode an interned snapshot string, sharing one object per id"""
+        value = self._strings[string_id]
+        if value is None:
+            start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1]
+            value = self._strings[string_id] = bytes(self._string_blob[start:end]).decode('utf-8')
+        return value
+    
+    def get_regions(self):
+        """Get all region names"""
+        return self.regions
+    
+    def get_provinces(self, region):
+        """Get province names for a region"""
+        provinces = self.provinces_by_region.get(self.region_codes.get(region), ())
+        # Always offer 'CITY OF DAVAO' under Region XI
+        if region == DAVAO_REGION and DAVAO_CITY_PROVINCE not in provinces:
+            provinces = provinces + (DAVAO_CITY_PROVINCE,)
+        return provinces
+    
+    def get_cities(self, province):
+        """Get city/municipality names for a province"""
+        if province == DAVAO_CITY_PROVINCE:
+            return (DAVAO_CITY_NAME,)
+        return self.cities_by_province.get(self.province_codes.get(province), ())
+    
+    def get_city_code(self, city, province=None):
+        """Resolve a city name to its code, scoped to the province when given"""
+        if province and province != DAVAO_CITY_PROVINCE:
+            code = self.city_codes.get((self.province_codes.get(province), city))
+            if code:
+                return code
+        return self.first_city_codes.get(city)
+    
+    def get_barangays(self, city, province=None):
+        """Get barangay names for a city/municipality"""
+        city_code = self.get_city_code(city, province)
+        barangays = self.barangays_by_city.get(city_code)
+        if barangays is None:
+            slot = self._city_slots.get(city_code)
+            if slot is None:
+                return ()
+            # Decode this city's barangays from the snapshot on first use
+            barangays = tuple(
+                self._string(self._brgy_names[b])
+                for b in range(self._city_children[slot], self._city_children[slot + 1])
+            )
+            self.barangays_by_city[city_code] = barangays
+        return barangays
+
+    
+    def _build_search_index(self):
+        """Build the n-gram index over all cities/municipalities and barangays"""
+        entries = []
+        for region in self.regions:
+            for province in self.provinces_by_region.get(self.region_codes[region], ()):
+                for city in self.get_cities(province):
+                    entries.append((normalize_location_name(city), region, province, city, None))
+                    for barangay in self.get_barangays(city, province):
+                        entries.append((normalize_location_name(barangay), region, province, city, barangay))
+        
+        grams = {}
+        for entry_id, entry in enumerate(entries):
+            name = entry[0]
+            for gram in {name[i:i + SEARCH_GRAM_SIZE] for i in range(len(name) - SEARCH_GRAM_SIZE + 1)}:
+                grams.setdefault(gram, []).append(entry_id)
+        
+        self._search_sorted = sorted((entry[0], entry_id) for entry_id, entry in enumerate(entries))
+        self._search_grams = grams
+        self._search_entries = entries
+    
+    def _candidate_ids(self, query):
+        """Get ids of entries whose normalized name contains the query"""
+        if len(query) < SEARCH_GRAM_SIZE:
+            # Too short for n-grams: only match name prefixes
+            start = bisect.bisect_left(self._search_sorted, (query,))
+            ids = []
+            for name, entry_id in self._search_sorted[start:]:
+                if not name.startswith(query):
+                    break
+                ids.append(entry_id)
+            return ids
+        
+        postings = []
+        for gram in {query[i:i + SEARCH_GRAM_SIZE] for i in range(len(query) - SEARCH_GRAM_SIZE + 1)}:
+            posting = self._search_grams.get(gram)
+            if not posting:
+                return []
+            postings.append(posting)
+        postings.sort(key=len)
+        
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        # N-grams can match out of order, so confirm the substring
+        return [entry_id for entry_id in candidates if query in self._search_entries[entry_id][0]]
+    
+    def search(self, query, limit=20):
+        """
+        Search cities/municipalities and barangays by name across the whole hierarchy.
+        Returns up to `limit` location dictionaries with region, province, city and barangay
+        (None for city matches), ranked exact > prefix > word prefix > substring.
+        """
+        query = normalize_location_name(query)
+        if not query:
+            return []
+        if self._search_entries is None:
+            with self._search_lock:
+                if self._search_entries is None:
+                    self._build_search_index()
+        
+        ranked = []
+        for entry_id in self._candidate_ids(query):
+            name, region, province, city, barangay = self._search_entries[entry_id]
+            if name == query:
+                rank = 0
+            elif name.startswith(query):
+                rank = 1
+            elif f" {query}" in name or f"({query}" in name:
+                rank = 2
+            else:
+                rank = 3
+            ranked.append((rank, barangay is not None, len(name), name, entry_id))
+        ranked.sort()
+        
+        results = []
+        for *_, entry_id in ranked[:limit]:
+            _, region, province, city, barangay = self._search_entries[entry_id]
+            results.append({"region": region, "province": province, "city": city, "barangay": barangay})
+        return results
+
+_location_index = None
+_location_index_lock = threading.Lock()
+
+def get_location_index():
+    """Get the process-wide location index, building it on first use"""
+    global _location_index
+    if _location_index is None:
+        with _location_index_lock:
+            if _location_index is None:
+                _location_index = LocationIndex()
+    return _location_index
+
+def build_location_snapshot(data_dir="data"):
+    """Compile the PSGC CSV files into a binary snapshot for fast worker start-up"""
+    index = LocationIndex(data_dir, use_snapshot=False)
+    return index.write_snapshot()
 
 def load_location_data():
     """Load Philippine location data from CSV files"""
@@ -21,114 +429,139 @@ def load_location_data():
 
 def load_provinces():
     """Get dictionary of provinces by name"""
-    _, provinces_df, _, _ = load_location_data()
-    provinces = provinces_df['provDesc'].unique()
-    return {prov: prov for prov in sorted(provinces)}
+    return {prov: prov for prov in sorted(get_location_index().province_codes)}
 
 def load_cities(province):
     """Get list of cities/municipalities for a given province"""
-    _, provinces_df, cities_df, _ = load_location_data()
-    
-    if province == "CITY OF DAVAO":
-        return ["DAVAO CITY"]
-    
-    province_row = provinces_df[provinces_df['provDesc'] == province]
-    if not province_row.empty:
-        province_code = province_row['provCode'].iloc[0]
-        cities = cities_df[cities_df['provCode'] == province_code]['citymunDesc'].unique()
-        return sorted(cities)
-    return []
+    return list(get_location_index().get_cities(province))
 
-def load_barangays(city):
+def load_barangays(city, province=None):
     """Get list of barangays for a given city/municipality"""
-    _, _, cities_df, barangays_df = load_location_data()
+    return list(get_location_index().get_barangays(city, province))
+
+def format_location_path(location):
+    """Format a location as 'Barangay, City, Province, Region'"""
+    parts = [location.get("barangay"), location["city"], location["province"], location["region"]]
+    return ", ".join(part for part in parts if part)
+
+def _apply_location_search(matches):
+    """Fill all location levels from the chosen search match"""
+    location = matches.get(st.session_state.get("loc_search_choice"))
+    if not location:
+        return
+    
+    st.session_state.loc_region = st.session_state.loc_region_select = location["region"]
+    st.session_state.loc_province = st.session_state.loc_province_select = location["province"]
+    st.session_state.loc_city = st.session_state.loc_city_select = location["city"]
+    st.session_state.loc_barangay = location["barangay"]
+    if location["barangay"]:
+        st.session_state.loc_barangay_select = location["barangay"]
+    elif "loc_barangay_select" in st.session_state:
+        del st.session_state["loc_barangay_select"]
+
+def create_location_search(locations):
+    """Create a type-ahead search that fills region, province, city and barangay at once"""
+    col1, col2 = st.columns([2, 3])
     
-    city_row = cities_df[cities_df['citymunDesc'] == city]
-    if not city_row.empty:
-        city_code = city_row['citymunCode'].iloc[0]
-        barangays = barangays_df[barangays_df['citymunCode'] == city_code]['brgyDesc'].unique()
-        return sorted(barangays)
-    return []
+    with col1:
+        query = st.text_input(
+            "Search Location",
+            key="loc_search_query",
+            placeholder="Type a barangay or city name...",
+            help="Pick a match to fill all location fields at once"
+        )
+    
+    with col2:
+        matches = {format_location_path(location): location for location in locations.search(query)} if query.strip() else {}
+        if matches:
+            st.selectbox(
+                "Matching Locations",
+                [""] + list(matches),
+                key="loc_search_choice",
+                on_change=_apply_location_search,
+                args=(matches,)
+            )
+        elif query.strip():
+            st.caption("No matching barangay or city found")
+
+# Cascade levels with their session state and dropdown widget keys, top to bottom
+LOCATION_LEVELS = (
+    ("loc_region", "loc_region_select"),
+    ("loc_province", "loc_province_select"),
+    ("loc_city", "loc_city_select"),
+    ("loc_barangay", "loc_barangay_select"),
+)
+
+# Fragments rerun only the location widgets instead of the whole page
+_location_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", lambda func: func)
 
+def _reset_location_levels(level):
+    """Clear the dropdowns below a changed location level so they fall back to their first option"""
+    for _, widget_key in LOCATION_LEVELS[level + 1:]:
+        if widget_key in st.session_state:
+            del st.session_state[widget_key]
+
+def _sync_cleared_locations():
+    """Clear dropdowns whose selection was reset to None by the caller (e.g. after a form submit)"""
+    for level, (state_key, widget_key) in enumerate(LOCATION_LEVELS):
+        if st.session_state.get(state_key) is None and widget_key in st.session_state:
+            del st.session_state[widget_key]
+            _reset_location_levels(level)
+            break
+
+@_location_fragment
 def create_location_widgets():
-    """Create simple cascading dropdown widgets without forms"""
+    """Create cascading dropdown widgets that update in place without rerunning the page"""
     
     # Load data
-    regions_df, provinces_df, cities_df, barangays_df = load_location_data()
+    locations = get_location_index()
     
     # Initialize session state for location selections
-    if 'loc_region' not in st.session_state:
-        st.session_state.loc_region = None
-    if 'loc_province' not in st.session_state:
-        st.session_state.loc_province = None
-    if 'loc_city' not in st.session_state:
-        st.session_state.loc_city = None
-    if 'loc_barangay' not in st.session_state:
-        st.session_state.loc_barangay = None
+    for state_key, _ in LOCATION_LEVELS:
+        if state_key not in st.session_state:
+            st.session_state[state_key] = None
+    _sync_cleared_locations()
+    
+    create_location_search(locations)
     
     # Create 4 columns for each location level
     col1, col2, col3, col4 = st.columns(4)
     
     with col1:
-        regions = regions_df['regDesc'].unique()
-        selected_region = st.selectbox("Region *", regions, key="loc_region_select", label_visibility="visible")
-        
-        # Update session state when region changes
-        if selected_region != st.session_state.loc_region:
-            st.session_state.loc_region = selected_region
-            st.session_state.loc_province = None
-            st.session_state.loc_city = None
-            st.session_state.loc_barangay = None
-            st.rerun()
+        regions = locations.get_regions()
+        selected_region = st.selectbox(
+            "Region *", regions, key="loc_region_select", label_visibility="visible",
+            on_change=_reset_location_levels, args=(0,)
+        )
+        st.session_state.loc_region = selected_region
     
     with col2:
         if st.session_state.loc_region:
-            region_code = regions_df[regions_df['regDesc'] == st.session_state.loc_region]['regCode'].iloc[0]
-            provinces = provinces_df[provinces_df['regCode'] == region_code]['provDesc'].unique().tolist()
-            # Always append 'CITY OF DAVAO' for Region XI
-            if st.session_state.loc_region == "REGION XI (DAVAO REGION)" and "CITY OF DAVAO" not in provinces:
-                provinces.append("CITY OF DAVAO")
-            selected_province = st.selectbox("Select Province:", provinces, key="loc_province_select")
-            
-            # Update session state when province changes
-            if selected_province != st.session_state.loc_province:
-                st.session_state.loc_province = selected_province
-                st.session_state.loc_city = None
-                st.session_state.loc_barangay = None
-                st.rerun()
+            provinces = locations.get_provinces(st.session_state.loc_region)
+            selected_province = st.selectbox(
+                "Select Province:", provinces, key="loc_province_select",
+                on_change=_reset_location_levels, args=(1,)
+            )
+            st.session_state.loc_province = selected_province
         else:
             selected_province = st.selectbox("Select Province:", ["Select Region First"], key="loc_province_select")
     
     with col3:
         if st.session_state.loc_province:
-            if st.session_state.loc_province == "CITY OF DAVAO":
-                cities = ["DAVAO CITY"]
-            else:
-                province_row = provinces_df[provinces_df['provDesc'] == st.session_state.loc_province]
-                if not province_row.empty:
-                    province_code = province_row['provCode'].iloc[0]
-                    cities = cities_df[cities_df['provCode'] == province_code]['citymunDesc'].unique()
-                else:
-                    cities = []
-            selected_city = st.selectbox("Select City:", cities, key="loc_city_select")
-            
-            # Update session state when city changes
-            if selected_city != st.session_state.loc_city:
-                st.session_state.loc_city = selected_city
-                st.session_state.loc_barangay = None
-                st.rerun()
+            cities = locations.get_cities(st.session_state.loc_province)
+            selected_city = st.selectbox(
+                "Select City:", cities, key="loc_city_select",
+                on_change=_reset_location_levels, args=(2,)
+            )
+            st.session_state.loc_city = selected_city
         else:
             selected_city = st.selectbox("Select City:", ["Select Province First"], key="loc_city_select")
     
     with col4:
         if st.session_state.loc_city:
-            city_code = cities_df[cities_df['citymunDesc'] == st.session_state.loc_city]['citymunCode'].iloc[0]
-            barangays = barangays_df[barangays_df['citymunCode'] == city_code]['brgyDesc'].unique()
+            barangays = locations.get_barangays(st.session_state.loc_city, st.session_state.loc_province)
             selected_barangay = st.selectbox("Select Barangay:", barangays, key="loc_barangay_select")
-            
-            # Update session state when barangay changes
-            if selected_barangay != st.session_state.loc_barangay:
-                st.session_state.loc_barangay = selected_barangay
+            st.session_state.loc_barangay = selected_barangay
         else:
             selected_barangay = st.selectbox("Select Barangay:", ["Select City First"], key="loc_barangay_select")
     
@@ -139,4 +572,7 @@ def create_location_widgets():
         "city": st.session_state.loc_city or selected_city,
         "barangay": st.session_state.loc_barangay or selected_barangay,
         "purok": "N/A"  # Purok data not available in standard PSGC
-    }
\ No newline at end of file
+    }
+
+if __name__ == "__main__":
+    print(f"Location snapshot written to {build_location_snapshot()}")
@@ -3,87 +3,379 @@ PSIC (Philippine Standard Industrial Classification) Handler
 Loads and provides cascading dropdown functionality for PSIC data from Excel file
 """
 
-import pandas as pd
 import streamlit as st
+import openpyxl
+import hashlib
+import bisect
+import json
+import math
 import os
+import re
+import threading
+from utils.file_storage import atomic_write_json
 
-@st.cache_data
-def load_psic_data():
-    """Load and organize PSIC data from Excel file"""
-    file_path = "data/2019_Updates_to_the_2009_PSIC_08112021.xlsx"
-    
-    psic_hierarchy = {
+PSIC_WORKBOOK = "data/2019_Updates_to_the_2009_PSIC_08112021.xlsx"
+PSIC_INDEX_FILE = "data/psic_index.json"
+PSIC_INDEX_VERSION = 2
+
+# Digit lengths of PSIC codes below the division level
+PSIC_GROUP_LENGTH = 3
+PSIC_CLASS_LENGTH = 4
+PSIC_SUBCLASS_LENGTH = 5
+PSIC_CODE_LENGTHS = (PSIC_GROUP_LENGTH, PSIC_CLASS_LENGTH, PSIC_SUBCLASS_LENGTH)
+
+# Hierarchy levels, top to bottom
+PSIC_LEVELS = ('section', 'division', 'group', 'class', 'subclass')
+PSIC_LEVEL_KEYS = {
+    'section': 'sections',
+    'division': 'divisions',
+    'group': 'groups',
+    'class': 'classes',
+    'subclass': 'subclasses'
+}
+
+def _empty_psic_hierarchy():
+    """Get an empty PSIC hierarchy structure"""
+    return {
         'sections': {},  # Section code -> description
         'divisions': {},  # Division code -> {'description': str, 'section': section_code}
         'groups': {},    # Group code -> {'description': str, 'division': division_code}
+        'classes': {},   # Class code -> {'description': str, 'group': group_code}
+        'subclasses': {},  # Sub-class code -> {'description': str, 'class': class_code}
         'section_divisions': {},  # Section -> List of divisions
-        'division_groups': {}     # Division -> List of groups
+        'division_groups': {},    # Division -> List of groups
+        'group_classes': {},      # Group -> List of classes
+        'class_subclasses': {}    # Class -> List of sub-classes
     }
+
+def _file_sha256(file_path):
+    """Get the SHA-256 hex digest of a file"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _psic_code(value, division):
+    """Get the PSIC code in a cell as a digit string, or None if the cell is not a code"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        if value != int(value):
+            return None
+        # Numeric cells lose leading zeros; restore them from the current division
+        digits = str(int(value))
+        for length in PSIC_CODE_LENGTHS:
+            if length >= len(digits) and digits.zfill(length).startswith(division):
+                return digits.zfill(length)
+        return None
     
-    if not os.path.exists(file_path):
-        return psic_hierarchy
+    if isinstance(value, str):
+        code = value.strip()
+        if code.isdigit() and len(code) in PSIC_CODE_LENGTHS and code.startswith(division):
+            return code
+    return None
+
+def _add_psic_code(psic_hierarchy, code, description, division):
+    """Add a group, class or sub-class code under its parent"""
+    if len(code) == PSIC_GROUP_LENGTH:
+        level, parent_level, parent, children = 'groups', 'division', division, 'division_groups'
+    elif len(code) == PSIC_CLASS_LENGTH:
+        level, parent_level, parent, children = 'classes', 'group', code[:PSIC_GROUP_LENGTH], 'group_classes'
+    else:
+        level, parent_level, parent, children = 'subclasses', 'class', code[:PSIC_CLASS_LENGTH], 'class_subclasses'
+    
+    if code in psic_hierarchy[level]:
+        return
+    psic_hierarchy[level][code] = {
+        'description': description,
+        parent_level: parent
+    }
+    psic_hierarchy[children].setdefault(parent, []).append(code)
+
+def parse_psic_workbook(file_path=PSIC_WORKBOOK):
+    """Parse the PSIC workbook into the hierarchy with a streaming read-only reader"""
+    psic_hierarchy = _empty_psic_hierarchy()
     
+    workbook = openpyxl.load_workbook(file_path, read_only=True, data_only=True)
     try:
-        xl_file = pd.ExcelFile(file_path)
         current_section = ""
         current_division = ""
         
-        for sheet_name in xl_file.sheet_names:
-            df = pd.read_excel(file_path, sheet_name=sheet_name, header=None)
-            
-            for i in range(len(df)):
-                row_data = df.iloc[i].dropna().tolist()
+        for worksheet in workbook.worksheets:
+            for row in worksheet.iter_rows(values_only=True):
+                row_data = [value for value in row if value is not None and str(value).strip()]
                 if not row_data:
                     continue
-                    
-                text = str(row_data[0])
+                
+                text = str(row_data[0]).strip()
                 
                 # Check for SECTION
-                if 'SECTION' in text and '.' in text:
-                    section_parts = text.split('.')
-                    section_code = section_parts[0].replace('SECTION ', '').strip()
-                    section_desc = section_parts[1].strip()
+                if text.startswith('SECTION') and '.' in text:
+                    section_code, section_desc = text.split('.', 1)
+                    section_code = section_code.replace('SECTION', '').strip()
                     
                     current_section = section_code
-                    psic_hierarchy['sections'][section_code] = section_desc
-                    psic_hierarchy['section_divisions'][section_code] = []
+                    current_division = ""
+                    psic_hierarchy['sections'][section_code] = section_desc.strip()
+                    psic_hierarchy['section_divisions'].setdefault(section_code, [])
                 
-                # Check for DIVISION  
-                elif 'DIVISION' in text and '.' in text and current_section:
-                    div_parts = text.split('.')
-                    div_code = div_parts[0].replace('DIVISION ', '').strip()
-                    div_desc = div_parts[1].strip()
+                # Check for DIVISION
+                elif text.startswith('DIVISION') and '.' in text and current_section:
+                    div_code, div_desc = text.split('.', 1)
+                    div_code = div_code.replace('DIVISION', '').strip()
                     
                     current_division = div_code
                     psic_hierarchy['divisions'][div_code] = {
-                        'description': div_desc,
+                        'description': div_desc.strip(),
                         'section': current_section
                     }
                     psic_hierarchy['section_divisions'][current_section].append(div_code)
-                    psic_hierarchy['division_groups'][div_code] = []
+                    psic_hierarchy['division_groups'].setdefault(div_code, [])
                 
-                # Check for GROUP (3-digit codes)
-                elif len(row_data) >= 2 and current_division:
-                    try:
-                        if isinstance(row_data[0], (int, float)):
-                            group_code = str(int(row_data[0]))
-                            if len(group_code) == 3:
-                                group_desc = str(row_data[1]) if len(row_data) > 1 else ''
-                                
-                                psic_hierarchy['groups'][group_code] = {
-                                    'description': group_desc,
-                                    'division': current_division
-                                }
-                                psic_hierarchy['division_groups'][current_division].append(group_code)
-                    except:
+                # Check for GROUP/CLASS/SUB-CLASS (3/4/5-digit codes); a row may list a code with its
+                # single child code before the shared description
+                elif current_division:
+                    codes = []
+                    for value in row_data:
+                        code = _psic_code(value, current_division)
+                        if code is None:
+                            break
+                        codes.append(code)
+                    if not codes or len(codes) == len(row_data):
                         continue
+                    
+                    description = str(row_data[len(codes)]).strip()
+                    for code in codes:
+                        _add_psic_code(psic_hierarchy, code, description, current_division)
+    finally:
+        workbook.close()
+    
+    return psic_hierarchy
+
+def build_psic_index(file_path=PSIC_WORKBOOK, index_path=PSIC_INDEX_FILE):
+    """Parse the PSIC workbook and save the hierarchy as a compact index keyed by the workbook hash"""
+    psic_hierarchy = parse_psic_workbook(file_path)
+    index = {
+        "version": PSIC_INDEX_VERSION,
+        "source_sha256": _file_sha256(file_path),
+        "hierarchy": psic_hierarchy
+    }
+    
+    # A unique temp file per writer, so concurrent first loads never mix their output
+    atomic_write_json(index_path, index, ensure_ascii=False, separators=(',', ':'))
+    return psic_hierarchy
+
+def load_psic_index(file_path=PSIC_WORKBOOK, index_path=PSIC_INDEX_FILE):
+    """Load the prebuilt PSIC hierarchy, or None if it is missing or out of date"""
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    
+    if index.get("version") != PSIC_INDEX_VERSION or index.get("source_sha256") != _file_sha256(file_path):
+        return None
+    return index.get("hierarchy")
+
+_psic_data = None
+_psic_data_lock = threading.Lock()
+
+def load_psic_data():
+    """Load the PSIC hierarchy once per process, rebuilding the index from the Excel file when stale"""
+    global _psic_data
+    if _psic_data is not None:
+        return _psic_data
+    
+    with _psic_data_lock:
+        if _psic_data is None:
+            psic_hierarchy = _empty_psic_hierarchy()
+            if os.path.exists(PSIC_WORKBOOK):
+                try:
+                    psic_hierarchy = load_psic_index() or build_psic_index()
+                except Exception as e:
+                    print(f"Error loading PSIC data: {e}")
+            _psic_data = psic_hierarchy
+    return _psic_data
+
+def _psic_tokens(text):
+    """Split a PSIC description or query into lowercase word tokens"""
+    return re.findall(r'[a-z0-9]+', str(text).lower())
+
+class PSICSearchIndex:
+    """Inverted index over PSIC section, division, group, class and sub-class descriptions"""
+    
+    # Score weight of a query word that only matches the start of a description word
+    PREFIX_MATCH_WEIGHT = 0.6
+    
+    def __init__(self, psic_data):
+        self.psic_data = psic_data
+        self.entries = []       # (level, code, description)
+        self.postings = {}      # token -> set of entry ids
+        self.codes = []         # sorted (code, entry id) for code prefix queries
         
-        xl_file.close()
+        for level in PSIC_LEVELS:
+            for code, info in psic_data[PSIC_LEVEL_KEYS[level]].items():
+                description = info if level == 'section' else info['description']
+                entry_id = len(self.entries)
+                self.entries.append((level, code, description))
+                self.codes.append((code, entry_id))
+                for token in set(_psic_tokens(description)):
+                    self.postings.setdefault(token, set()).add(entry_id)
         
-    except Exception as e:
-        print(f"Error loading PSIC data: {e}")
+        self.codes.sort()
+        self.vocabulary = sorted(self.postings)
+        self.idf = {
+            token: math.log(1 + len(self.entries) / len(entry_ids))
+            for token, entry_ids in self.postings.items()
+        }
     
-    return psic_hierarchy
+    def _prefix_tokens(self, prefix):
+        """Get vocabulary tokens starting with a prefix"""
+        start = bisect.bisect_left(self.vocabulary, prefix)
+        tokens = []
+        for token in self.vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            tokens.append(token)
+        return tokens
+    
+    def get_path(self, level, code):
+        """Get the (level, code, description) chain from the section down to the given code"""
+        path = []
+        while level:
+            if level == 'section':
+                path.append((level, code, self.psic_data['sections'].get(code, "")))
+                break
+            info = self.psic_data[PSIC_LEVEL_KEYS[level]].get(code, {})
+            path.append((level, code, info.get('description', "")))
+            level = PSIC_LEVELS[PSIC_LEVELS.index(level) - 1]
+            code = info.get(level)
+        return list(reversed(path))
+    
+    def search(self, query, limit=20):
+        """
+        Search PSIC descriptions (or codes, for numeric queries) and return ranked matches.
+        Every query word must match a description word or its prefix.
+        """
+        tokens = _psic_tokens(query)
+        if not tokens:
+            return []
+        
+        scores = {}
+        if len(tokens) == 1 and tokens[0].isdigit():
+            start = bisect.bisect_left(self.codes, (tokens[0],))
+            for code, entry_id in self.codes[start:]:
+                if not code.startswith(tokens[0]):
+                    break
+                scores[entry_id] = 1.0
+        else:
+            for position, token in enumerate(tokens):
+                token_scores = {}
+                for match in self._prefix_tokens(token):
+                    weight = self.idf[match] * (1.0 if match == token else self.PREFIX_MATCH_WEIGHT)
+                    for entry_id in self.postings[match]:
+                        if weight > token_scores.get(entry_id, 0):
+                            token_scores[entry_id] = weight
+                if position == 0:
+                    scores = token_scores
+                else:
+                    scores = {
+                        entry_id: score + token_scores[entry_id]
+                        for entry_id, score in scores.items()
+                        if entry_id in token_scores
+                    }
+                if not scores:
+                    return []
+        
+        ranked = sorted(
+            scores,
+            key=lambda entry_id: (
+                -scores[entry_id],
+                PSIC_LEVELS.index(self.entries[entry_id][0]),
+                self.entries[entry_id][1]
+            )
+        )
+        
+        results = []
+        for entry_id in ranked[:limit]:
+            level, code, description = self.entries[entry_id]
+            path = self.get_path(level, code)
+            result = {'level': level, 'code': code, 'description': description, 'path': path}
+            for path_level, path_code, _ in path:
+                result[path_level] = path_code
+            results.append(result)
+        return results
+
+_psic_search_index = None
+
+def search_psic(query, limit=20):
+    """Search the PSIC hierarchy by description or code"""
+    global _psic_search_index
+    if _psic_search_index is None:
+        psic_data = load_psic_data()
+        with _psic_data_lock:
+            if _psic_search_index is None:
+                _psic_search_index = PSICSearchIndex(psic_data)
+    return _psic_search_index.search(query, limit)
+
+def _psic_option(code, description):
+    """Format a PSIC dropdown option"""
+    return f"{code} - {description}"
+
+def _apply_psic_search(matches):
+    """Fill the PSIC section, division and group dropdowns from the chosen search match"""
+    match = matches.get(st.session_state.get("psic_search_choice"))
+    if not match:
+        return
+    
+    psic_data = load_psic_data()
+    section = match.get('section', "")
+    division = match.get('division', "")
+    group = match.get('group', "")
+    
+    st.session_state.psic_section = section
+    st.session_state.psic_division = division
+    st.session_state.psic_group = group
+    st.session_state.psic_section_select = _psic_option(section, psic_data['sections'][section])
+    for code, level_key, widget_key in (
+        (division, 'divisions', "psic_division_select"),
+        (group, 'groups', "psic_group_select"),
+    ):
+        if code:
+            st.session_state[widget_key] = _psic_option(code, psic_data[level_key][code]['description'])
+        elif widget_key in st.session_state:
+            del st.session_state[widget_key]
+
+def create_psic_search():
+    """Create a description search that fills the PSIC dropdowns in one step"""
+    col1, col2 = st.columns([2, 3])
+    
+    with col1:
+        query = st.text_input(
+            "Search PSIC",
+            key="psic_search_query",
+            placeholder="Type an activity, e.g. bakery, or a code...",
+            help="Pick a match to fill the section, division and group at once"
+        )
+    
+    with col2:
+        matches = {}
+        if query.strip():
+            level_labels = {level: level.title() for level in PSIC_LEVELS}
+            level_labels['subclass'] = "Sub-class"
+            for match in search_psic(query):
+                label = f"{level_labels[match['level']]} {_psic_option(match['code'], match['description'])}"
+                matches[label] = match
+        
+        if matches:
+            st.selectbox(
+                "Matching Industries",
+                [""] + list(matches),
+                key="psic_search_choice",
+                on_change=_apply_psic_search,
+                args=(matches,)
+            )
+        elif query.strip():
+            st.caption("No matching industry found")
 
 def create_psic_widgets():
     """Create cascading PSIC dropdowns"""
@@ -99,6 +391,8 @@ def create_psic_widgets():
     if 'psic_group' not in st.session_state:
         st.session_state.psic_group = ""
     
+    create_psic_search()
+    
     # Create 3 columns for PSIC fields
     col1, col2, col3 = st.columns(3)
     
@@ -207,3 +501,7 @@ def create_psic_widgets():
         "division_desc": psic_data['divisions'].get(st.session_state.psic_division, {}).get('description', ""),
         "group_desc": psic_data['groups'].get(st.session_state.psic_group, {}).get('description', "")
     }
+
+if __name__ == "__main__":
+    hierarchy = build_psic_index()
+    print(f"PSIC index written to {PSIC_INDEX_FILE} ({len(hierarchy['groups'])} groups, {len(hierarchy['subclasses'])} sub-classes)")
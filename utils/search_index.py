@@ -0,0 +1,226 @@
+"""
+In-memory search index over a user's sheets for the dashboard smart search.
+Each cell is split into normalized word tokens; postings map a token to the
+(sheet, row) pairs that contain it and the columns it appears in. Words from
+name-like columns are also indexed by trigram for typo-tolerant matching.
+"""
+
+import re
+import math
+import bisect
+import unicodedata
+
+# Columns matched fuzzily: First/Last/Middle Name, Business Name, Email, Mobile Number, ...
+FUZZY_COLUMN_KEYWORDS = ("name", "email", "mobile")
+
+def search_tokens(text):
+    """Split text into lowercase, accent-free word tokens"""
+    text = unicodedata.normalize('NFKD', str(text))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def word_trigrams(word):
+    """Get the set of trigrams of a word, padded so short words still have some"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def is_fuzzy_column(column):
+    """Check if a column holds names, emails or phone numbers worth matching fuzzily"""
+    column = str(column).lower()
+    return any(keyword in column for keyword in FUZZY_COLUMN_KEYWORDS)
+
+class UserSearchIndex:
+    """Token inverted index over one user's sheets with (sheet, row, column) postings"""
+    
+    # Score weight of a query word that only matches the start of a cell word
+    PREFIX_MATCH_WEIGHT = 0.6
+    # Minimum trigram similarity (Jaccard) for a fuzzy word match; numbers such as
+    # mobile numbers share long prefixes, so they need to be much closer
+    FUZZY_THRESHOLD = 0.35
+    FUZZY_NUMBER_THRESHOLD = 0.6
+    
+    def __init__(self):
+        self.version = None     # storage data version the index reflects
+        self.columns = {}       # sheet -> column names
+        self.fuzzy_columns = {} # sheet -> indices of name-like columns
+        self.row_tokens = {}    # sheet -> per-row (tokens, name-column tokens), used to unindex a sheet
+        self.postings = {}      # token -> {(sheet, row): set of column indices}
+        self.fuzzy_counts = {}  # token -> number of rows with the token in a name-like column
+        self.trigrams = {}      # trigram -> set of name-column tokens containing it
+        self._vocabulary = None
+    
+    @property
+    def row_count(self):
+        return sum(len(rows) for rows in self.row_tokens.values())
+    
+    @property
+    def vocabulary(self):
+        """Sorted tokens, rebuilt lazily after the index changes"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self.postings)
+        return self._vocabulary
+    
+    def _index_row(self, sheet_name, row_index, row):
+        tokens = set()
+        fuzzy_tokens = set()
+        fuzzy_columns = self.fuzzy_columns[sheet_name]
+        for col_index, value in enumerate(row):
+            if value is None:
+                continue
+            for token in search_tokens(value):
+                self.postings.setdefault(token, {}).setdefault((sheet_name, row_index), set()).add(col_index)
+                tokens.add(token)
+                if col_index in fuzzy_columns:
+                    fuzzy_tokens.add(token)
+        
+        for token in fuzzy_tokens:
+            if token not in self.fuzzy_counts:
+                self.fuzzy_counts[token] = 0
+                for trigram in word_trigrams(token):
+                    self.trigrams.setdefault(trigram, set()).add(token)
+            self.fuzzy_counts[token] += 1
+        self.row_tokens[sheet_name].append((tokens, fuzzy_tokens))
+    
+    def remove_sheet(self, sheet_name):
+        """Drop a sheet from the index"""
+        for row_index, (tokens, fuzzy_tokens) in enumerate(self.row_tokens.pop(sheet_name, [])):
+            for token in tokens:
+                rows = self.postings[token]
+                del rows[(sheet_name, row_index)]
+                if not rows:
+                    del self.postings[token]
+            for token in fuzzy_tokens:
+                self.fuzzy_counts[token] -= 1
+                if not self.fuzzy_counts[token]:
+                    del self.fuzzy_counts[token]
+                    for trigram in word_trigrams(token):
+                        self.trigrams[trigram].discard(token)
+                        if not self.trigrams[trigram]:
+                            del self.trigrams[trigram]
+        self.columns.pop(sheet_name, None)
+        self.fuzzy_columns.pop(sheet_name, None)
+        self._vocabulary = None
+    
+    def _set_columns(self, sheet_name, columns):
+        self.columns[sheet_name] = list(columns)
+        self.fuzzy_columns[sheet_name] = {col_index for col_index, column in enumerate(columns) if is_fuzzy_column(column)}
+    
+    def index_sheet(self, sheet_name, data, columns):
+        """Index (or re-index) a whole sheet"""
+        self.remove_sheet(sheet_name)
+        self._set_columns(sheet_name, columns)
+        self.row_tokens[sheet_name] = []
+        for row_index, row in enumerate(data):
+            self._index_row(sheet_name, row_index, row)
+    
+    def add_rows(self, sheet_name, rows, columns):
+        """Index rows appended to the end of a sheet"""
+        self._set_columns(sheet_name, columns)
+        self.row_tokens.setdefault(sheet_name, [])
+        for row in rows:
+            self._index_row(sheet_name, len(self.row_tokens[sheet_name]), row)
+        self._vocabulary = None
+    
+    def _prefix_tokens(self, prefix):
+        """Get vocabulary tokens starting with a prefix"""
+        vocabulary = self.vocabulary
+        start = bisect.bisect_left(vocabulary, prefix)
+        tokens = []
+        for token in vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            tokens.append(token)
+        return tokens
+    
+    def search(self, query, sheets=None, limit=None):
+        """
+        Search the index and return ranked (sheet, row, score, column indices) hits.
+        Every query word must match a cell word or its prefix somewhere in the row;
+        rarer words and whole-word matches score higher.
+        """
+        tokens = search_tokens(query)
+        if not tokens:
+            return []
+        
+        total_rows = self.row_count
+        scores = {}
+        matched_columns = {}
+        for position, token in enumerate(dict.fromkeys(tokens)):
+            token_scores = {}
+            for match in self._prefix_tokens(token):
+                rows = self.postings[match]
+                weight = math.log(1 + total_rows / len(rows)) * (1.0 if match == token else self.PREFIX_MATCH_WEIGHT)
+                for key, col_indices in rows.items():
+                    if sheets is not None and key[0] not in sheets:
+                        continue
+                    if weight > token_scores.get(key, 0):
+                        token_scores[key] = weight
+                    if position == 0 or key in scores:
+                        matched_columns.setdefault(key, set()).update(col_indices)
+            if position == 0:
+                scores = token_scores
+            else:
+                scores = {key: score + token_scores[key] for key, score in scores.items() if key in token_scores}
+            if not scores:
+                return []
+        
+        ranked = sorted(scores, key=lambda key: (-scores[key], -len(matched_columns[key]), key))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [(sheet, row, scores[(sheet, row)], sorted(matched_columns[(sheet, row)])) for sheet, row in ranked]
+    
+    def similar_tokens(self, word):
+        """Get {name-column token: trigram similarity} for tokens close to a word"""
+        word_grams = word_trigrams(word)
+        shared = {}
+        for trigram in word_grams:
+            for token in self.trigrams.get(trigram, ()):
+                shared[token] = shared.get(token, 0) + 1
+        
+        threshold = self.FUZZY_NUMBER_THRESHOLD if word.isdigit() else self.FUZZY_THRESHOLD
+        similar = {}
+        for token, count in shared.items():
+            similarity = count / (len(word_grams) + len(token) + 1 - count)
+            if similarity >= threshold:
+                similar[token] = similarity
+        return similar
+    
+    def fuzzy_search(self, query, sheets=None, limit=None):
+        """
+        Search name-like columns allowing for typos and missing accents, and return
+        ranked (sheet, row, score, column indices) hits. Every query word must be
+        similar to a word in one of the row's name-like columns.
+        """
+        tokens = [token for token in dict.fromkeys(search_tokens(query)) if len(token) >= 3]
+        if not tokens:
+            return []
+        
+        total_rows = self.row_count
+        scores = {}
+        matched_columns = {}
+        for position, token in enumerate(tokens):
+            token_scores = {}
+            for match, similarity in self.similar_tokens(token).items():
+                rows = self.postings[match]
+                weight = math.log(1 + total_rows / len(rows)) * similarity
+                for key, col_indices in rows.items():
+                    if sheets is not None and key[0] not in sheets:
+                        continue
+                    col_indices = col_indices & self.fuzzy_columns[key[0]]
+                    if not col_indices:
+                        continue
+                    if weight > token_scores.get(key, 0):
+                        token_scores[key] = weight
+                    if position == 0 or key in scores:
+                        matched_columns.setdefault(key, set()).update(col_indices)
+            if position == 0:
+                scores = token_scores
+            else:
+                scores = {key: score + token_scores[key] for key, score in scores.items() if key in token_scores}
+            if not scores:
+                return []
+        
+        ranked = sorted(scores, key=lambda key: (-scores[key], -len(matched_columns[key]), key))
+        if limit is not None:
+            ranked = ranked[:limit]
+        return [(sheet, row, scores[(sheet, row)], sorted(matched_columns[(sheet, row)])) for sheet, row in ranked]
@@ -2,16 +2,278 @@ import streamlit as st
 import json
 import os
 import time
-import hashlib
+import atexit
+import bisect
+import sqlite3
+import threading
 import uuid
-from datetime import datetime, timedelta
+from datetime import datetime
+from utils.file_storage import atomic_write_json, file_lock, read_json
+
+# Session storage: "file" (one JSON file per browser in data/sessions) or "sqlite"
+SESSION_STORE = os.getenv("CPMS_SESSION_STORE", "file")
+SESSION_DB_FILE = "sessions.db"
+
+# Sessions expire after 24 hours without activity
+SESSION_TTL = 86400
+# Activity timestamps of cached sessions are written back at most this often;
+# any other change to a session is written immediately
+PERSIST_INTERVAL = int(os.getenv("CPMS_SESSION_PERSIST_INTERVAL", "60"))
+ACTIVITY_KEYS = ("timestamp", "last_accessed")
+# Expired sessions are removed by a background janitor this often (seconds)
+CLEANUP_INTERVAL = int(os.getenv("CPMS_SESSION_CLEANUP_INTERVAL", "300"))
+
+def session_summary(session_data):
+    """The fields of a session the active-user registry needs"""
+    return {
+        'timestamp': session_data.get('timestamp', 0),
+        'username': session_data.get('username'),
+        'authenticated': bool(session_data.get('authenticated')),
+        'browser_id': session_data.get('browser_id'),
+        'created_at': session_data.get('created_at')
+    }
+
+class FileSessionStore:
+    """
+    Stores each browser session as data/sessions/session_<browser id>.json.
+    A compact index.json next to them holds every session's summary, so listing
+    sessions by last activity reads one file instead of every session file.
+    """
+    
+    INDEX_FILE = "index.json"
+    
+    def __init__(self, sessions_dir):
+        self.sessions_dir = sessions_dir
+        self.index_path = os.path.join(sessions_dir, self.INDEX_FILE)
+        # Index file contents ordered by last activity, reloaded when the file changes
+        self._index_lock = threading.Lock()
+        self._index_stat = None
+        self._summaries = {}
+        self._by_time = []  # sorted (timestamp, browser id)
+    
+    def session_path(self, browser_id):
+        return os.path.join(self.sessions_dir, f"session_{browser_id}.json")
+    
+    def load(self, browser_id):
+        """Load a session, or None if it does not exist or is unreadable"""
+        try:
+            return read_json(self.session_path(browser_id), None)
+        except ValueError:
+            return None
+    
+    def save(self, browser_id, session_data):
+        atomic_write_json(self.session_path(browser_id), session_data, indent=2)
+        self._update_index(lambda index: index.__setitem__(browser_id, session_summary(session_data)))
+    
+    def delete(self, browser_id):
+        self.delete_sessions([browser_id])
+    
+    def delete_sessions(self, browser_ids):
+        """Delete several sessions with a single index update"""
+        for browser_id in browser_ids:
+            session_file = self.session_path(browser_id)
+            if os.path.exists(session_file):
+                os.remove(session_file)
+        
+        def remove(index):
+            for browser_id in browser_ids:
+                index.pop(browser_id, None)
+        self._update_index(remove)
+    
+    def iter_sessions(self):
+        """Yield (browser id, session data) for every stored session; data is None if unreadable"""
+        for filename in os.listdir(self.sessions_dir):
+            if filename.startswith('session_') and filename.endswith('.json'):
+                browser_id = filename[len('session_'):-len('.json')]
+                try:
+                    with open(os.path.join(self.sessions_dir, filename), 'r') as f:
+                        yield browser_id, json.load(f)
+                except FileNotFoundError:
+                    continue
+                except Exception:
+                    yield browser_id, None
+    
+    def _scan_summaries(self):
+        """Build the index from the session files, removing unreadable ones"""
+        summaries = {}
+        for browser_id, session_data in self.iter_sessions():
+            if session_data is None:
+                try:
+                    os.remove(self.session_path(browser_id))
+                except OSError:
+                    pass
+            else:
+                summaries[browser_id] = session_summary(session_data)
+        return summaries
+    
+    def _update_index(self, update):
+        """Read-modify-write the index file, building it from the session files if it is missing or damaged"""
+        with file_lock(self.index_path):
+            try:
+                index = read_json(self.index_path, None)
+            except ValueError:
+                index = None
+            if index is None:
+                index = self._scan_summaries()
+            update(index)
+            atomic_write_json(self.index_path, index, separators=(',', ':'))
+    
+    def _ordered_index(self):
+        """Get (summaries, sorted (timestamp, browser id)), reloading the index file if it changed"""
+        with self._index_lock:
+            if not os.path.exists(self.index_path):
+                # Sessions written before the index existed
+                self._update_index(lambda index: None)
+            stat = os.stat(self.index_path)
+            stat_key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if stat_key != self._index_stat:
+                self._summaries = read_json(self.index_path, {})
+                self._by_time = sorted((summary['timestamp'], browser_id) for browser_id, summary in self._summaries.items())
+                self._index_stat = stat_key
+            return self._summaries, self._by_time
+    
+    def recent_sessions(self, since):
+        """Get [(browser id, session summary)] of sessions active since a time, most recent first"""
+        summaries, by_time = self._ordered_index()
+        start = bisect.bisect_left(by_time, (since,))
+        return [(browser_id, summaries[browser_id]) for _, browser_id in reversed(by_time[start:])]
+    
+    def count_sessions(self, since):
+        """Count sessions active since a time"""
+        _, by_time = self._ordered_index()
+        return len(by_time) - bisect.bisect_left(by_time, (since,))
+    
+    def expired_sessions(self, before):
+        """Get the browser ids of sessions last active before a time"""
+        _, by_time = self._ordered_index()
+        return [browser_id for _, browser_id in by_time[:bisect.bisect_left(by_time, (before,))]]
+
+class SQLiteSessionStore:
+    """Stores browser sessions in one SQLite table indexed by last activity"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS sessions (
+            browser_id TEXT PRIMARY KEY,
+            timestamp REAL NOT NULL,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS sessions_by_timestamp ON sessions (timestamp);
+    """
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        self.connect().executescript(self.SCHEMA)
+    
+    def connect(self):
+        """Get this thread's database connection"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+    
+    def load(self, browser_id):
+        """Load a session, or None if it does not exist or is unreadable"""
+        row = self.connect().execute("SELECT data FROM sessions WHERE browser_id = ?", (browser_id,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            return None
+    
+    def save(self, browser_id, session_data):
+        self.connect().execute(
+            "INSERT OR REPLACE INTO sessions (browser_id, timestamp, data) VALUES (?, ?, ?)",
+            (browser_id, session_data.get('timestamp', 0), json.dumps(session_data, default=str))
+        )
+    
+    def delete(self, browser_id):
+        self.connect().execute("DELETE FROM sessions WHERE browser_id = ?", (browser_id,))
+    
+    def delete_sessions(self, browser_ids):
+        """Delete several sessions in one transaction"""
+        connection = self.connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany("DELETE FROM sessions WHERE browser_id = ?", [(browser_id,) for browser_id in browser_ids])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+    
+    def iter_sessions(self):
+        """Yield (browser id, session data) for every stored session; data is None if unreadable"""
+        for browser_id, data in self.connect().execute("SELECT browser_id, data FROM sessions").fetchall():
+            try:
+                yield browser_id, json.loads(data)
+            except ValueError:
+                yield browser_id, None
+    
+    def recent_sessions(self, since):
+        """Get [(browser id, session summary)] of sessions active since a time, most recent first"""
+        rows = self.connect().execute(
+            "SELECT browser_id, data FROM sessions WHERE timestamp >= ? ORDER BY timestamp DESC", (since,)
+        ).fetchall()
+        sessions = []
+        for browser_id, data in rows:
+            try:
+                sessions.append((browser_id, session_summary(json.loads(data))))
+            except ValueError:
+                continue
+        return sessions
+    
+    def count_sessions(self, since):
+        """Count sessions active since a time"""
+        return self.connect().execute("SELECT COUNT(*) FROM sessions WHERE timestamp >= ?", (since,)).fetchone()[0]
+    
+    def expired_sessions(self, before):
+        """Get the browser ids of sessions last active before a time"""
+        rows = self.connect().execute("SELECT browser_id FROM sessions WHERE timestamp < ?", (before,)).fetchall()
+        return [browser_id for browser_id, in rows]
+
+def create_session_store(store_name, sessions_dir):
+    """Create the session store configured by name"""
+    if store_name == "sqlite":
+        return SQLiteSessionStore(os.path.join(os.path.dirname(sessions_dir), SESSION_DB_FILE))
+    if store_name == "file":
+        return FileSessionStore(sessions_dir)
+    raise ValueError(f"Unknown session store: {store_name}")
+
+def _session_content(session_data):
+    """Session data without the activity keys refreshed on every access"""
+    return {key: value for key, value in session_data.items() if key not in ACTIVITY_KEYS}
 
 class SecureSessionManager:
-    """Secure session manager with per-browser isolation"""
+    """
+    Secure session manager with per-browser isolation.
+    Sessions are served from a process-level cache; activity timestamps are written
+    to the session store at most once per PERSIST_INTERVAL (and when the process
+    exits), so a rerun of an authenticated page does not write to disk.
+    """
     
-    def __init__(self):
+    def __init__(self, store=None):
         self.sessions_dir = "data/sessions"
         self.ensure_sessions_dir()
+        self.store = store or create_session_store(SESSION_STORE, self.sessions_dir)
+        # Browser id -> [session data, time last persisted, has unpersisted activity]
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._janitor = None
+        self._janitor_lock = threading.Lock()
+        self.janitor_metrics = {
+            'runs': 0,
+            'sessions_expired': 0,
+            'last_run_at': None,
+            'last_expired': 0,
+            'last_duration_ms': 0.0,
+            'total_duration_ms': 0.0,
+            'errors': 0
+        }
+        atexit.register(self.flush)
     
     def ensure_sessions_dir(self):
         """Ensure sessions directory exists"""
@@ -31,29 +293,17 @@ class SecureSessionManager:
         
         # Fallback: use consistent UUID stored in session state
         if 'browser_id' not in st.session_state:
-            # Try to find an existing session for this browser by checking all session files
+            # Try to find an existing session for this browser by checking all sessions
             # This is a fallback for when session_state gets cleared
             current_time = time.time()
             most_recent_session = None
-            most_recent_time = 0
             
             try:
-                for filename in os.listdir(self.sessions_dir):
-                    if filename.startswith('session_') and filename.endswith('.json'):
-                        filepath = os.path.join(self.sessions_dir, filename)
-                        try:
-                            with open(filepath, 'r') as f:
-                                session_data = json.load(f)
-                            
-                            # Check if session is recent (within last hour) and authenticated
-                            session_time = session_data.get('timestamp', 0)
-                            if (current_time - session_time < 3600 and 
-                                session_data.get('authenticated') and
-                                session_time > most_recent_time):
-                                most_recent_session = filename.replace('session_', '').replace('.json', '')
-                                most_recent_time = session_time
-                        except:
-                            continue
+                # Most recent authenticated session within the last hour
+                for browser_id, summary in self.recent_sessions(current_time - 3600):
+                    if summary['authenticated']:
+                        most_recent_session = browser_id
+                        break
             except:
                 pass
             
@@ -71,16 +321,35 @@ class SecureSessionManager:
         browser_id = self.get_browser_id()
         return os.path.join(self.sessions_dir, f"session_{browser_id}.json")
     
+    def _update_cache(self, browser_id, session_data, persisted=False):
+        """
+        Store a session in the cache and write it through to the session store if
+        anything but its activity changed, or its last write is PERSIST_INTERVAL old.
+        """
+        now = time.time()
+        with self._cache_lock:
+            entry = self._cache.get(browser_id)
+            if entry is None:
+                # A session just read from the store is already persisted
+                entry = self._cache[browser_id] = [None, now if persisted else 0, False]
+            changed = entry[0] is None or _session_content(entry[0]) != _session_content(session_data)
+            entry[0] = dict(session_data)
+            if (changed and not persisted) or now - entry[1] >= PERSIST_INTERVAL:
+                self.store.save(browser_id, entry[0])
+                entry[1] = now
+                entry[2] = False
+            else:
+                entry[2] = True
+    
     def save_session(self, session_data):
         """Save session data for current browser"""
         try:
-            session_file = self.get_session_file_path()
+            browser_id = self.get_browser_id()
             session_data['timestamp'] = time.time()
-            session_data['browser_id'] = self.get_browser_id()
-            session_data['created_at'] = datetime.now().isoformat()
+            session_data['browser_id'] = browser_id
+            session_data.setdefault('created_at', datetime.now().isoformat())
             
-            with open(session_file, 'w') as f:
-                json.dump(session_data, f, indent=2)
+            self._update_cache(browser_id, session_data)
             return True
         except Exception as e:
             return False
@@ -88,16 +357,18 @@ class SecureSessionManager:
     def load_session(self):
         """Load session data for current browser"""
         try:
-            session_file = self.get_session_file_path()
-            if not os.path.exists(session_file):
-                return None
-            
-            with open(session_file, 'r') as f:
-                session_data = json.load(f)
+            browser_id = self.get_browser_id()
+            with self._cache_lock:
+                entry = self._cache.get(browser_id)
+                session_data = dict(entry[0]) if entry else None
+            if session_data is None:
+                session_data = self.store.load(browser_id)
+                if session_data is None:
+                    return None
             
             # Check if session is expired (24 hours)
             current_time = time.time()
-            if current_time - session_data.get('timestamp', 0) > 86400:
+            if current_time - session_data.get('timestamp', 0) > SESSION_TTL:
                 self.clear_session()
                 return None
             
@@ -105,65 +376,111 @@ class SecureSessionManager:
             session_data['timestamp'] = current_time
             session_data['last_accessed'] = datetime.now().isoformat()
             
-            with open(session_file, 'w') as f:
-                json.dump(session_data, f, indent=2)
-            
+            self._update_cache(browser_id, session_data, persisted=entry is None)
             return session_data
-            
+        
         except Exception as e:
             return None
     
     def clear_session(self):
         """Clear session for current browser"""
         try:
-            session_file = self.get_session_file_path()
-            if os.path.exists(session_file):
-                os.remove(session_file)
+            browser_id = self.get_browser_id()
+            with self._cache_lock:
+                self._cache.pop(browser_id, None)
+            self.store.delete(browser_id)
             return True
         except:
             return False
     
+    def flush(self):
+        """Write unpersisted session activity to the session store"""
+        with self._cache_lock:
+            for browser_id, entry in list(self._cache.items()):
+                if entry[2]:
+                    try:
+                        # Do not bring back a session that was logged out or expired elsewhere
+                        if self.store.load(browser_id) is None:
+                            del self._cache[browser_id]
+                            continue
+                        self.store.save(browser_id, entry[0])
+                        entry[1] = time.time()
+                        entry[2] = False
+                    except Exception:
+                        pass
+    
+    def _cached_summaries(self, since):
+        """Summaries of cached sessions active since a time, which may be newer than the store's"""
+        with self._cache_lock:
+            return {
+                browser_id: session_summary(entry[0])
+                for browser_id, entry in self._cache.items()
+                if entry[0].get('timestamp', 0) >= since
+            }
+    
+    def recent_sessions(self, since):
+        """Get [(browser id, session summary)] of sessions active since a time, most recent first"""
+        sessions = dict(self.store.recent_sessions(since))
+        sessions.update(self._cached_summaries(since))
+        return sorted(sessions.items(), key=lambda item: item[1]['timestamp'], reverse=True)
+    
     def cleanup_expired_sessions(self):
-        """Clean up expired session files"""
+        """Clean up expired sessions and return how many were removed"""
+        started = time.perf_counter()
+        expired = []
         try:
             current_time = time.time()
-            for filename in os.listdir(self.sessions_dir):
-                if filename.startswith('session_') and filename.endswith('.json'):
-                    filepath = os.path.join(self.sessions_dir, filename)
-                    try:
-                        with open(filepath, 'r') as f:
-                            session_data = json.load(f)
-                        
-                        # Remove sessions older than 24 hours
-                        if current_time - session_data.get('timestamp', 0) > 86400:
-                            os.remove(filepath)
-                    except:
-                        # Remove corrupted session files
-                        try:
-                            os.remove(filepath)
-                        except:
-                            pass
+            cutoff = current_time - SESSION_TTL
+            with self._cache_lock:
+                for browser_id in [browser_id for browser_id, entry in self._cache.items()
+                                   if entry[0].get('timestamp', 0) < cutoff]:
+                    del self._cache[browser_id]
+                cached = set(self._cache)
+            
+            # Remove sessions older than 24 hours
+            expired = [browser_id for browser_id in self.store.expired_sessions(cutoff) if browser_id not in cached]
+            if expired:
+                self.store.delete_sessions(expired)
         except:
-            pass
+            self.janitor_metrics['errors'] += 1
+            expired = []
+        
+        duration_ms = (time.perf_counter() - started) * 1000
+        metrics = self.janitor_metrics
+        metrics['runs'] += 1
+        metrics['sessions_expired'] += len(expired)
+        metrics['last_run_at'] = time.time()
+        metrics['last_expired'] = len(expired)
+        metrics['last_duration_ms'] = round(duration_ms, 2)
+        metrics['total_duration_ms'] = round(metrics['total_duration_ms'] + duration_ms, 2)
+        return len(expired)
+    
+    def _run_janitor(self):
+        while True:
+            self.cleanup_expired_sessions()
+            time.sleep(CLEANUP_INTERVAL)
+    
+    def start_janitor(self):
+        """
+        Start the background thread that removes expired sessions every
+        CLEANUP_INTERVAL seconds. Only one janitor runs per process, so this is
+        safe to call on every page load.
+        """
+        if self._janitor is not None:
+            return
+        with self._janitor_lock:
+            if self._janitor is None:
+                self._janitor = threading.Thread(target=self._run_janitor, name="session-janitor", daemon=True)
+                self._janitor.start()
     
     def get_active_sessions_count(self):
         """Get count of active sessions"""
         try:
-            count = 0
-            current_time = time.time()
-            for filename in os.listdir(self.sessions_dir):
-                if filename.startswith('session_') and filename.endswith('.json'):
-                    filepath = os.path.join(self.sessions_dir, filename)
-                    try:
-                        with open(filepath, 'r') as f:
-                            session_data = json.load(f)
-                        
-                        # Count non-expired sessions
-                        if current_time - session_data.get('timestamp', 0) <= 86400:
-                            count += 1
-                    except:
-                        pass
-            return count
+            since = time.time() - SESSION_TTL
+            # Cached sessions only add to the count if the store has not seen them as active
+            stored = {browser_id for browser_id, _ in self.store.recent_sessions(since)} if self._cache else set()
+            extra = sum(1 for browser_id in self._cached_summaries(since) if browser_id not in stored)
+            return self.store.count_sessions(since) + extra
         except:
             return 0
 
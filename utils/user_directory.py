@@ -0,0 +1,182 @@
+"""
+Shared directory of CPMS user accounts.
+data/users.json is parsed once per process and kept in memory together with
+lookup indexes by username, role and email. The file is only read again when its
+mtime or size changes, e.g. after another worker process saved it. Changes go
+through locked_users/update_user, which re-read and rewrite the file under its
+lock so concurrent updates from other sessions or workers are never lost.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from utils.admin_config import get_default_admin_user, create_admin_if_not_exists
+from utils.credentials import rehash_in_background
+from utils.file_storage import atomic_write_json, file_lock, read_json
+
+USERS_FILE = os.path.join("data", "users.json")
+
+class UserDirectory:
+    """In-memory view of users.json with username, role and email indexes"""
+    
+    def __init__(self, users_file=USERS_FILE):
+        self.users_file = users_file
+        self._lock = threading.RLock()
+        self._stat = None
+        self._users = {}
+        self._by_role = {}      # role -> sorted usernames
+        self._by_email = {}     # lowercase email -> username
+        self._by_lower = {}     # lowercase username -> username
+    
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.users_file)
+            return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+    
+    def _set_users(self, users):
+        self._users = users
+        self._by_role = {}
+        self._by_email = {}
+        self._by_lower = {}
+        for username in sorted(users):
+            user_data = users[username]
+            self._by_role.setdefault(user_data.get("role"), []).append(username)
+            email = str(user_data.get("email") or "").strip().lower()
+            if email:
+                self._by_email.setdefault(email, username)
+            self._by_lower.setdefault(username.lower(), username)
+    
+    def _refresh(self):
+        """Reload users.json if it changed since it was last read"""
+        stat = self._file_stat()
+        if stat is not None and stat == self._stat:
+            return
+        
+        # Creating the file or the default admin writes it back, so read under the lock
+        with file_lock(self.users_file):
+            self._reload()
+    
+    def _reload(self):
+        stat = self._file_stat()
+        if stat is None:
+            # Initialize with admin user
+            self._write(get_default_admin_user())
+            return
+        
+        try:
+            users = read_json(self.users_file, {})
+        except Exception as e:
+            print(f"Error loading users: {e}")
+            if not self._users:
+                self._set_users(get_default_admin_user())
+            return
+        
+        # Ensure admin user exists
+        created, message = create_admin_if_not_exists(users)
+        if created:
+            print(f"Admin check: {message}")
+            self._write(users)
+            return
+        self._set_users(users)
+        self._stat = stat
+    
+    def _write(self, users):
+        data_dir = os.path.dirname(self.users_file)
+        if data_dir and not os.path.exists(data_dir):
+            os.makedirs(data_dir)
+        atomic_write_json(self.users_file, users, indent=2)
+        self._set_users({username: dict(user_data) for username, user_data in users.items()})
+        self._stat = self._file_stat()
+    
+    def load_users(self):
+        """Get all users as {username: user data}; a copy the caller may change and save"""
+        with self._lock:
+            self._refresh()
+            return {username: dict(user_data) for username, user_data in self._users.items()}
+    
+    def save_users(self, users):
+        """Replace all users in users.json; prefer locked_users for changes"""
+        with self._lock, file_lock(self.users_file):
+            self._write(users)
+    
+    @contextmanager
+    def locked_users(self):
+        """
+        Read-modify-write all users while holding the users.json lock:
+            
+            with user_directory.locked_users() as users:
+                users[username] = user_data
+        
+        The file is read again first, so changes saved by other sessions and workers
+        are kept, and is rewritten when the block exits without an exception.
+        """
+        with self._lock, file_lock(self.users_file):
+            self._stat = None
+            self._refresh()
+            users = {username: dict(user_data) for username, user_data in self._users.items()}
+            yield users
+            self._write(users)
+    
+    def update_user(self, username, update):
+        """Apply update(user data) to one user under the users.json lock; False if there is no such user"""
+        with self.locked_users() as users:
+            user_data = users.get(username)
+            if user_data is not None:
+                update(user_data)
+        return user_data is not None
+    
+    def upgrade_password_hash(self, username, password, stored_hash):
+        """After a successful login, rehash a legacy or outdated password hash in the background"""
+        def save_hash(new_hash):
+            def update(user_data):
+                # Keep a password changed in the meantime
+                if user_data.get("password") == stored_hash:
+                    user_data["password"] = new_hash
+            self.update_user(username, update)
+        return rehash_in_background(password, stored_hash, save_hash)
+    
+    def get_user(self, username):
+        """Get one user's data, or None"""
+        with self._lock:
+            self._refresh()
+            user_data = self._users.get(username)
+            return dict(user_data) if user_data is not None else None
+    
+    def find_username(self, username):
+        """Get the stored spelling of a username compared case-insensitively, or None"""
+        with self._lock:
+            self._refresh()
+            return self._by_lower.get(str(username).strip().lower())
+    
+    def find_by_email(self, email):
+        """Get the username registered with an email address, or None"""
+        with self._lock:
+            self._refresh()
+            return self._by_email.get(str(email).strip().lower())
+    
+    def users_by_role(self, role):
+        """Get {username: user data} of the users with a role"""
+        with self._lock:
+            self._refresh()
+            return {username: dict(self._users[username]) for username in self._by_role.get(role, [])}
+    
+    def count_by_role(self, role):
+        """Count the users with a role"""
+        with self._lock:
+            self._refresh()
+            return len(self._by_role.get(role, []))
+    
+    def count_users(self):
+        """Count all users"""
+        with self._lock:
+            self._refresh()
+            return len(self._users)
+
+# Global user directory instance
+user_directory = UserDirectory()
+
+def load_users():
+    """Load users from the shared user directory"""
+    return user_directory.load_users()